@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Specify CLI 启动与端到端延迟基准测试
+
+在进程内通过 typer 的 CliRunner 运行 init、check 和 version，GitHub releases API 与资源下载
+由 standin.GitHubStandIn(httpx.MockTransport)模拟，可配置延迟和带宽。冷启动导入耗时在
+独立子进程中测量。结果以 JSON 输出，便于在不同版本之间比较。
+
+报告的指标:
+    import_ms      冷启动导入 specify_cli 的耗时
+    wall_ms        命令的总耗时
+    ttfb_ms        从命令开始到模板归档第一个字节发出的耗时(仅 init)
+    extract_ms     解压模板的耗时(仅 init，不含下载)
+    extract_mb_s   按解压后字节数计算的解压吞吐量
+
+用法:
+    python i18n/zh/benchmarks/bench_cli.py
+    python i18n/zh/benchmarks/bench_cli.py --sizes small,large --latency-ms 50 --bandwidth-mbps 20 --runs 5 -o bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from typer.testing import CliRunner  # noqa: E402
+
+import specify_cli  # noqa: E402
+from import_time import measure_import  # noqa: E402
+from standin import TAG, TEMPLATE_SIZES, GitHubStandIn, build_template  # noqa: E402
+
+def _stats(values: list[float]) -> dict:
+    return {
+        "min": round(min(values), 3),
+        "median": round(statistics.median(values), 3),
+        "max": round(max(values), 3),
+    }
+
+class _ExtractTimer:
+    """包装 specify_cli.extract_template_archive，累计解压耗时。"""
+
+    def __init__(self):
+        self.original = specify_cli.extract_template_archive
+        self.elapsed = 0.0
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.original(*args, **kwargs)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+def _use_client(client) -> None:
+    """让 CLI 的所有网络请求都经过替身客户端。"""
+    specify_cli.get_http_client = lambda verify=True: client
+
+def _invoke(runner: CliRunner, args: list[str]) -> float:
+    """运行一次 CLI 命令，返回耗时(秒)；命令失败时抛出异常。"""
+    started = time.perf_counter()
+    result = runner.invoke(specify_cli.app, args)
+    elapsed = time.perf_counter() - started
+    if result.exit_code != 0:
+        raise RuntimeError(f"specify {' '.join(args)} 失败 (退出码 {result.exit_code}):\n{result.output[-2000:]}")
+    return elapsed
+
+def bench_init(size: str, *, runs: int, latency: float, bandwidth: float, warm_cache: bool) -> dict:
+    """在合成模板上多次运行 init，每次使用新的项目目录(和新的缓存目录，除非 warm_cache)。"""
+    data = build_template(size)
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        unpacked = sum(info.file_size for info in z.infolist())
+        file_count = sum(1 for info in z.infolist() if not info.is_dir())
+    standin = GitHubStandIn({f"spec-kit-template-claude-sh-zh-{TAG}.zip": data}, latency=latency, bandwidth=bandwidth)
+    _use_client(standin.client())
+    runner = CliRunner()
+    timer = _ExtractTimer()
+
+    wall, ttfb, extract = [], [], []
+    with tempfile.TemporaryDirectory(prefix="specify-bench-") as tmp:
+        os.environ["SPECIFY_CACHE_DIR"] = str(Path(tmp) / "cache")
+        args = ["init", "--ai", "claude", "--script", "sh", "--ignore-agent-tools", "--no-git", "--release-ttl", "0"]
+        if not warm_cache:
+            args.append("--no-cache")
+        else:
+            # 预热缓存，计时的运行只命中缓存
+            _invoke(runner, [*args, str(Path(tmp) / "warmup")])
+        specify_cli.extract_template_archive = timer
+        try:
+            for i in range(runs):
+                standin.reset()
+                timer.elapsed = 0.0
+                started = time.perf_counter()
+                wall.append(_invoke(runner, [*args, str(Path(tmp) / f"p{i}")]))
+                if standin.first_byte_at is not None:
+                    ttfb.append(standin.first_byte_at - started)
+                extract.append(timer.elapsed)
+        finally:
+            specify_cli.extract_template_archive = timer.original
+
+    result = {
+        "command": "init",
+        "template": size,
+        "cache": "warm" if warm_cache else "off",
+        "archive_bytes": len(data),
+        "unpacked_bytes": unpacked,
+        "files": file_count,
+        "runs": runs,
+        "wall_ms": _stats([t * 1000 for t in wall]),
+        "extract_ms": _stats([t * 1000 for t in extract]),
+        "extract_mb_s": round(unpacked / statistics.median(extract) / 1e6, 2) if extract and statistics.median(extract) else None,
+        "requests": dict(standin.requests),
+    }
+    if ttfb:
+        result["ttfb_ms"] = _stats([t * 1000 for t in ttfb])
+    return result
+
+def bench_command(command: str, *, runs: int, latency: float) -> dict:
+    """多次运行不需要模板的命令(check、version)。"""
+    standin = GitHubStandIn({}, latency=latency)
+    _use_client(standin.client())
+    runner = CliRunner()
+    wall = [_invoke(runner, [command]) for _ in range(runs)]
+    return {"command": command, "runs": runs, "wall_ms": _stats([t * 1000 for t in wall]), "requests": dict(standin.requests)}
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Specify CLI 基准测试")
+    parser.add_argument("--sizes", default=",".join(TEMPLATE_SIZES), help=f"模板规模，逗号分隔（可选: {', '.join(TEMPLATE_SIZES)}）")
+    parser.add_argument("--runs", type=int, default=3, help="每项测试的运行次数")
+    parser.add_argument("--import-runs", type=int, default=5, help="冷启动导入的测量次数")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个模拟请求的延迟(毫秒)")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="模拟下载带宽(Mbit/s)，0 表示不限速")
+    parser.add_argument("-o", "--output", help="将 JSON 结果写入文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in TEMPLATE_SIZES]
+    if unknown:
+        parser.error(f"未知的模板规模: {', '.join(unknown)}")
+    args.runs = max(1, args.runs)
+    latency = args.latency_ms / 1000
+    bandwidth = args.bandwidth_mbps * 1e6 / 8
+
+    os.environ["SPECIFY_RELEASE_TTL"] = "0"
+    imports = [measure_import()[0] for _ in range(max(1, args.import_runs))]
+    results = []
+    for size in sizes:
+        for warm_cache in (False, True):
+            results.append(bench_init(size, runs=args.runs, latency=latency, bandwidth=bandwidth, warm_cache=warm_cache))
+    for command in ("check", "version"):
+        results.append(bench_command(command, runs=args.runs, latency=latency))
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": f"{platform.system()}-{platform.machine()}",
+        "config": {"latency_ms": args.latency_ms, "bandwidth_mbps": args.bandwidth_mbps, "runs": args.runs},
+        "import_ms": _stats(imports),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
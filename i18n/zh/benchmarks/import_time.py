@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+specify_cli 导入耗时预算检查
+
+用 `python -X importtime` 在子进程中导入 specify_cli，取多次运行中 specify_cli 自身累计
+耗时的最小值与预算比较，并确认 httpx、truststore、readchar 等重型模块没有在导入时加载。
+超出预算或加载了禁止的模块时以非零状态退出。CI 中由 .github/workflows/import-time-zh.yml 运行。
+
+计时前先导入一次(不计入结果)以写入字节码缓存，测量的是已安装 CLI 的实际启动开销，
+而不是编译源码的耗时。
+
+用法:
+    python i18n/zh/benchmarks/import_time.py
+    python i18n/zh/benchmarks/import_time.py --budget-ms 120 --runs 7
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# 这些模块只应在访问网络或交互选择时导入
+LAZY_MODULES = (
+    "httpx",
+    "httpcore",
+    "truststore",
+    "readchar",
+    "platformdirs",
+    "rich.live",
+    "rich.progress",
+    "concurrent.futures",
+)
+
+DEFAULT_BUDGET_MS = 200.0
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+def measure_import(python: str = sys.executable) -> tuple[float, set[str]]:
+    """在新的解释器中导入 specify_cli 一次。
+
+    Returns:
+        元组 (specify_cli 的累计导入耗时毫秒数, 导入期间加载的模块名集合)
+    """
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR) + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    # 禁止写字节码时每次导入都会重新编译整个模块，耗时与实际启动无关
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", "import specify_cli"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    cumulative_us = None
+    modules = set()
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        modules.add(match.group(4))
+        if match.group(4) == "specify_cli" and not match.group(3).strip():
+            cumulative_us = int(match.group(2))
+    if cumulative_us is None:
+        raise RuntimeError("importtime 输出中未找到 specify_cli")
+    return cumulative_us / 1000, modules
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="检查 specify_cli 的导入耗时预算")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("SPECIFY_IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS)), help="允许的累计导入耗时(毫秒)")
+    parser.add_argument("--runs", type=int, default=5, help="运行次数，取最小值以降低噪声")
+    args = parser.parse_args(argv)
+
+    measure_import()  # 预热：写入字节码缓存
+    timings = []
+    loaded = set()
+    for _ in range(max(1, args.runs)):
+        elapsed_ms, modules = measure_import()
+        timings.append(elapsed_ms)
+        loaded |= modules
+
+    best = min(timings)
+    eager = sorted(name for name in LAZY_MODULES if name in loaded)
+    print(f"specify_cli 导入耗时: 最小 {best:.1f} ms，最大 {max(timings):.1f} ms（预算 {args.budget_ms:.0f} ms，{len(timings)} 次）")
+
+    failed = False
+    if eager:
+        print(f"错误: 以下模块应延迟导入，但在导入时被加载: {', '.join(eager)}")
+        failed = True
+    if best > args.budget_ms:
+        print(f"错误: 导入耗时超出预算 {best - args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
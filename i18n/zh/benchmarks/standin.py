@@ -0,0 +1,136 @@
+"""
+本地 GitHub 替身：合成模板归档，并通过 httpx.MockTransport 模拟 releases API 和资源下载。
+
+支持按请求注入固定延迟(模拟 RTT)以及按带宽分块限速的响应体，基准测试无需访问网络。
+"""
+
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+
+import httpx
+
+# 合成模板的规模：(命令文件数, 每个命令文件的字节数)
+TEMPLATE_SIZES = {
+    "small": (20, 2 * 1024),
+    "medium": (200, 8 * 1024),
+    "large": (800, 32 * 1024),
+}
+
+TAG = "v0.0.0-bench"
+
+def _text(rng: random.Random, size: int) -> str:
+    """生成大致可压缩的 Markdown 文本，压缩率与真实模板相近。"""
+    words = ["spec", "plan", "task", "规格", "计划", "任务", "implement", "constitution", "需求", "验收"]
+    lines = []
+    total = 0
+    while total < size:
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(4, 14)))
+        lines.append(line)
+        total += len(line.encode("utf-8")) + 1
+    return "\n".join(lines)[:size]
+
+def build_template(size: str, *, ai: str = "claude", script: str = "sh", seed: int = 0) -> bytes:
+    """构建与发布包结构一致的合成模板 zip。"""
+    count, file_size = TEMPLATE_SIZES[size]
+    rng = random.Random(seed)
+    top = f"sdd-{ai}-package-{script}"
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        def add(name: str, data: str, mode: int = 0o644) -> None:
+            info = zipfile.ZipInfo(f"{top}/{name}")
+            info.external_attr = (0o100000 | mode) << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            z.writestr(info, data)
+
+        for name in ("common", "create-new-feature", "setup-plan", "check-prerequisites", "update-agent-context"):
+            add(f".specify/scripts/bash/{name}.sh", "#!/usr/bin/env bash\n" + _text(rng, 4096), 0o755)
+        for name in ("spec", "plan", "tasks", "checklist", "agent-file"):
+            add(f".specify/templates/{name}-template.md", _text(rng, 8192))
+        add(".specify/memory/constitution.md", _text(rng, 4096))
+        add(".vscode/settings.json", json.dumps({"chat.promptFilesRecommendations": {"speckit.specify": True}}, indent=4))
+        for i in range(count):
+            add(f".claude/commands/speckit.bench{i:04d}.md", _text(rng, file_size))
+    return buf.getvalue()
+
+class _ShapedStream(httpx.SyncByteStream):
+    """按带宽分块输出响应体，并记录第一个字节发出的时间。"""
+
+    def __init__(self, data: bytes, bandwidth: float, on_first_byte):
+        self.data = data
+        self.bandwidth = bandwidth
+        self.on_first_byte = on_first_byte
+
+    def __iter__(self):
+        chunk = 64 * 1024
+        if self.bandwidth:
+            # 每 10ms 输出一块
+            chunk = max(1024, int(self.bandwidth / 100))
+        for start in range(0, len(self.data), chunk):
+            if start == 0:
+                self.on_first_byte()
+            elif self.bandwidth:
+                time.sleep(chunk / self.bandwidth)
+            yield self.data[start:start + chunk]
+
+class GitHubStandIn:
+    """模拟 api.github.com 的 releases 接口以及资源下载主机。
+
+    Args:
+        templates: {资源名: zip 字节}，全部挂在同一个版本 TAG 下
+        latency: 每个请求在返回响应头前等待的秒数
+        bandwidth: 资源下载的带宽(字节/秒)，0 表示不限速
+    """
+
+    def __init__(self, templates: dict, *, latency: float = 0.0, bandwidth: float = 0.0):
+        self.templates = templates
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """清空请求计数和首字节时间。"""
+        with self.lock:
+            self.requests = {"api": 0, "asset": 0}
+            self.first_byte_at = None
+
+    def _mark_first_byte(self) -> None:
+        with self.lock:
+            if self.first_byte_at is None:
+                self.first_byte_at = time.perf_counter()
+
+    def release_json(self) -> dict:
+        return {
+            "tag_name": TAG,
+            "published_at": "2026-01-01T00:00:00Z",
+            "assets": [
+                {"name": name, "size": len(data), "browser_download_url": f"https://bench.invalid/download/{name}"}
+                for name, data in self.templates.items()
+            ],
+        }
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        if request.url.host == "api.github.com":
+            with self.lock:
+                self.requests["api"] += 1
+            return httpx.Response(200, json=self.release_json())
+        with self.lock:
+            self.requests["asset"] += 1
+        name = request.url.path.rsplit("/", 1)[-1]
+        data = self.templates.get(name)
+        if data is None:
+            return httpx.Response(404)
+        headers = {"Content-Length": str(len(data))}
+        if request.method == "HEAD":
+            return httpx.Response(200, headers=headers)
+        return httpx.Response(200, headers=headers, stream=_ShapedStream(data, self.bandwidth, self._mark_first_byte))
+
+    def client(self) -> httpx.Client:
+        """返回使用该替身作为传输层的 httpx 客户端。"""
+        return httpx.Client(transport=httpx.MockTransport(self.handler))
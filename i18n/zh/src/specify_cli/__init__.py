@@ -24,6 +24,11 @@ Specify CLI - Specify 项目的设置工具
     specify init --here
 """
 
+from __future__ import annotations
+
+import contextlib
+import errno
+import io
 import os
 import subprocess
 import sys
@@ -31,30 +36,66 @@ import zipfile
 import tempfile
 import shutil
 import shlex
+import stat
 import json
+import hashlib
+import random
+import time
+import threading
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import IO, TYPE_CHECKING, NoReturn, Optional, Tuple
 
 import typer
-import httpx
 from rich.console import Console
 from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.text import Text
-from rich.live import Live
 from rich.align import Align
 from rich.table import Table
 from rich.tree import Tree
 from typer.core import TyperGroup
-
-# 跨平台键盘输入
-import readchar
-import ssl
-import truststore
 from datetime import datetime, timezone
 
-ssl_context = truststore.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-client = httpx.Client(verify=ssl_context)
+# httpx、truststore、readchar 以及 rich.live/rich.progress 只在需要它们的代码路径中导入，
+# 使 specify --help、specify check 等不访问网络的命令启动更快
+if TYPE_CHECKING:
+    import httpx
+
+_http_clients: dict = {}
+_http_clients_lock = threading.Lock()
+
+def _get_ssl_context():
+    """返回使用系统信任库的 SSL 上下文(首次调用时创建)。"""
+    with _http_clients_lock:
+        if "ssl_context" not in _http_clients:
+            import ssl
+            import truststore
+            _http_clients["ssl_context"] = truststore.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        return _http_clients["ssl_context"]
+
+def get_http_client(verify: bool = True) -> httpx.Client:
+    """返回进程内共享的 httpx 客户端(带连接池，首次调用时创建)。
+
+    Args:
+        verify: 是否校验 TLS 证书；为 False 时返回单独的不校验证书的客户端
+
+    Returns:
+        httpx.Client 实例
+    """
+    context = _get_ssl_context() if verify else False
+    key = "verified" if verify else "unverified"
+    with _http_clients_lock:
+        if key not in _http_clients:
+            import httpx
+            _http_clients[key] = httpx.Client(verify=context)
+        return _http_clients[key]
+
+def __getattr__(name: str):
+    # 兼容旧的模块级属性 ssl_context / client，访问时才创建
+    if name == "ssl_context":
+        return _get_ssl_context()
+    if name == "client":
+        return get_http_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def _github_token(cli_token: str | None = None) -> str | None:
     """返回已清理的 GitHub token(命令行参数优先)或 None。"""
@@ -122,6 +163,196 @@ def _format_rate_limit_error(status_code: int, headers: httpx.Headers, url: str)
     
     return "\n".join(lines)
 
+RETRY_DEADLINE = 120.0
+RETRY_MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+VERSION_RETRY_DEADLINE = 5.0  # version 只是顺带查询最新模板版本，离线时应尽快放弃
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+class RateLimitExhausted(RuntimeError):
+    """持久化的速率限制预算已耗尽，且重置时间超出剩余的截止时间。"""
+
+class CommandFailed(typer.Exit):
+    """已向用户报告过的失败：像 typer.Exit 一样结束命令，并携带纯文本的失败原因。
+
+    str() 返回失败原因，供 --json 的 result 事件和步骤详情使用(普通 typer.Exit 只有退出码)。
+    """
+
+    def __init__(self, message: str, code: int = 1):
+        super().__init__(code)
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
+
+def _retry_deadline_from_env() -> float:
+    """读取 SPECIFY_RETRY_DEADLINE(秒)，无效时回退到默认值。"""
+    try:
+        return float(os.getenv("SPECIFY_RETRY_DEADLINE", RETRY_DEADLINE))
+    except ValueError:
+        return RETRY_DEADLINE
+
+class RequestScheduler:
+    """所有 GitHub 请求(API 与资源下载)共用的重试调度器。
+
+    瞬时错误(连接错误、408/425/5xx)按带抖动的指数退避重试；429 以及带速率限制信息的 403
+    按 Retry-After 或 X-RateLimit-Reset 等待。所有等待都受同一个总截止时间约束，等待时间
+    超出剩余时间时不再重试，直接把最后的响应或异常交给调用方。
+
+    响应中的速率限制剩余额度按主机和 token 持久化到缓存目录的 ratelimit.json，后续调用
+    (包括之后的进程)在额度为 0 且尚未重置时等待重置，或抛出 RateLimitExhausted 让调用方
+    改用本地缓存，而不是发出必然失败的请求。
+
+    Args:
+        deadline: 从创建起允许用于请求和等待的总秒数(None 时读取 SPECIFY_RETRY_DEADLINE，默认 120)
+        max_attempts: 单个请求的最大尝试次数
+        state_path: 速率限制预算文件路径(默认 <缓存根目录>/ratelimit.json)
+    """
+
+    def __init__(self, deadline: float | None = None, *, max_attempts: int = RETRY_MAX_ATTEMPTS, state_path: Path | None = None):
+        self.deadline = _retry_deadline_from_env() if deadline is None else deadline
+        self.deadline_at = time.monotonic() + self.deadline
+        self.max_attempts = max(1, max_attempts)
+        self.state_path = state_path or (_specify_cache_root() / "ratelimit.json")
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.deadline_at - time.monotonic()
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """第 attempt 次(从 1 开始)失败后的等待秒数：full jitter 指数退避。"""
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+    def wait(self, delay: float, reason: str = "") -> bool:
+        """在截止时间允许时等待 delay 秒并返回 True；否则不等待，返回 False。"""
+        if delay > self.remaining():
+            return False
+        # 重试提示写到标准错误，不污染 --json 等标准输出；后台线程(如预取)静默等待
+        if delay >= 1 and reason and threading.current_thread() is threading.main_thread():
+            Console(stderr=True).print(f"[yellow]{reason}，{delay:.0f} 秒后重试[/yellow]")
+        time.sleep(max(0.0, delay))
+        return True
+
+    @staticmethod
+    def _budget_key(url: str, headers: dict) -> str:
+        import httpx
+        host = httpx.URL(url).host
+        token = (headers or {}).get("Authorization", "")
+        return f"{host}:{hashlib.sha256(token.encode()).hexdigest()[:12]}" if token else f"{host}:anonymous"
+
+    def _load_budgets(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def budget(self, url: str, headers: dict | None = None) -> Optional[dict]:
+        """返回该主机/token 最近记录的速率限制预算(remaining、limit、reset_epoch)。"""
+        entry = self._load_budgets().get(self._budget_key(url, headers or {}))
+        return entry if isinstance(entry, dict) else None
+
+    def _record_budget(self, url: str, headers: dict, response: httpx.Response) -> None:
+        info = _parse_rate_limit_headers(response.headers)
+        if "remaining" not in info:
+            return
+        try:
+            entry = {"remaining": int(info["remaining"]), "updated_at": time.time()}
+            if "limit" in info:
+                entry["limit"] = int(info["limit"])
+        except ValueError:
+            return
+        if "reset_epoch" in info:
+            entry["reset_epoch"] = info["reset_epoch"]
+        with self._lock:
+            budgets = self._load_budgets()
+            budgets[self._budget_key(url, headers)] = entry
+            try:
+                _write_json_atomic(self.state_path, budgets)
+            except OSError:
+                pass  # 缓存目录不可写时只是无法跨进程共享预算
+
+    def _wait_for_budget(self, url: str, headers: dict, wait: bool) -> None:
+        entry = self.budget(url, headers)
+        if not entry or entry.get("remaining", 1) > 0:
+            return
+        delay = entry.get("reset_epoch", 0) - time.time()
+        if delay <= 0:
+            return
+        if wait and self.wait(delay + 1, "GitHub 速率限制额度已用完"):
+            return
+        reset = datetime.fromtimestamp(entry["reset_epoch"], tz=timezone.utc).astimezone().strftime("%Y-%m-%d %H:%M:%S %Z")
+        raise RateLimitExhausted(
+            f"GitHub 速率限制额度已用完（上次记录剩余 0 次），将于 {reset} 重置；"
+            "可通过 --github-token 或 GH_TOKEN/GITHUB_TOKEN 提高限额"
+        )
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> Optional[float]:
+        """返回可重试响应的等待秒数；不可重试时返回 None。"""
+        status = response.status_code
+        info = _parse_rate_limit_headers(response.headers)
+        if status in (403, 429):
+            if "retry_after_seconds" in info:
+                return float(info["retry_after_seconds"])
+            if info.get("remaining") == "0" and "reset_epoch" in info:
+                return max(0.0, info["reset_epoch"] - time.time()) + 1
+            return self.backoff(attempt) if status == 429 else None
+        if status in RETRYABLE_STATUS:
+            if "retry_after_seconds" in info:
+                return float(info["retry_after_seconds"])
+            return self.backoff(attempt)
+        return None
+
+    def request(self, client: httpx.Client, method: str, url: str, *, headers: dict | None = None, timeout: float = 30, stream: bool = False, wait_for_budget: bool = True) -> httpx.Response:
+        """发送请求并按策略重试，返回最终的响应(调用方负责检查状态码；stream=True 时负责关闭)。
+
+        Args:
+            wait_for_budget: 预算已耗尽时是否等待重置；为 False 时直接抛出 RateLimitExhausted
+        """
+        import httpx
+        headers = dict(headers or {})
+        self._wait_for_budget(url, headers, wait_for_budget)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                request = client.build_request(method, url, headers=headers, timeout=timeout)
+                response = client.send(request, stream=stream, follow_redirects=True)
+            except httpx.TransportError as e:
+                metrics.inc("specify_http_retries_total", reason="transport")
+                if attempt >= self.max_attempts or not self.wait(self.backoff(attempt), f"网络错误（{type(e).__name__}）"):
+                    raise
+                continue
+            metrics.rate_limit(response.headers)
+            self._record_budget(url, headers, response)
+            delay = self._retry_delay(response, attempt)
+            if delay is None or attempt >= self.max_attempts or delay > self.remaining():
+                return response
+            metrics.inc("specify_http_retries_total", reason=str(response.status_code))
+            response.close()
+            label = "GitHub 速率限制" if response.status_code in (403, 429) else f"服务器返回 {response.status_code}"
+            self.wait(delay, label)
+
+_request_scheduler: RequestScheduler | None = None
+
+def get_request_scheduler() -> RequestScheduler:
+    """返回当前命令的请求调度器(未配置时按环境变量创建)。"""
+    global _request_scheduler
+    with _http_clients_lock:
+        if _request_scheduler is None:
+            _request_scheduler = RequestScheduler()
+        return _request_scheduler
+
+def configure_request_scheduler(deadline: float | None = None, *, max_attempts: int = RETRY_MAX_ATTEMPTS) -> RequestScheduler:
+    """为新的命令创建请求调度器，总截止时间从此刻开始计算。"""
+    global _request_scheduler
+    with _http_clients_lock:
+        _request_scheduler = RequestScheduler(deadline, max_attempts=max_attempts)
+        return _request_scheduler
+
 # AI 智能体配置，包括名称、文件夹、安装 URL 和 CLI 工具要求
 AGENT_CONFIG = {
     "copilot": {
@@ -244,21 +475,50 @@ BANNER = """
 TAGLINE = "GitHub Spec Kit - Spec-Driven Development Toolkit"
 class StepTracker:
     """跟踪和渲染分层步骤(无表情符号),类似于 Claude Code 树形输出。
-    通过附加的刷新回调支持实时自动刷新。
+
+    步骤按 key 存放在字典中，更新是 O(1) 的，只会标记为需要重绘；树在下次渲染时才重建。
+    将 tracker 本身传给 Live(它实现了 __rich__)，由 Live 的刷新循环按帧率渲染，
+    多次更新会合并为一次重绘。
+
+    所有更新和渲染都持有同一把可重入锁，可以从工作线程或 asyncio 任务中调用。
+    多个步骤可以同时处于 running 状态；add 的 parent 参数用于创建子步骤(例如分段下载)，
+    progress 记录完成比例并显示为百分比。
+
+    每个步骤记录进入 running 和结束时的单调时钟时间(started/ended)及所在线程，
+    span() 记录子进程等不属于步骤的耗时区间，to_chrome_trace() 导出为 Chrome 跟踪事件格式。
     """
     def __init__(self, title: str):
         self.title = title
-        self.steps = []  # 字典列表: {key, label, status, detail}
+        self._steps = {}  # key -> {key, label, status, detail, parent, children, started, ended, tid[, progress]}，保持插入顺序
+        self._spans = []  # {name, cat, started, ended, tid, args}
+        self.origin = time.perf_counter()
         self.status_order = {"pending": 0, "running": 1, "done": 2, "error": 3, "skipped": 4}
         self._refresh_cb = None  # 可调用对象,用于触发 UI 刷新
+        self._listeners = []  # 每次步骤变化时以该步骤字典调用
+        self._lock = threading.RLock()
+        self._dirty = True
+        self._tree = None
+        self._tree_timings = False
+
+    @property
+    def steps(self) -> list[dict]:
+        """按添加顺序返回步骤列表(快照)。"""
+        with self._lock:
+            return [dict(step) for step in self._steps.values()]
 
     def attach_refresh(self, cb):
+        """每次更新后同步调用 cb(不合并)。优先使用 Live(tracker) 的自动刷新。"""
         self._refresh_cb = cb
 
-    def add(self, key: str, label: str):
-        if key not in [s["key"] for s in self.steps]:
-            self.steps.append({"key": key, "label": label, "status": "pending", "detail": ""})
-            self._maybe_refresh()
+    def subscribe(self, cb):
+        """注册步骤变化的监听器(例如 JSON 事件输出)，cb 接收变化后的步骤字典。"""
+        self._listeners.append(cb)
+
+    def add(self, key: str, label: str, parent: str | None = None):
+        with self._lock:
+            if key not in self._steps:
+                step = self._new_step(key, label, "pending", "", parent)
+                self._maybe_refresh(step)
 
     def start(self, key: str, detail: str = ""):
         self._update(key, status="running", detail=detail)
@@ -272,63 +532,449 @@ class StepTracker:
     def skip(self, key: str, detail: str = ""):
         self._update(key, status="skipped", detail=detail)
 
-    def _update(self, key: str, status: str, detail: str):
-        for s in self.steps:
-            if s["key"] == key:
-                s["status"] = status
-                if detail:
-                    s["detail"] = detail
-                self._maybe_refresh()
-                return
+    def progress(self, key: str, completed: float, total: float | None = None):
+        """记录步骤的完成比例(total 为空时 completed 即为 0~1 的比例)；待处理的步骤会变为 running。"""
+        fraction = completed / total if total else completed
+        fraction = min(max(fraction, 0.0), 1.0)
+        with self._lock:
+            step = self._steps.get(key)
+            if step is None:
+                step = self._new_step(key, key, "running", "", None)
+            elif step["status"] == "pending":
+                step["status"] = "running"
+                self._stamp(step)
+            step["progress"] = fraction
+            self._maybe_refresh(step)
+
+    def _new_step(self, key: str, label: str, status: str, detail: str, parent: str | None) -> dict:
+        if parent is not None and parent not in self._steps:
+            parent = None
+        step = {"key": key, "label": label, "status": status, "detail": detail, "parent": parent, "children": [], "started": None, "ended": None, "tid": None}
+        self._steps[key] = step
+        if parent is not None:
+            self._steps[parent]["children"].append(key)
+        self._stamp(step)
+        return step
+
+    def _stamp(self, step: dict) -> None:
+        """按状态记录开始/结束时间。"""
+        status = step["status"]
+        if status == "running":
+            if step["started"] is None:
+                step["started"] = time.perf_counter()
+                step["tid"] = threading.get_ident()
+            step["ended"] = None
+        elif status in ("done", "error", "skipped"):
+            step["ended"] = time.perf_counter()
+            if step["tid"] is None:
+                step["tid"] = threading.get_ident()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "subprocess", **args):
+        """记录一段不属于任何步骤的耗时(例如一次子进程调用)。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._spans.append({"name": name, "cat": category, "started": started, "ended": time.perf_counter(), "tid": threading.get_ident(), "args": args})
 
-        self.steps.append({"key": key, "label": key, "status": status, "detail": detail})
-        self._maybe_refresh()
+    @staticmethod
+    def duration(step: dict) -> Optional[float]:
+        """返回步骤的耗时(秒)；没有经过 running 状态或尚未结束时返回 None。"""
+        if step.get("started") is None or step.get("ended") is None:
+            return None
+        return step["ended"] - step["started"]
+
+    def to_chrome_trace(self) -> dict:
+        """导出为 Chrome trace-event 格式(可在 chrome://tracing 或 Perfetto 中打开)。
+
+        有起止时间的步骤和 span 为完整事件("X")，只有结束时间的步骤为瞬时事件("i")。
+        时间戳为相对 tracker 创建时刻的微秒数。
+        """
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": f"specify: {self.title}"}}]
+
+        def us(t: float) -> float:
+            return round((t - self.origin) * 1e6, 3)
+
+        with self._lock:
+            tids = {}
+            for step in self._steps.values():
+                if step["ended"] is None and step["started"] is None:
+                    continue
+                tid = tids.setdefault(step["tid"], len(tids) + 1)
+                args = {"key": step["key"], "status": step["status"], "detail": step["detail"]}
+                if step["parent"]:
+                    args["parent"] = step["parent"]
+                if step["started"] is not None:
+                    end = step["ended"] if step["ended"] is not None else time.perf_counter()
+                    events.append({"name": step["label"], "cat": "step", "ph": "X", "ts": us(step["started"]), "dur": round((end - step["started"]) * 1e6, 3), "pid": pid, "tid": tid, "args": args})
+                else:
+                    events.append({"name": step["label"], "cat": "step", "ph": "i", "s": "t", "ts": us(step["ended"]), "pid": pid, "tid": tid, "args": args})
+            for span in self._spans:
+                tid = tids.setdefault(span["tid"], len(tids) + 1)
+                events.append({"name": span["name"], "cat": span["cat"], "ph": "X", "ts": us(span["started"]), "dur": round((span["ended"] - span["started"]) * 1e6, 3), "pid": pid, "tid": tid, "args": span["args"]})
+        for thread_id, tid in tids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": "main" if thread_id == threading.main_thread().ident else f"worker-{tid}"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
 
-    def _maybe_refresh(self):
+    def _update(self, key: str, status: str, detail: str):
+        with self._lock:
+            step = self._steps.get(key)
+            if step is None:
+                step = self._new_step(key, key, status, detail, None)
+            else:
+                step["status"] = status
+                if detail:
+                    step["detail"] = detail
+                self._stamp(step)
+            if status != "running":
+                step.pop("progress", None)
+            self._maybe_refresh(step)
+
+    def _maybe_refresh(self, step: dict | None = None):
+        self._dirty = True
+        if step is not None:
+            for listener in self._listeners:
+                listener(dict(step))
         if self._refresh_cb:
             try:
                 self._refresh_cb()
             except Exception:
                 pass
 
-    def render(self):
+    def __rich__(self):
+        return self.render()
+
+    def render(self, show_timings: bool = False):
+        """返回步骤树；自上次渲染以来没有变化时直接返回缓存的树。
+
+        show_timings 为 True 时在每个已结束的步骤后显示耗时。
+        """
+        with self._lock:
+            if self._dirty or self._tree is None or self._tree_timings != show_timings:
+                self._tree = self._build_tree(show_timings)
+                self._tree_timings = show_timings
+                self._dirty = False
+            return self._tree
+
+    def _build_tree(self, show_timings: bool = False):
         tree = Tree(f"[cyan]{self.title}[/cyan]", guide_style="grey50")
-        for step in self.steps:
-            label = step["label"]
-            detail_text = step["detail"].strip() if step["detail"] else ""
-
-            status = step["status"]
-            if status == "done":
-                symbol = "[green]●[/green]"
-            elif status == "pending":
-                symbol = "[green dim]○[/green dim]"
-            elif status == "running":
-                symbol = "[cyan]○[/cyan]"
-            elif status == "error":
-                symbol = "[red]●[/red]"
-            elif status == "skipped":
-                symbol = "[yellow]○[/yellow]"
+
+        def add_branch(node, step):
+            line = self._render_line(step)
+            elapsed = self.duration(step) if show_timings else None
+            if elapsed is not None:
+                line += f" [bright_black]{_format_duration(elapsed)}[/bright_black]"
+            branch = node.add(line)
+            for child_key in step["children"]:
+                add_branch(branch, self._steps[child_key])
+
+        for step in self._steps.values():
+            if step["parent"] is None:
+                add_branch(tree, step)
+        return tree
+
+    def _render_line(self, step: dict) -> str:
+        label = step["label"]
+        detail_text = step["detail"].strip() if step["detail"] else ""
+
+        status = step["status"]
+        if status == "done":
+            symbol = "[green]●[/green]"
+        elif status == "pending":
+            symbol = "[green dim]○[/green dim]"
+        elif status == "running":
+            symbol = "[cyan]○[/cyan]"
+        elif status == "error":
+            symbol = "[red]●[/red]"
+        elif status == "skipped":
+            symbol = "[yellow]○[/yellow]"
+        else:
+            symbol = " "
+
+        if status == "pending":
+            # 整行浅灰色(待处理)
+            if detail_text:
+                line = f"{symbol} [bright_black]{label} ({detail_text})[/bright_black]"
+            else:
+                line = f"{symbol} [bright_black]{label}[/bright_black]"
+        else:
+            # 标签白色,详情(如有)用括号括起来并显示为浅灰色
+            if detail_text:
+                line = f"{symbol} [white]{label}[/white] [bright_black]({detail_text})[/bright_black]"
             else:
-                symbol = " "
+                line = f"{symbol} [white]{label}[/white]"
 
-            if status == "pending":
-                # 整行浅灰色(待处理)
-                if detail_text:
-                    line = f"{symbol} [bright_black]{label} ({detail_text})[/bright_black]"
-                else:
-                    line = f"{symbol} [bright_black]{label}[/bright_black]"
+        if "progress" in step:
+            line += f" [cyan]{step['progress'] * 100:.0f}%[/cyan]"
+        return line
+
+def _format_duration(seconds: float) -> str:
+    """以 ms 或 s 为单位格式化耗时。"""
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    return f"{seconds:.2f}s"
+
+class JsonEventWriter:
+    """--json 模式下向标准输出写入 NDJSON 事件(每行一个 JSON 对象)。
+
+    step 事件携带步骤的 key、label、status、detail，以及相对命令开始的时间 t(秒)；
+    步骤结束时附带 tracker 记录的耗时 duration_ms。每个命令以一个 result 事件结束，
+    finished 记录是否已经输出过它。
+    """
+
+    def __init__(self, command: str, stream: IO[str] | None = None):
+        self.command = command
+        self.stream = stream or sys.stdout
+        self.started = time.perf_counter()
+        self.finished = False
+        self._last_state = {}
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields) -> None:
+        record = {"event": event, "command": self.command, "t": round(time.perf_counter() - self.started, 6), **fields}
+        with self._lock:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+            if event == "result":
+                self.finished = True
+
+    def step(self, step: dict) -> None:
+        # 进度按 10% 合并，状态和详情都没有变化时不重复输出
+        progress = step.get("progress")
+        state = (step["status"], step["detail"], None if progress is None else int(progress * 10))
+        if self._last_state.get(step["key"]) == state:
+            return
+        self._last_state[step["key"]] = state
+        fields = {k: step[k] for k in ("key", "label", "status", "detail")}
+        if step.get("parent"):
+            fields["parent"] = step["parent"]
+        if progress is not None:
+            fields["progress"] = round(progress, 3)
+        elapsed = StepTracker.duration(step)
+        if elapsed is not None:
+            fields["duration_ms"] = round(elapsed * 1000, 3)
+        self.emit("step", **fields)
+
+def _write_json_document(data: dict) -> None:
+    """--json 模式下以单个 JSON 文档输出命令结果。"""
+    sys.stdout.write(json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+    sys.stdout.flush()
+
+def _redirect_console_to_stderr() -> None:
+    """标准输出只保留 JSON，其余控制台信息(警告、错误)输出到标准错误。"""
+    console.stderr = True
+
+def _exit_with_error(message: str, events: JsonEventWriter | None = None, **fields) -> NoReturn:
+    """打印错误并以退出码 1 结束命令；--json 模式下先输出 ok=false 的 result 事件。"""
+    console.print(f"[red]错误：[/red] {message}")
+    if events is not None:
+        events.emit("result", ok=False, error=Text.from_markup(message).plain, **fields)
+    raise typer.Exit(1)
+
+def _failure_message(e: BaseException) -> str:
+    """返回写入 --json 结果和失败面板的错误说明。"""
+    # 普通 typer.Exit 的 str() 只是退出码，此时退回到记录的失败原因
+    if isinstance(e, typer.Exit) and not isinstance(e, CommandFailed):
+        return f"失败原因: {metrics.failure_reason}" if metrics.failure_reason else f"退出码 {e.exit_code}"
+    return str(e)
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 指标名 -> (类型, 说明)
+METRICS = {
+    "specify_command_runs_total": ("counter", "Specify CLI 命令运行次数，按命令和结果(success/failure)分类"),
+    "specify_command_failures_total": ("counter", "失败的命令运行次数，按失败原因分类"),
+    "specify_command_duration_seconds": ("histogram", "命令总耗时(秒)"),
+    "specify_step_duration_seconds": ("histogram", "init 各顶层步骤的耗时(秒)"),
+    "specify_download_bytes_total": ("counter", "从网络下载的模板字节数(不含续传前已有的部分)"),
+    "specify_template_cache_requests_total": ("counter", "模板缓存查询次数，result 为 hit 或 miss"),
+    "specify_template_prefetch_total": ("counter", "交互式 init 的后台预取结果，result 为 hit(预取的归档与最终选择一致)或 miss"),
+    "specify_release_metadata_requests_total": ("counter", "版本元数据的获取次数，按来源(ttl/not-modified/network/stale)分类"),
+    "specify_http_retries_total": ("counter", "GitHub 请求的重试次数，按原因(状态码或 transport)分类"),
+    "specify_github_rate_limit_remaining": ("gauge", "最近一次 GitHub API 响应中的剩余请求数"),
+    "specify_github_rate_limit_limit": ("gauge", "最近一次 GitHub API 响应中的请求上限"),
+    "specify_github_rate_limit_reset_timestamp_seconds": ("gauge", "GitHub 速率限制重置时间(Unix 秒)"),
+    "specify_last_run_timestamp_seconds": ("gauge", "各命令最近一次运行结束的时间(Unix 秒)"),
+}
+
+def _metric_label_key(labels: dict) -> str:
+    return json.dumps(sorted((k, str(v)) for k, v in labels.items()), ensure_ascii=False)
+
+def _format_metric_labels(labels: list, extra: tuple = ()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_metric_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class MetricsRecorder:
+    """收集一次命令运行的指标，并与之前运行的累计值合并后写入 Prometheus 文本格式文件。
+
+    计数器和直方图跨运行累加，累计状态保存在同目录的 <文件名>.json 中(node-exporter 的
+    textfile 收集器只读取 *.prom)；gauge 保留最近一次的值。每次命令开始时由 callback 清空。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.failure_reason = None
+            self._steps_seen = set()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _metric_label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges.setdefault(name, {})[_metric_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _metric_label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.setdefault(key, {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def fail(self, reason: str) -> None:
+        """记录失败原因；只保留第一个(最接近根因的)。"""
+        with self._lock:
+            if self.failure_reason is None:
+                self.failure_reason = reason
+
+    def rate_limit(self, headers: httpx.Headers) -> None:
+        info = _parse_rate_limit_headers(headers)
+        for field, name in (("remaining", "specify_github_rate_limit_remaining"), ("limit", "specify_github_rate_limit_limit")):
+            try:
+                self.set(name, int(info[field]))
+            except (KeyError, ValueError):
+                pass
+        if "reset_epoch" in info:
+            self.set("specify_github_rate_limit_reset_timestamp_seconds", info["reset_epoch"])
+
+    def step(self, step: dict) -> None:
+        """StepTracker 订阅回调：记录顶层步骤的耗时，出错的步骤作为失败原因。"""
+        if step.get("parent") or step["status"] not in ("done", "error") or step["key"] in self._steps_seen:
+            return
+        self._steps_seen.add(step["key"])
+        if step["status"] == "error":
+            self.fail(step["key"])
+        elapsed = StepTracker.duration(step)
+        if elapsed is not None:
+            self.observe("specify_step_duration_seconds", elapsed, step=step["key"])
+
+    def finish(self, command: str, elapsed: float, exc: BaseException | None) -> None:
+        """记录命令本身的结果与耗时。exc 为结束命令的异常(正常结束时为 None)。"""
+        if isinstance(exc, (typer.Exit, SystemExit)):
+            code = getattr(exc, "exit_code", getattr(exc, "code", 0)) or 0
+        else:
+            code = 0 if exc is None else 1
+        outcome = "success" if code == 0 else "failure"
+        if code:
+            if isinstance(exc, KeyboardInterrupt):
+                self.fail("interrupted")
+            elif isinstance(exc, (typer.Exit, SystemExit)):
+                self.fail(f"exit_{code}")
             else:
-                # 标签白色,详情(如有)用括号括起来并显示为浅灰色
-                if detail_text:
-                    line = f"{symbol} [white]{label}[/white] [bright_black]({detail_text})[/bright_black]"
-                else:
-                    line = f"{symbol} [white]{label}[/white]"
+                self.fail(type(exc).__name__)
+            self.inc("specify_command_failures_total", command=command, reason=self.failure_reason)
+        self.inc("specify_command_runs_total", command=command, outcome=outcome)
+        self.observe("specify_command_duration_seconds", elapsed, command=command)
+        self.set("specify_last_run_timestamp_seconds", round(time.time(), 3), command=command, outcome=outcome)
+
+    def _merge(self, state: dict) -> dict:
+        for name, series in self.counters.items():
+            merged = state.setdefault("counters", {}).setdefault(name, {})
+            for key, value in series.items():
+                merged[key] = merged.get(key, 0) + value
+        for name, series in self.gauges.items():
+            state.setdefault("gauges", {}).setdefault(name, {}).update(series)
+        for name, series in self.histograms.items():
+            merged = state.setdefault("histograms", {}).setdefault(name, {})
+            for key, hist in series.items():
+                old = merged.get(key)
+                if old is None or len(old.get("buckets", [])) != len(hist["buckets"]):
+                    merged[key] = dict(hist, buckets=list(hist["buckets"]))
+                    continue
+                old["buckets"] = [a + b for a, b in zip(old["buckets"], hist["buckets"])]
+                old["sum"] += hist["sum"]
+                old["count"] += hist["count"]
+        return state
+
+    @staticmethod
+    def render(state: dict) -> str:
+        """把累计状态渲染为 Prometheus 文本格式(textfile 收集器可直接读取)。"""
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            section = {"counter": "counters", "gauge": "gauges", "histogram": "histograms"}[kind]
+            series = state.get(section, {}).get(name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in sorted(series):
+                labels = json.loads(key)
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_metric_labels(labels)} {_format_metric_value(series[key])}")
+                    continue
+                hist = series[key]
+                for bound, count in zip((*DURATION_BUCKETS, float("inf")), (*hist["buckets"], hist["count"])):
+                    lines.append(f"{name}_bucket{_format_metric_labels(labels, (('le', _format_metric_value(bound)),))} {count}")
+                lines.append(f"{name}_sum{_format_metric_labels(labels)} {_format_metric_value(round(hist['sum'], 6))}")
+                lines.append(f"{name}_count{_format_metric_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> bool:
+        """在锁内合并累计状态并原子地替换文本文件；锁被长时间占用时放弃并返回 False。"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        state_path = path.with_name(path.name + ".json")
+        lock_path = None
+        for _ in range(100):
+            lock_path = _acquire_partial_lock(path)
+            if lock_path is not None:
+                break
+            time.sleep(0.05)
+        if lock_path is None:
+            return False
+        try:
+            try:
+                state = json.loads(state_path.read_text(encoding="utf-8"))
+                if not isinstance(state, dict):
+                    state = {}
+            except (FileNotFoundError, json.JSONDecodeError):
+                state = {}
+            with self._lock:
+                state = self._merge(state)
+            _write_json_atomic(state_path, state)
+            _write_bytes_atomic(path, self.render(state).encode("utf-8"))
+        finally:
+            lock_path.unlink(missing_ok=True)
+        return True
 
-            tree.add(line)
-        return tree
+metrics = MetricsRecorder()
 
 def get_key():
     """使用 readchar 以跨平台方式获取单个按键。"""
+    import readchar
     key = readchar.readkey()
 
     if key == readchar.key.UP or key == readchar.key.CTRL_P:
@@ -393,6 +1039,7 @@ def select_with_arrows(options: dict, prompt_text: str = "选择一个选项", d
 
     def run_selection_loop():
         nonlocal selected_key, selected_index
+        from rich.live import Live
         with Live(create_selection_panel(), console=console, transient=True, auto_refresh=False) as live:
             while True:
                 try:
@@ -455,9 +1102,117 @@ def show_banner():
     console.print(Align.center(Text(TAGLINE, style="italic bright_yellow")))
     console.print()
 
+PROFILE_TOP_N = 30
+
+class CommandProfiler:
+    """用 cProfile 和 tracemalloc 包裹一次命令运行，结束时把报告写入目录。
+
+    生成的文件(前缀为 specify-<命令>-<时间戳>):
+        .pstats      cProfile 原始数据，可用 `python -m pstats` 或 snakeviz 查看
+        .txt         按累计耗时排序的前 N 个函数，以及按代码行汇总的前 N 个内存分配点
+
+    cProfile 只统计主线程；分段下载等工作线程中的耗时会体现在主线程等待结果的调用上。
+    """
+
+    def __init__(self, directory: Path, command: str, top: int = PROFILE_TOP_N):
+        self.directory = directory
+        self.command = command
+        self.top = top
+        self.profiler = None
+
+    def start(self) -> None:
+        import cProfile
+        import tracemalloc
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tracemalloc.start()
+        self.started = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self) -> list[Path]:
+        """停止采样并写出报告，返回生成的文件路径。"""
+        import io
+        import pstats
+        import tracemalloc
+
+        if self.profiler is None:
+            return []
+        self.profiler.disable()
+        elapsed = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stem = f"specify-{self.command}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        pstats_path = self.directory / f"{stem}.pstats"
+        report_path = self.directory / f"{stem}.txt"
+        self.profiler.dump_stats(pstats_path)
+
+        buf = io.StringIO()
+        buf.write(f"specify {self.command}\n")
+        buf.write(f"argv: {' '.join(sys.argv[1:])}\n")
+        buf.write(f"python: {sys.version.split()[0]} ({sys.platform})\n")
+        buf.write(f"wall: {elapsed * 1000:.1f} ms\n\n")
+        buf.write(f"== cProfile: 前 {self.top} 个函数（按累计耗时） ==\n")
+        pstats.Stats(self.profiler, stream=buf).strip_dirs().sort_stats("cumulative").print_stats(self.top)
+        buf.write(f"== tracemalloc: 当前 {_format_bytes(current)}，峰值 {_format_bytes(peak)} ==\n")
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        for index, entry in enumerate(snapshot.statistics("lineno")[:self.top], 1):
+            frame = entry.traceback[0]
+            buf.write(f"{index:>3}. {frame.filename}:{frame.lineno}  {_format_bytes(entry.size)} / {entry.count} 个对象\n")
+        report_path.write_text(buf.getvalue(), encoding="utf-8")
+        self.profiler = None
+        return [pstats_path, report_path]
+
 @app.callback()
-def callback(ctx: typer.Context):
+def callback(
+    ctx: typer.Context,
+    profile: Path = typer.Option(None, "--profile", help="用 cProfile 和 tracemalloc 分析本次运行，把 pstats 与内存分配摘要写入该目录（不影响正常输出）"),
+    metrics_file: Path = typer.Option(None, "--metrics-file", envvar="SPECIFY_METRICS_FILE", help="命令结束后把累计的运行指标写入该 Prometheus 文本格式文件（供 node-exporter textfile 收集器读取）"),
+    retry_deadline: float = typer.Option(None, "--retry-deadline", help="GitHub 请求重试与等待速率限制重置的总时限（秒，默认 120，或 SPECIFY_RETRY_DEADLINE）"),
+):
     """当未提供子命令时显示横幅。"""
+    # --json 等模式会把控制台输出改到标准错误，命令结束后恢复
+    ctx.call_on_close(lambda: setattr(console, "stderr", False))
+    metrics.reset()
+    configure_request_scheduler(retry_deadline)
+    if metrics_file is not None and ctx.invoked_subcommand is not None:
+        command = ctx.invoked_subcommand
+        started = time.perf_counter()
+
+        def finish_metrics():
+            # 关闭回调在异常传播期间执行，sys.exc_info() 即结束命令的异常
+            metrics.finish(command, time.perf_counter() - started, sys.exc_info()[1])
+            try:
+                written = metrics.write(metrics_file)
+            except OSError as e:
+                written = False
+                Console(stderr=True).print(f"[yellow]警告：[/yellow]无法写入指标文件 {metrics_file}: {e}")
+            else:
+                if not written:
+                    Console(stderr=True).print(f"[yellow]警告：[/yellow]指标文件 {metrics_file} 被其他进程锁定，本次指标未写入")
+
+        ctx.call_on_close(finish_metrics)
+    if profile is not None and ctx.invoked_subcommand is not None:
+        profiler = CommandProfiler(profile, ctx.invoked_subcommand)
+
+        def finish_profile():
+            try:
+                paths = profiler.stop()
+            except OSError as e:
+                Console(stderr=True).print(f"[yellow]警告：[/yellow]无法写入性能分析报告: {e}")
+                return
+            if paths:
+                Console(stderr=True).print(f"[dim]性能分析报告: {', '.join(str(p) for p in paths)}[/dim]")
+
+        # 上下文关闭时(包括 typer.Exit 和异常)写出报告，覆盖子命令的全部运行时间
+        ctx.call_on_close(finish_profile)
+        profiler.start()
     if ctx.invoked_subcommand is None and "--help" not in sys.argv and "-h" not in sys.argv:
         show_banner()
         console.print(Align.center("[dim]运行 'specify --help' 获取使用信息[/dim]"))
@@ -481,37 +1236,170 @@ def run_command(cmd: list[str], check_return: bool = True, capture: bool = False
             raise
         return None
 
-def check_tool(tool: str, tracker: StepTracker = None) -> bool:
+class PathIndex:
+    """PATH 中文件名的索引：每个 PATH 目录只 os.scandir 一次，之后的查找都在内存中完成。
+
+    查找顺序与 shutil.which 一致(按 PATH 目录顺序，Windows 上再按 PATHEXT 顺序)，
+    只对候选文件做 is_file/os.access 检查。
+    """
+
+    def __init__(self, path_env: str | None = None):
+        self.path_env = os.environ.get("PATH", os.defpath) if path_env is None else path_env
+        self.windows = os.name == "nt"
+        if self.windows:
+            self.pathext = [ext.lower() for ext in os.environ.get("PATHEXT", ".COM;.EXE;.BAT;.CMD").split(os.pathsep) if ext]
+        else:
+            self.pathext = []
+        self.entries: dict[str, list] = {}
+        seen = set()
+        for dir_index, directory in enumerate(self.path_env.split(os.pathsep)):
+            if not directory or directory in seen:
+                continue
+            seen.add(directory)
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        name = entry.name.lower() if self.windows else entry.name
+                        self.entries.setdefault(name, []).append((dir_index, entry))
+            except OSError:
+                continue
+
+    def which(self, tool: str) -> Optional[str]:
+        """返回 PATH 中第一个可执行的 tool 的完整路径，未找到时返回 None。"""
+        if self.windows:
+            tool = tool.lower()
+            names = [tool] if any(tool.endswith(ext) for ext in self.pathext) else [tool + ext for ext in self.pathext]
+        else:
+            names = [tool]
+        candidates = []
+        for ext_index, name in enumerate(names):
+            for dir_index, entry in self.entries.get(name, ()):
+                candidates.append((dir_index, ext_index, entry))
+        for _, _, entry in sorted(candidates, key=lambda c: (c[0], c[1])):
+            try:
+                if entry.is_file() and (self.windows or os.access(entry.path, os.X_OK)):
+                    return entry.path
+            except OSError:
+                continue
+        return None
+
+_path_index_cache: dict = {}
+
+def get_path_index() -> PathIndex:
+    """返回当前 PATH 的索引；PATH 变化时重新构建。"""
+    path_env = os.environ.get("PATH", os.defpath)
+    index = _path_index_cache.get("index")
+    if index is None or index.path_env != path_env:
+        index = PathIndex(path_env)
+        _path_index_cache["index"] = index
+    return index
+
+def find_tool(tool: str) -> Optional[str]:
+    """返回工具可执行文件的路径，未安装时返回 None。"""
+    # 在 `claude migrate-installer` 后对 Claude CLI 进行特殊处理
+    # 参见：https://github.com/github/spec-kit/issues/123
+    # migrate-installer 命令会从 PATH 中删除原始可执行文件
+    # 并在 ~/.claude/local/claude 创建别名
+    # 此路径应优先于 PATH 中的其他 claude 可执行文件
+    if tool == "claude" and CLAUDE_LOCAL_PATH.is_file():
+        return str(CLAUDE_LOCAL_PATH)
+    return get_path_index().which(tool)
+
+def check_tool(tool: str, tracker: StepTracker = None, version: str | None = None) -> bool:
     """检查工具是否已安装。可选地更新追踪器。
 
     Args:
         tool: 要检查的工具名称
         tracker: 可选的 StepTracker，用于更新结果
+        version: 可选的已探测版本，显示在追踪器中
 
     Returns:
         如果找到工具则返回 True，否则返回 False
     """
-    # 在 `claude migrate-installer` 后对 Claude CLI 进行特殊处理
-    # 参见：https://github.com/github/spec-kit/issues/123
-    # migrate-installer 命令会从 PATH 中删除原始可执行文件
-    # 并在 ~/.claude/local/claude 创建别名
-    # 此路径应优先于 PATH 中的其他 claude 可执行文件
-    if tool == "claude":
-        if CLAUDE_LOCAL_PATH.exists() and CLAUDE_LOCAL_PATH.is_file():
-            if tracker:
-                tracker.complete(tool, "available")
-            return True
-
-    found = shutil.which(tool) is not None
+    found = find_tool(tool) is not None
 
     if tracker:
         if found:
-            tracker.complete(tool, "available")
+            tracker.complete(tool, f"available ({version})" if version else "available")
         else:
             tracker.error(tool, "未找到")
 
     return found
 
+TOOL_VERSION_TIMEOUT = 3.0
+TOOL_CACHE_TTL = 600
+
+def _tool_cache_path() -> Path:
+    return _specify_cache_root() / "tools.json"
+
+def _parse_version_output(output: str) -> Optional[str]:
+    """从 --version 的输出中提取版本号(没有版本号时返回第一行)。"""
+    import re
+    first_line = next((line.strip() for line in output.splitlines() if line.strip()), "")
+    match = re.search(r"\d+(?:\.\d+)+(?:[-+][0-9A-Za-z.]+)?", first_line)
+    if match:
+        return match.group(0)
+    return first_line[:40] or None
+
+def _probe_tool_version(path: str, timeout: float) -> Optional[str]:
+    """运行 `<path> --version` 并解析版本号；失败或超时时返回 None。"""
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=timeout, stdin=subprocess.DEVNULL)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return _parse_version_output(result.stdout or result.stderr)
+
+def probe_tool_versions(tools: dict, *, timeout: float = TOOL_VERSION_TIMEOUT, ttl: float = TOOL_CACHE_TTL) -> dict:
+    """在线程池中并行探测工具版本，结果缓存在用户缓存目录中。
+
+    可执行文件的路径、大小和 mtime 都未变化且未超过 ttl 秒时直接使用缓存的版本。
+
+    Args:
+        tools: {工具名: 可执行文件路径}
+        timeout: 每个工具 --version 的超时时间(秒)
+        ttl: 缓存有效期(秒)，0 表示不使用缓存
+
+    Returns:
+        {工具名: 版本字符串或 None}
+    """
+    cache_path = _tool_cache_path()
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f).get("tools", {})
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        cached = {}
+
+    now = time.time()
+    versions = {}
+    pending = {}
+    fingerprints = {}
+    for tool, path in tools.items():
+        try:
+            st = os.stat(path)
+            fingerprints[tool] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            fingerprints[tool] = None
+        entry = cached.get(tool)
+        if (ttl > 0 and isinstance(entry, dict) and entry.get("path") == path
+                and entry.get("fingerprint") == fingerprints[tool] and now - entry.get("checked_at", 0) < ttl):
+            versions[tool] = entry.get("version")
+        else:
+            pending[tool] = path
+
+    if pending:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(8, len(pending))) as pool:
+            futures = {tool: pool.submit(_probe_tool_version, path, timeout) for tool, path in pending.items()}
+            for tool, future in futures.items():
+                versions[tool] = future.result()
+                cached[tool] = {"path": pending[tool], "fingerprint": fingerprints[tool], "version": versions[tool], "checked_at": now}
+        if ttl > 0:
+            try:
+                _write_json_atomic(cache_path, {"version": 1, "tools": cached})
+            except OSError:
+                pass  # 缓存目录不可写时不影响结果
+    return versions
+
 def is_git_repo(path: Path = None) -> bool:
     """检查指定路径是否在 git 仓库内。"""
     if path is None:
@@ -532,12 +1420,13 @@ def is_git_repo(path: Path = None) -> bool:
     except (subprocess.CalledProcessError, FileNotFoundError):
         return False
 
-def init_git_repo(project_path: Path, quiet: bool = False) -> Tuple[bool, Optional[str]]:
+def init_git_repo(project_path: Path, quiet: bool = False, tracker: StepTracker | None = None) -> Tuple[bool, Optional[str]]:
     """在指定路径初始化 git 仓库。
 
     Args:
         project_path: 初始化 git 仓库的路径
         quiet: 如果为 True，则抑制控制台输出（由追踪器处理状态）
+        tracker: 可选的 StepTracker，用于记录每个 git 子进程的耗时
 
     Returns:
         元组 (success: bool, error_message: Optional[str])
@@ -547,9 +1436,9 @@ def init_git_repo(project_path: Path, quiet: bool = False) -> Tuple[bool, Option
         os.chdir(project_path)
         if not quiet:
             console.print("[cyan]正在初始化 git 仓库...[/cyan]")
-        subprocess.run(["git", "init"], check=True, capture_output=True, text=True)
-        subprocess.run(["git", "add", "."], check=True, capture_output=True, text=True)
-        subprocess.run(["git", "commit", "-m", "Initial commit from Specify template"], check=True, capture_output=True, text=True)
+        for cmd in (["git", "init"], ["git", "add", "."], ["git", "commit", "-m", "Initial commit from Specify template"]):
+            with (tracker.span(" ".join(cmd[:2]), cmd=cmd) if tracker else contextlib.nullcontext()):
+                subprocess.run(cmd, check=True, capture_output=True, text=True)
         if not quiet:
             console.print("[green]✓[/green] Git 仓库已初始化")
         return True, None
@@ -567,29 +1456,26 @@ def init_git_repo(project_path: Path, quiet: bool = False) -> Tuple[bool, Option
     finally:
         os.chdir(original_cwd)
 
-def handle_vscode_settings(sub_item, dest_file, rel_path, verbose=False, tracker=None) -> None:
-    """处理 .vscode/settings.json 文件的合并或复制。"""
+def handle_vscode_settings(new_data: bytes, dest_file, rel_path, verbose=False, tracker=None) -> None:
+    """处理 .vscode/settings.json 文件的合并或写入(new_data 为模板中的原始内容)。"""
     def log(message, color="green"):
         if verbose and not tracker:
             console.print(f"[{color}]{message}[/] {rel_path}")
 
     try:
-        with open(sub_item, 'r', encoding='utf-8') as f:
-            new_settings = json.load(f)
+        new_settings = json.loads(new_data.decode('utf-8'))
 
         if dest_file.exists():
             merged = merge_json_files(dest_file, new_settings, verbose=verbose and not tracker)
-            with open(dest_file, 'w', encoding='utf-8') as f:
-                json.dump(merged, f, indent=4)
-                f.write('\n')
+            _write_bytes_atomic(dest_file, (json.dumps(merged, indent=4) + '\n').encode('utf-8'))
             log("已合并:", "green")
         else:
-            shutil.copy2(sub_item, dest_file)
+            _write_bytes_atomic(dest_file, new_data)
             log("已复制(无现有 settings.json):", "blue")
 
     except Exception as e:
         log(f"警告: 无法合并,改为复制: {e}", "yellow")
-        shutil.copy2(sub_item, dest_file)
+        _write_bytes_atomic(dest_file, new_data)
 
 def merge_json_files(existing_path: Path, new_content: dict, verbose: bool = False) -> dict:
     """将新的 JSON 内容合并到现有 JSON 文件。
@@ -634,143 +1520,1726 @@ def merge_json_files(existing_path: Path, new_content: dict, verbose: bool = Fal
 
     return merged
 
-def download_template_from_github(ai_assistant: str, download_dir: Path, *, script_type: str = "sh", verbose: bool = True, show_progress: bool = True, client: httpx.Client = None, debug: bool = False, github_token: str = None) -> Tuple[Path, dict]:
-    repo_owner = "lordking"
-    repo_name = "spec-kit-zh"
-    if client is None:
-        client = httpx.Client(verify=ssl_context)
+def _specify_cache_root() -> Path:
+    """返回 Specify CLI 的用户缓存根目录(可通过 SPECIFY_CACHE_DIR 覆盖)。"""
+    override = os.getenv("SPECIFY_CACHE_DIR", "").strip()
+    if override:
+        return Path(override).expanduser()
+    import platformdirs
+    return Path(platformdirs.user_cache_dir("specify-cli"))
+
+def _user_config_path() -> Path:
+    """返回用户配置文件 config.json 的路径(目录可通过 SPECIFY_CONFIG_DIR 覆盖)。"""
+    override = os.getenv("SPECIFY_CONFIG_DIR", "").strip()
+    if override:
+        return Path(override).expanduser() / "config.json"
+    import platformdirs
+    return Path(platformdirs.user_config_dir("specify-cli")) / "config.json"
+
+def read_user_config() -> dict:
+    """读取用户配置(例如上次使用的 AI 助手和脚本类型)；不存在或损坏时返回空字典。"""
+    try:
+        with open(_user_config_path(), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return config if isinstance(config, dict) else {}
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def update_user_config(**values) -> None:
+    """合并写入用户配置；配置目录不可写时静默忽略。"""
+    config = read_user_config()
+    if all(config.get(k) == v for k, v in values.items()):
+        return
+    config.update(values)
+    try:
+        _write_json_atomic(_user_config_path(), config)
+    except OSError:
+        pass
+
+def _writable_mode(mode: int) -> int:
+    """为权限位加上 umask 允许的写权限(缓存目录树中的文件是只读的)。"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return mode | (0o222 & ~umask)
 
-    if verbose:
-        console.print("[cyan]正在获取最新版本信息...[/cyan]")
-    api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/releases/latest"
+def _write_bytes_atomic(path: Path, data: bytes) -> None:
+    """通过同目录临时文件 + os.replace 原子地写入文件(保留已有文件的权限位)。
 
+    已有文件只读时(例如硬链接到缓存目录树的文件)，新文件恢复写权限。
+    """
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
     try:
-        response = client.get(
-            api_url,
-            timeout=30,
-            follow_redirects=True,
-            headers=_github_auth_headers(github_token),
-        )
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if path.exists():
+            mode = stat.S_IMODE(path.stat().st_mode)
+            os.chmod(tmp_name, mode if mode & 0o200 else _writable_mode(mode))
+        else:
+            # mkstemp 创建的文件权限为 0600，新文件恢复为按 umask 的默认权限
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_name, 0o666 & ~umask)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def _write_json_atomic(path: Path, data) -> None:
+    """先写入同目录下的临时文件，再用 os.replace 原子替换目标 JSON 文件。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        if path.exists():
+            shutil.copymode(path, tmp_name)
+        else:
+            # 与 _write_bytes_atomic 相同：新文件恢复为按 umask 的默认权限，而不是 mkstemp 的 0600
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_name, 0o666 & ~umask)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def _update_digest(digest, f: IO[bytes]):
+    """从文件对象当前位置读到末尾，用读取的内容更新 digest 并返回它。"""
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest
+
+def _sha256_file(path: Path) -> str:
+    """计算文件的 SHA-256 摘要。"""
+    with open(path, "rb") as f:
+        return _update_digest(hashlib.sha256(), f).hexdigest()
+
+def _format_bytes(size: int) -> str:
+    """以人类可读的形式格式化字节数。"""
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{size} B"
+
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+INDEX_LOCK_STALE_SECONDS = 30
+LAST_USED_RESOLUTION = 60
+
+class TemplateCache:
+    """按内容寻址的本地模板缓存。
+
+    归档以 `blobs/<sha256>.zip` 存储，索引 `index.json` 以 "<版本标签>/<资源名>" 为键，
+    记录摘要、大小和最近使用时间，超过容量上限时按 LRU 淘汰。
+    对索引的每次读-改-写都持有 `index.json.lock`，多个进程并发 init 时不会丢失条目。
+    """
+
+    def __init__(self, root: Path | None = None, max_bytes: int | None = None):
+        self.root = (root or _specify_cache_root()) / "templates"
+        self.blobs_dir = self.root / "blobs"
+        self.trees_dir = self.root / "trees"
+        self.index_path = self.root / "index.json"
+        if max_bytes is None:
+            try:
+                max_bytes = int(os.getenv("SPECIFY_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES))
+            except ValueError:
+                max_bytes = DEFAULT_CACHE_MAX_BYTES
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _key(release: str, filename: str) -> str:
+        return f"{release}/{filename}"
+
+    def _load(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if isinstance(index.get("entries"), dict):
+                return index
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            pass
+        return {"version": 1, "entries": {}}
+
+    def _save(self, index: dict) -> None:
+        _write_json_atomic(self.index_path, index)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """持有索引锁；持有者崩溃留下的锁在 INDEX_LOCK_STALE_SECONDS 后失效。"""
+        while True:
+            lock_path = _acquire_partial_lock(self.index_path, stale_after=INDEX_LOCK_STALE_SECONDS)
+            if lock_path is not None:
+                break
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            lock_path.unlink(missing_ok=True)
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.blobs_dir / f"{sha256}.zip"
+
+    def partial_path(self, filename: str) -> Path:
+        """返回资源在缓存目录内的 .part 下载路径(与 blob 位于同一文件系统，便于原子移动)。"""
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        return self.blobs_dir / f"{filename}.part"
+
+    def lookup(self, release: str, filename: str) -> Optional[dict]:
+        """查找缓存条目；命中时返回包含 path 的条目副本。
+
+        最近使用时间按 LAST_USED_RESOLUTION 的粒度更新，频繁命中时不会每次都重写索引。
+        """
+        key = self._key(release, filename)
+        entry = self._load()["entries"].get(key)
+        if not entry:
+            return None
+        path = self.blob_path(entry["sha256"])
+        stale = time.time() - entry.get("last_used", 0) >= LAST_USED_RESOLUTION
+        if path.is_file() and not stale:
+            return {**entry, "path": path}
+        with self._locked():
+            index = self._load()
+            entry = index["entries"].get(key)
+            if not entry:
+                return None
+            path = self.blob_path(entry["sha256"])
+            if not path.is_file():
+                del index["entries"][key]
+                self._save(index)
+                return None
+            entry["last_used"] = time.time()
+            self._save(index)
+        return {**entry, "path": path}
+
+    def store(self, release: str, filename: str, src: Path, sha256: str, *, asset_url: str = "", verified: str | None = None) -> dict:
+        """将已下载的归档移入缓存并登记索引，随后按容量上限淘汰旧条目。
+
+        verified 记录 sha256 与哪个公布的摘要核对过("digest"、"lock" 或校验和资源名)。
+        """
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        dest = self.blob_path(sha256)
+        if dest.exists():
+            src.unlink(missing_ok=True)
+        else:
+            os.replace(src, dest)
+        now = time.time()
+        entry = {
+            "release": release,
+            "filename": filename,
+            "sha256": sha256,
+            "size": dest.stat().st_size,
+            "asset_url": asset_url,
+            "verified": verified,
+            "created_at": now,
+            "last_used": now,
+        }
+        with self._locked():
+            index = self._load()
+            index["entries"][self._key(release, filename)] = entry
+            self._evict(index, keep=self._key(release, filename))
+            self._save(index)
+        return {**entry, "path": dest}
+
+    def entries(self) -> list[dict]:
+        """按最近使用时间倒序返回所有缓存条目。"""
+        index = self._load()
+        items = [{**entry, "path": self.blob_path(entry["sha256"])} for entry in index["entries"].values()]
+        return sorted(items, key=lambda e: e.get("last_used", 0), reverse=True)
+
+    def total_bytes(self, index: dict | None = None) -> int:
+        index = index or self._load()
+        blobs = {e["sha256"]: e.get("size", 0) for e in index["entries"].values()}
+        return sum(blobs.values())
+
+    def _evict(self, index: dict, max_bytes: int | None = None, keep: str | None = None) -> list[dict]:
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        by_age = sorted(index["entries"].items(), key=lambda kv: kv[1].get("last_used", 0))
+        for key, entry in by_age:
+            if self.total_bytes(index) <= limit:
+                break
+            if key == keep:
+                continue
+            del index["entries"][key]
+            removed.append(entry)
+            self._drop_blob_if_unreferenced(index, entry["sha256"])
+        return removed
+
+    def _drop_blob_if_unreferenced(self, index: dict, sha256: str) -> None:
+        if not any(e["sha256"] == sha256 for e in index["entries"].values()):
+            self.blob_path(sha256).unlink(missing_ok=True)
+            shutil.rmtree(self.trees_dir / sha256, ignore_errors=True)
+            self.tree_manifest_path(sha256).unlink(missing_ok=True)
+
+    def tree_manifest_path(self, sha256: str) -> Path:
+        return self.trees_dir / f"{sha256}.json"
+
+    def tree_files(self, sha256: str) -> dict:
+        """返回目录树中每个文件的 {"sha256", "size"}(解压时记录在 trees/<sha256>.json)。
+
+        旧版本创建的目录树没有该文件时，从 blob 计算一次并保存。
+        """
+        path = self.tree_manifest_path(sha256)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                files = json.load(f)["files"]
+            if isinstance(files, dict):
+                return files
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            pass
+        with zipfile.ZipFile(self.blob_path(sha256), 'r') as zip_ref:
+            files = _archive_file_hashes(zip_ref, _archive_prefix(zip_ref.infolist()))
+        _write_json_atomic(path, {"version": 1, "files": files})
+        return files
+
+    def check_tree(self, sha256: str, *, full: bool = False) -> list[str]:
+        """将目录树与归档中各文件的哈希比对，返回不一致(被修改、缺失或多出)的相对路径。
+
+        默认先比较大小和 mtime，只有不一致的文件才重新计算哈希；full 为 True 时对每个文件
+        计算哈希(specify cache verify)。
+        """
+        tree = self.trees_dir / sha256
+        files = self.tree_files(sha256)
+        bad = []
+        seen = set()
+        for root, _dirs, names in os.walk(tree):
+            for name in names:
+                path = Path(root) / name
+                rel = path.relative_to(tree).as_posix()
+                seen.add(rel)
+                entry = files.get(rel)
+                if entry is None:
+                    bad.append(rel)
+                    continue
+                st = path.stat()
+                if not full and st.st_size == entry["size"] and st.st_mtime_ns == entry.get("mtime_ns"):
+                    continue
+                if st.st_size != entry["size"] or _sha256_file(path) != entry["sha256"]:
+                    bad.append(rel)
+        bad.extend(sorted(set(files) - seen))
+        return bad
+
+    def rebuild_tree(self, sha256: str) -> Path:
+        """丢弃(可能被就地修改过的)目录树并从 blob 重新解压。"""
+        tree = self.trees_dir / sha256
+        if tree.is_dir():
+            # 先移开再删除，其他进程不会看到删了一半的目录树
+            stale = Path(tempfile.mkdtemp(prefix=f".{sha256[:12]}.stale.", dir=self.trees_dir))
+            try:
+                os.replace(tree, stale / sha256)
+            except OSError:
+                pass
+            shutil.rmtree(stale, ignore_errors=True)
+        self.tree_manifest_path(sha256).unlink(missing_ok=True)
+        return self.unpacked_tree(sha256, check=False)
+
+    def unpacked_tree(self, sha256: str, *, check: bool = True) -> Path:
+        """返回 blob 解压后的目录树(已去除顶层前缀并设置执行位)，首次调用时创建。
+
+        先解压到同目录下的临时目录再重命名，多个进程并发创建时只有一个生效。
+        解压时计算的各文件哈希(及 mtime)写入 trees/<sha256>.json；目录树中的文件设为只读，
+        硬链接到项目中的文件无法被就地修改。check 为 True 时，已有的目录树先用 check_tree
+        校验，被修改过的会重建。
+        """
+        tree = self.trees_dir / sha256
+        if tree.is_dir():
+            if not self.tree_manifest_path(sha256).is_file():
+                # 旧版本创建的目录树没有记录哈希，文件也不是只读的：重建一次
+                return self.rebuild_tree(sha256)
+            if not check or not self.check_tree(sha256):
+                return tree
+            return self.rebuild_tree(sha256)
+        self.trees_dir.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f".{sha256[:12]}.", dir=self.trees_dir))
+        try:
+            with zipfile.ZipFile(self.blob_path(sha256), 'r') as zip_ref:
+                counts = extract_template_archive(zip_ref, staging, prefix=_archive_prefix(zip_ref.infolist()))
+            for rel, entry in counts["files"].items():
+                path = staging / rel
+                os.chmod(path, stat.S_IMODE(path.stat().st_mode) & ~0o222)
+                _stamp_manifest_entry(path, entry)
+            _write_json_atomic(self.tree_manifest_path(sha256), {"version": 1, "files": counts["files"]})
+            os.rename(staging, tree)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if not tree.is_dir():
+                raise
+        return tree
+
+    def _prune_partials(self, max_age: float) -> None:
+        """删除 blobs/ 中超过 max_age 秒未更新的未完成下载(.part、.part.json、私有临时文件)及失效的锁。"""
+        now = time.time()
+        for path in self.blobs_dir.iterdir():
+            name = path.name
+            if name.endswith(".part.lock"):
+                age_limit = PARTIAL_LOCK_STALE_SECONDS
+            elif name.endswith((".part", ".part.json")) or (name.startswith(".") and ".part." in name):
+                age_limit = max_age
+            else:
+                continue
+            try:
+                if now - path.stat().st_mtime < age_limit:
+                    continue
+                # 仍被持有的锁说明下载正在进行，保留对应的部分文件
+                part = self.blobs_dir / name.split(".part", 1)[0].lstrip(".")
+                lock = part.with_name(part.name + ".part.lock")
+                if not name.endswith(".part.lock") and lock.exists() and now - lock.stat().st_mtime < PARTIAL_LOCK_STALE_SECONDS:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def prune(self, max_bytes: int | None = None, *, partial_max_age: float | None = None) -> list[dict]:
+        """淘汰最久未使用的条目，直到总大小不超过上限(0 表示清空)，并清理孤立文件和过期的未完成下载。"""
+        with self._locked():
+            index = self._load()
+            removed = self._evict(index, max_bytes=max_bytes)
+            referenced = {e["sha256"] for e in index["entries"].values()}
+            if self.blobs_dir.is_dir():
+                for blob in self.blobs_dir.iterdir():
+                    if blob.suffix == ".zip" and len(blob.stem) == 64 and blob.stem not in referenced:
+                        blob.unlink(missing_ok=True)
+                if partial_max_age is None:
+                    partial_max_age = 0 if max_bytes == 0 else PARTIAL_MAX_AGE_SECONDS
+                self._prune_partials(partial_max_age)
+            if self.trees_dir.is_dir():
+                for tree in self.trees_dir.iterdir():
+                    if tree.is_dir() and len(tree.name) == 64 and tree.name not in referenced:
+                        shutil.rmtree(tree, ignore_errors=True)
+                    elif tree.suffix == ".json" and len(tree.stem) == 64 and tree.stem not in referenced:
+                        tree.unlink(missing_ok=True)
+            self._save(index)
+        return removed
+
+    def verify_trees(self) -> list[tuple[str, list[str]]]:
+        """对每个已解压的目录树计算全部文件的哈希，重建被修改过的目录树。
+
+        Returns:
+            (sha256, 不一致的相对路径列表) 列表，路径列表为空表示目录树完好
+        """
+        results = []
+        if not self.trees_dir.is_dir():
+            return results
+        for tree in sorted(self.trees_dir.iterdir()):
+            if not tree.is_dir() or len(tree.name) != 64:
+                continue
+            try:
+                bad = self.check_tree(tree.name, full=True)
+            except (OSError, zipfile.BadZipFile):
+                bad = ["(无法读取归档哈希)"]
+            if bad and self.blob_path(tree.name).is_file():
+                self.rebuild_tree(tree.name)
+            elif bad:
+                shutil.rmtree(tree, ignore_errors=True)
+            results.append((tree.name, bad))
+        return results
+
+    def verify(self, remove_invalid: bool = False) -> list[tuple[dict, bool, str]]:
+        """重新计算每个 blob 的摘要，返回 (条目, 是否有效, 原因) 列表。"""
+        results = []
+        invalid = set()
+        # 计算摘要耗时较长，在锁外进行；只在删除无效条目时持有索引锁
+        for key, entry in self._load()["entries"].items():
+            path = self.blob_path(entry["sha256"])
+            if not path.is_file():
+                ok, reason = False, "文件缺失"
+            else:
+                actual = _sha256_file(path)
+                ok = actual == entry["sha256"]
+                reason = "ok" if ok else f"摘要不匹配 ({actual[:12]}…)"
+            results.append((entry, ok, reason))
+            if not ok:
+                invalid.add(entry["sha256"])
+        if remove_invalid and invalid:
+            with self._locked():
+                index = self._load()
+                for key, entry in list(index["entries"].items()):
+                    if entry["sha256"] in invalid:
+                        del index["entries"][key]
+                for sha256 in invalid:
+                    self._drop_blob_if_unreferenced(index, sha256)
+                self._save(index)
+        return results
+
+DEFAULT_TEMPLATE_REPO = "lordking/spec-kit-zh"
+
+class TemplateSource:
+    """模板版本的来源：GitHub releases API、HTTP 镜像，或本地目录 / file:// 镜像。
+
+    来源写法(--template-source 或 SPECIFY_TEMPLATE_SOURCE):
+        github                      默认仓库 lordking/spec-kit-zh
+        github:<owner>/<repo>       其他 GitHub 仓库
+        https://host/path           按镜像布局组织的 HTTP 基础 URL
+        file:///path 或 /path       按镜像布局组织的本地目录(如挂载的局域网共享)
+
+    镜像布局(由 specify mirror sync 生成)：
+        <根>/latest.json            最新版本的 release JSON
+        <根>/<tag>/release.json     指定版本的 release JSON
+        <根>/<tag>/<资源文件>        资源的 browser_download_url 可以是相对 JSON 文件的路径
+    """
+
+    def __init__(self, kind: str, location: str):
+        self.kind = kind
+        self.location = location
+
+    @classmethod
+    def parse(cls, spec: str | None = None) -> "TemplateSource":
+        """解析来源写法；spec 为空时读取 SPECIFY_TEMPLATE_SOURCE，仍为空时使用默认 GitHub 仓库。"""
+        spec = (spec or os.getenv("SPECIFY_TEMPLATE_SOURCE", "")).strip() or "github"
+        if spec == "github":
+            return cls("github", DEFAULT_TEMPLATE_REPO)
+        if spec.startswith("github:"):
+            repo = spec[len("github:"):].strip("/")
+            if repo.count("/") != 1 or not all(repo.split("/")):
+                raise ValueError(f"无效的 GitHub 仓库 '{repo}'，应为 <owner>/<repo>")
+            return cls("github", repo)
+        if spec.startswith(("http://", "https://")):
+            return cls("http", spec.rstrip("/"))
+        if spec.startswith("file:"):
+            return cls("file", str(_file_url_path(spec)))
+        return cls("file", str(Path(spec).expanduser().resolve()))
+
+    def __str__(self) -> str:
+        return f"github:{self.location}" if self.kind == "github" else self.location
+
+    @property
+    def is_github(self) -> bool:
+        return self.kind == "github"
+
+    @property
+    def cache_name(self) -> str:
+        """版本元数据缓存的文件名前缀。"""
+        if self.is_github:
+            return self.location.replace("/", "__")
+        return f"mirror-{hashlib.sha256(str(self).encode()).hexdigest()[:16]}"
+
+    def release_url(self, tag: str | None = None) -> str:
+        if self.is_github:
+            base = f"https://api.github.com/repos/{self.location}/releases"
+            return f"{base}/tags/{tag}" if tag else f"{base}/latest"
+        base = self.location.rstrip("/") if self.kind == "http" else Path(self.location).as_uri()
+        return f"{base}/{tag}/release.json" if tag else f"{base}/latest.json"
+
+def _file_url_path(url: str) -> Path:
+    """把 file:// URL 转换为本地路径。"""
+    from urllib.parse import urlparse
+    from urllib.request import url2pathname
+    parsed = urlparse(url)
+    return Path(url2pathname(parsed.path))
+
+def _resolve_asset_urls(release_data: dict, base_url: str) -> dict:
+    """把镜像 release JSON 中相对的 browser_download_url 解析为相对 base_url 的绝对地址。"""
+    from urllib.parse import urljoin
+    for asset in release_data.get("assets", []):
+        url = asset.get("browser_download_url") or asset.get("name", "")
+        asset["browser_download_url"] = urljoin(base_url, url)
+    return release_data
+
+DEFAULT_RELEASE_TTL = 300
+
+def _release_ttl_from_env() -> float:
+    """读取 SPECIFY_RELEASE_TTL(秒)，无效时回退到默认值。"""
+    try:
+        return float(os.getenv("SPECIFY_RELEASE_TTL", DEFAULT_RELEASE_TTL))
+    except ValueError:
+        return DEFAULT_RELEASE_TTL
+
+def _release_cache_path(source_name: str, tag: str | None = None) -> Path:
+    suffix = f"@{tag}" if tag else ""
+    return _specify_cache_root() / "releases" / f"{source_name}{suffix}.json"
+
+def fetch_latest_release(client: httpx.Client, repo_owner: str, repo_name: str, *, tag: str | None = None, github_token: str = None, timeout: float = 30, ttl: float | None = None, debug: bool = False) -> Tuple[dict, str]:
+    """获取 GitHub 仓库的 releases/latest(或指定 tag 的版本)，见 fetch_release。"""
+    return fetch_release(client, TemplateSource("github", f"{repo_owner}/{repo_name}"), tag=tag, github_token=github_token, timeout=timeout, ttl=ttl, debug=debug)
+
+def fetch_release(client: httpx.Client, source: TemplateSource, *, tag: str | None = None, github_token: str = None, timeout: float = 30, ttl: float | None = None, debug: bool = False) -> Tuple[dict, str]:
+    """从模板来源获取最新版本(或指定 tag 的版本)，并将 JSON 与 ETag/Last-Modified 一起持久化。
+
+    在 TTL 内直接返回缓存的数据；超过 TTL 时发送条件请求(304 不消耗速率限制)；
+    请求失败但存在旧数据时回退到旧数据。指定 tag 的版本不会再变化，缓存永不过期。
+    本地目录镜像直接读取，不经过缓存；GitHub token 只发送给 GitHub。
+
+    Returns:
+        元组 (release_data, source)，source 为 "ttl"、"not-modified"、"network"、"stale" 或 "local"
+    """
+    api_url = source.release_url(tag)
+    if source.kind == "file":
+        path = _file_url_path(api_url)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                release_data = json.load(f)
+        except FileNotFoundError:
+            raise RuntimeError(f"镜像中没有版本信息: {path}（先运行 specify mirror sync）")
+        except json.JSONDecodeError as je:
+            raise RuntimeError(f"解析版本 JSON 失败: {path}: {je}")
+        return _resolve_asset_urls(release_data, api_url), "local"
+
+    if ttl is None:
+        ttl = _release_ttl_from_env()
+    if tag:
+        ttl = float("inf")
+    cache_path = _release_cache_path(source.cache_name, tag)
+
+    cached = None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if not isinstance(cached.get("data"), dict):
+            cached = None
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        cached = None
+
+    if cached and ttl > 0 and time.time() - cached.get("fetched_at", 0) < ttl:
+        return cached["data"], "ttl"
+
+    headers = _github_auth_headers(github_token) if source.is_github else {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        # 有缓存时不等待速率限制重置，额度耗尽直接回退到缓存
+        response = get_request_scheduler().request(client, "GET", api_url, headers=headers, timeout=timeout, wait_for_budget=cached is None)
         status = response.status_code
+        if status == 304 and cached:
+            cached["fetched_at"] = time.time()
+            _write_json_atomic(cache_path, cached)
+            return cached["data"], "not-modified"
         if status != 200:
             # 格式化详细的错误消息，包含速率限制信息
-            error_msg = _format_rate_limit_error(status, response.headers, api_url)
+            if source.is_github:
+                error_msg = _format_rate_limit_error(status, response.headers, api_url)
+            else:
+                error_msg = f"模板镜像返回状态码 {status},请求 URL: {api_url}"
             if debug:
                 error_msg += f"\n\n[dim]响应正文（截断 500 字符）:[/dim]\n{response.text[:500]}"
             raise RuntimeError(error_msg)
         try:
             release_data = response.json()
+            if not source.is_github:
+                release_data = _resolve_asset_urls(release_data, str(response.url))
         except ValueError as je:
             raise RuntimeError(f"解析版本 JSON 失败: {je}\n原始数据(截断 400 字符): {response.text[:400]}")
-    except Exception as e:
-        console.print(f"[red]获取版本信息出错[/red]")
-        console.print(Panel(str(e), title="获取错误", border_style="red"))
-        raise typer.Exit(1)
-
-    assets = release_data.get("assets", [])
-    pattern = f"spec-kit-template-{ai_assistant}-{script_type}-zh"
-    matching_assets = [
-        asset for asset in assets
-        if pattern in asset["name"] and asset["name"].endswith(".zip")
-    ]
-
-    asset = matching_assets[0] if matching_assets else None
+    except Exception:
+        if cached:
+            return cached["data"], "stale"
+        raise
 
-    if asset is None:
-        console.print(f"[red]未找到匹配的版本资源[/red],AI 助手为 [bold]{ai_assistant}[/bold] (期望模式: [bold]{pattern}[/bold])")
-        asset_names = [a.get('name', '?') for a in assets]
-        console.print(Panel("\n".join(asset_names) or "(无资源)", title="可用资源", border_style="yellow"))
-        raise typer.Exit(1)
+    try:
+        _write_json_atomic(cache_path, {
+            "url": api_url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "data": release_data,
+        })
+    except OSError:
+        pass  # 缓存目录不可写时不影响本次结果
+    return release_data, "network"
+
+DOWNLOAD_MAX_RETRIES = 3
+PARTIAL_LOCK_STALE_SECONDS = 600
+PARTIAL_MAX_AGE_SECONDS = 24 * 3600  # cache prune 删除超过该时长未更新的未完成下载
+SEGMENT_MIN_BYTES = 256 * 1024
+SPOOL_MAX_MEMORY = 64 * 1024 * 1024
+RANGE_READ_BLOCK = 64 * 1024
+
+def _acquire_partial_lock(part_path: Path, stale_after: float = PARTIAL_LOCK_STALE_SECONDS) -> Optional[Path]:
+    """为 .part 文件创建排他锁文件；已被其他进程持有时返回 None(超过 stale_after 秒的锁视为失效)。"""
+    lock_path = part_path.with_name(part_path.name + ".lock")
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return lock_path
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime < stale_after:
+                    return None
+                lock_path.unlink()
+            except FileNotFoundError:
+                pass
+    return None
 
-    download_url = asset["browser_download_url"]
-    filename = asset["name"]
-    file_size = asset["size"]
+def _stream_with_resume(client: httpx.Client, url: str, f: IO[bytes], *, offset: int = 0, etag: str | None = None, digest=None, expected_size: int = 0, headers: dict | None = None, show_progress: bool = False, debug: bool = False, max_retries: int = DOWNLOAD_MAX_RETRIES, on_etag=None, on_progress=None) -> tuple:
+    """将资源流式写入已打开的可读写二进制文件 f，f 中已有 offset 字节。
 
-    if verbose:
-        console.print(f"[cyan]已找到模板:[/cyan] {filename}")
-        console.print(f"[cyan]大小:[/cyan] {file_size:,} 字节")
-        console.print(f"[cyan]版本:[/cyan] {release_data['tag_name']}")
+    offset 非零且有 ETag 时发送 Range 与 If-Range 头部续传；服务器返回 200 时清空 f 从头开始。
+    网络错误会自动重试(最多 max_retries 次，并受请求调度器的总截止时间约束)，SHA-256 在写入时增量计算。
+    提供 on_progress 时，每写入一块调用 on_progress(None, 已写入字节数, expected_size)。
 
-    zip_path = download_dir / filename
-    if verbose:
-        console.print(f"[cyan]正在下载模板...[/cyan]")
+    Returns:
+        元组 (digest, 续传起始字节数)
+    """
+    import httpx
+    scheduler = get_request_scheduler()
+    digest = digest or hashlib.sha256()
+    resumed_from = offset
+    f.seek(offset)
+
+    progress = None
+    task = None
+    if show_progress and expected_size:
+        from rich.progress import Progress, SpinnerColumn, TextColumn
+        progress = Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            console=console,
+        )
+        progress.start()
+        task = progress.add_task("正在下载...", total=expected_size, completed=offset)
 
+    attempt = 0
     try:
-        with client.stream(
-            "GET",
-            download_url,
-            timeout=60,
-            follow_redirects=True,
-            headers=_github_auth_headers(github_token),
-        ) as response:
-            if response.status_code != 200:
-                # 处理下载时的速率限制
-                error_msg = _format_rate_limit_error(response.status_code, response.headers, download_url)
-                if debug:
-                    error_msg += f"\n\n[dim]Response body (truncated 400):[/dim]\n{response.text[:400]}"
-                raise RuntimeError(error_msg)
-            total_size = int(response.headers.get('content-length', 0))
-            with open(zip_path, 'wb') as f:
-                if total_size == 0:
+        while True:
+            request_headers = dict(headers or {})
+            if offset and etag:
+                request_headers["Range"] = f"bytes={offset}-"
+                request_headers["If-Range"] = etag
+            try:
+                with contextlib.closing(scheduler.request(client, "GET", url, headers=request_headers, timeout=60, stream=True)) as response:
+                    if response.status_code == 416 and expected_size and offset == expected_size:
+                        break
+                    if response.status_code == 206 and offset:
+                        pass
+                    elif response.status_code == 200:
+                        f.seek(0)
+                        f.truncate()
+                        offset = resumed_from = 0
+                        digest = hashlib.sha256()
+                    else:
+                        # 处理下载时的速率限制
+                        error_msg = _format_rate_limit_error(response.status_code, response.headers, url)
+                        if debug:
+                            response.read()
+                            error_msg += f"\n\n[dim]Response body (truncated 400):[/dim]\n{response.text[:400]}"
+                        raise RuntimeError(error_msg)
+
+                    etag = response.headers.get("ETag")
+                    if on_etag:
+                        on_etag(etag)
                     for chunk in response.iter_bytes(chunk_size=8192):
                         f.write(chunk)
-                else:
-                    if show_progress:
-                        with Progress(
-                            SpinnerColumn(),
-                            TextColumn("[progress.description]{task.description}"),
-                            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                            console=console,
-                        ) as progress:
-                            task = progress.add_task("正在下载...", total=total_size)
-                            downloaded = 0
-                            for chunk in response.iter_bytes(chunk_size=8192):
-                                f.write(chunk)
-                                downloaded += len(chunk)
-                                progress.update(task, completed=downloaded)
-                    else:
-                        for chunk in response.iter_bytes(chunk_size=8192):
-                            f.write(chunk)
-    except Exception as e:
-        console.print(f"[red]下载模板出错[/red]")
-        detail = str(e)
-        if zip_path.exists():
-            zip_path.unlink()
-        console.print(Panel(detail, title="下载错误", border_style="red"))
-        raise typer.Exit(1)
-    if verbose:
-        console.print(f"已下载: {filename}")
-    metadata = {
-        "filename": filename,
-        "size": file_size,
-        "release": release_data["tag_name"],
-        "asset_url": download_url
-    }
-    return zip_path, metadata
+                        digest.update(chunk)
+                        offset += len(chunk)
+                        if progress is not None:
+                            progress.update(task, completed=offset)
+                        if on_progress is not None:
+                            on_progress(None, offset, expected_size)
+                break
+            except httpx.TransportError:
+                attempt += 1
+                if attempt > max_retries or not scheduler.wait(scheduler.backoff(attempt)):
+                    raise
+                f.flush()
+    finally:
+        if progress is not None:
+            progress.stop()
+    return digest, resumed_from
 
-def download_and_extract_template(project_path: Path, ai_assistant: str, script_type: str, is_current_dir: bool = False, *, verbose: bool = True, tracker: StepTracker | None = None, client: httpx.Client = None, debug: bool = False, github_token: str = None) -> Path:
-    """下载最新版本并解压以创建新项目。
-    返回 project_path。如果提供了 tracker，则使用它（使用的键：fetch, download, extract, cleanup）
+def _download_asset(client: httpx.Client, url: str, part_path: Path, *, expected_size: int = 0, headers: dict | None = None, show_progress: bool = False, debug: bool = False, max_retries: int = DOWNLOAD_MAX_RETRIES, on_progress=None) -> Tuple[str, int, Path]:
+    """将资源下载到 part_path，支持跨进程的断点续传。
+
+    已下载的部分保存在 .part 文件中，其 URL 与 ETag 记录在同名 .json 文件里，
+    下次调用时从已有长度处续传。最终大小与 expected_size 不一致时报错。
+    其他进程正持有 part_path 的锁时改为下载到同目录的私有临时文件，调用方必须使用
+    返回的路径，而不是 part_path(那里是另一个进程尚未完成的部分文件)。
+
+    Returns:
+        元组 (sha256 十六进制摘要, 续传起始字节数, 实际写入的文件路径)
     """
-    current_dir = Path.cwd()
+    state_path = part_path.with_name(part_path.name + ".json")
+    lock_path = _acquire_partial_lock(part_path)
+    if lock_path is None:
+        # 其他进程正在下载同一资源：使用私有临时文件，不参与续传
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{part_path.name}.", dir=part_path.parent)
+        os.close(fd)
+        part_path = Path(tmp_name)
+        state_path = part_path.with_name(part_path.name + ".json")
 
-    if tracker:
-        tracker.start("fetch", "正在连接 GitHub API")
     try:
-        zip_path, meta = download_template_from_github(
-            ai_assistant,
-            current_dir,
-            script_type=script_type,
+        state = {}
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        offset = 0
+        digest = hashlib.sha256()
+        if part_path.exists() and state.get("url") == url and state.get("etag"):
+            offset = part_path.stat().st_size
+            if expected_size and offset > expected_size:
+                offset = 0
+            else:
+                with open(part_path, "rb") as f:
+                    _update_digest(digest, f)
+
+        def remember_etag(etag: str | None) -> None:
+            if etag:
+                _write_json_atomic(state_path, {"url": url, "etag": etag})
+            else:
+                state_path.unlink(missing_ok=True)
+
+        with open(part_path, "r+b" if part_path.exists() else "w+b") as f:
+            digest, resumed_from = _stream_with_resume(
+                client,
+                url,
+                f,
+                offset=offset,
+                etag=state.get("etag") if offset else None,
+                digest=digest,
+                expected_size=expected_size,
+                headers=headers,
+                show_progress=show_progress,
+                debug=debug,
+                max_retries=max_retries,
+                on_etag=remember_etag,
+                on_progress=on_progress,
+            )
+
+        actual_size = part_path.stat().st_size
+        if expected_size and actual_size != expected_size:
+            part_path.unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+            raise RuntimeError(f"下载大小不匹配: 期望 {expected_size:,} 字节，实际 {actual_size:,} 字节")
+        state_path.unlink(missing_ok=True)
+        return digest.hexdigest(), resumed_from, part_path
+    except BaseException:
+        if lock_path is None or not state_path.exists():
+            # 无法续传的部分文件(包括私有临时文件)没有保留价值
+            part_path.unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if lock_path is not None:
+            lock_path.unlink(missing_ok=True)
+
+def _pwrite_all(fd: int, data: bytes, offset: int, lock: threading.Lock) -> None:
+    """在指定偏移处写入全部数据；没有 os.pwrite 的平台(Windows)退化为加锁的 seek + write。"""
+    view = memoryview(data)
+    if hasattr(os, "pwrite"):
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+    else:
+        with lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+
+def _segment_count(expected_size: int, connections: int) -> int:
+    """每个分段至少 SEGMENT_MIN_BYTES，返回实际使用的分段数。"""
+    if not expected_size or connections < 2:
+        return 1
+    return max(1, min(connections, -(-expected_size // SEGMENT_MIN_BYTES)))
+
+def _probe_range_support(client: httpx.Client, url: str, expected_size: int, headers: dict | None = None) -> Optional[str]:
+    """用 HEAD 请求确认服务器支持 Range 且大小一致，返回重定向后的最终 URL；不支持时返回 None。"""
+    import httpx
+    try:
+        probe = get_request_scheduler().request(client, "HEAD", url, headers=headers, timeout=30)
+    except httpx.HTTPError:
+        return None
+    if probe.status_code != 200 or probe.headers.get("Accept-Ranges", "").lower() != "bytes":
+        return None
+    if int(probe.headers.get("Content-Length", expected_size)) != expected_size:
+        return None
+    return str(probe.url)
+
+def _headers_for_redirect(headers: dict | None, url: str, final_url: str) -> dict:
+    """返回请求 final_url 时使用的请求头：重定向到其他源(协议、主机或端口不同)时去掉认证头。
+
+    单连接下载由 httpx 跟随重定向并自动去掉认证头；分段下载直接请求探测得到的最终 URL，
+    需要同样处理，否则 GitHub token 会被发送给资源所在的第三方主机。
+    """
+    import httpx
+    headers = dict(headers or {})
+    original, final = httpx.URL(url), httpx.URL(final_url)
+    if (original.scheme, original.host, original.port) != (final.scheme, final.host, final.port):
+        for name in [name for name in headers if name.lower() in ("authorization", "cookie")]:
+            del headers[name]
+    return headers
+
+def _fetch_segments(client: httpx.Client, url: str, fd: int, *, expected_size: int, segments: int, headers: dict | None = None, debug: bool = False, max_retries: int = DOWNLOAD_MAX_RETRIES, on_progress=None) -> Optional[str]:
+    """按字节范围并发下载资源，并按位置写入已预分配的文件描述符 fd。
+
+    提供 on_progress 时，各工作线程每写入一块调用 on_progress(分段序号, 分段已写入字节数, 分段大小)。
+    SHA-256 只能按顺序计算：从文件开头起连续写完的部分在下载过程中从页缓存读回并更新摘要，
+    下载结束后不需要再完整读一遍文件。
+
+    Returns:
+        SHA-256 十六进制摘要；平台不支持 os.pread 时返回 None(由调用方重新读取文件计算)
+    """
+    import httpx
+    from concurrent.futures import ThreadPoolExecutor
+    scheduler = get_request_scheduler()
+    step = -(-expected_size // segments)
+    ranges = [(start, min(start + step, expected_size) - 1) for start in range(0, expected_size, step)]
+    stop = threading.Event()
+    write_lock = threading.Lock()
+    reached = [start for start, _ in ranges]
+    digest = hashlib.sha256() if hasattr(os, "pread") else None
+    digest_lock = threading.Lock()
+    hashed = [0]
+
+    def advance_digest(block: bool = False) -> None:
+        # 其他线程正在推进时直接返回，由它(或最后一次阻塞调用)处理新写入的数据
+        if digest is None or not digest_lock.acquire(blocking=block):
+            return
+        try:
+            while hashed[0] < expected_size:
+                limit = reached[hashed[0] // step]
+                if limit <= hashed[0]:
+                    break
+                data = os.pread(fd, min(limit - hashed[0], 1024 * 1024), hashed[0])
+                if not data:
+                    break
+                digest.update(data)
+                hashed[0] += len(data)
+        finally:
+            digest_lock.release()
+
+    def fetch_range(index: int, start: int, end: int) -> None:
+        position = start
+        attempt = 0
+        while position <= end:
+            if stop.is_set():
+                return
+            request_headers = dict(headers or {})
+            request_headers["Range"] = f"bytes={position}-{end}"
+            try:
+                with contextlib.closing(scheduler.request(client, "GET", url, headers=request_headers, timeout=60, stream=True)) as response:
+                    if response.status_code != 206:
+                        error_msg = _format_rate_limit_error(response.status_code, response.headers, url)
+                        if debug:
+                            response.read()
+                            error_msg += f"\n\n[dim]Response body (truncated 400):[/dim]\n{response.text[:400]}"
+                        raise RuntimeError(error_msg)
+                    for chunk in response.iter_bytes(chunk_size=64 * 1024):
+                        if stop.is_set():
+                            return
+                        chunk = chunk[: end - position + 1]
+                        _pwrite_all(fd, chunk, position, write_lock)
+                        position += len(chunk)
+                        reached[index] = position
+                        advance_digest()
+                        if on_progress is not None:
+                            on_progress(index, position - start, end - start + 1)
+                if position <= end:
+                    raise httpx.ReadError(f"分段 {start}-{end} 提前结束")
+            except httpx.TransportError:
+                attempt += 1
+                if attempt > max_retries or not scheduler.wait(scheduler.backoff(attempt)):
+                    raise
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(fetch_range, index, start, end) for index, (start, end) in enumerate(ranges)]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            stop.set()
+            raise
+    advance_digest(block=True)
+    return digest.hexdigest() if digest is not None and hashed[0] == expected_size else None
+
+def _download_asset_segmented(client: httpx.Client, url: str, part_path: Path, *, expected_size: int, connections: int, headers: dict | None = None, debug: bool = False, max_retries: int = DOWNLOAD_MAX_RETRIES, on_progress=None) -> Optional[Tuple[str, Path]]:
+    """按字节范围并发下载资源到预分配的 part_path。
+
+    服务器不支持 Range(缺少 Accept-Ranges: bytes)时返回 None，由调用方回退到单连接下载。
+    各分段通过同一个连接池并发获取，并按位置写入。其他进程正持有 part_path 的锁时
+    改为写入同目录的私有临时文件(分段下载本来就不续传)，调用方必须使用返回的路径。
+
+    Returns:
+        元组 (SHA-256 十六进制摘要, 实际写入的文件路径)，或 None(不支持分段下载)
+    """
+    segments = _segment_count(expected_size, connections)
+    if segments < 2:
+        return None
+    final_url = _probe_range_support(client, url, expected_size, headers)
+    if final_url is None:
+        return None
+
+    lock_path = _acquire_partial_lock(part_path)
+    if lock_path is None:
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{part_path.name}.", dir=part_path.parent)
+        os.close(fd)
+        part_path = Path(tmp_name)
+    else:
+        part_path.with_name(part_path.name + ".json").unlink(missing_ok=True)
+    try:
+        with open(part_path, "wb") as f:
+            f.truncate(expected_size)
+        fd = os.open(part_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            sha256 = _fetch_segments(client, final_url, fd, expected_size=expected_size, segments=segments, headers=_headers_for_redirect(headers, url, final_url), debug=debug, max_retries=max_retries, on_progress=on_progress)
+        finally:
+            os.close(fd)
+        return sha256 or _sha256_file(part_path), part_path
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if lock_path is not None:
+            lock_path.unlink(missing_ok=True)
+
+class _HttpRangeReader(io.RawIOBase):
+    """按需发送 Range 请求读取远程文件的只读、可定位文件对象。
+
+    供 zipfile 只读取归档的中央目录(以及少量条目)：每次读取至少获取 RANGE_READ_BLOCK 字节，
+    靠近文件末尾的读取会向前对齐，使中央目录结束记录和中央目录通常只需一两个请求。
+    """
+
+    def __init__(self, client: httpx.Client, url: str, size: int, *, headers: dict | None = None, block_size: int = RANGE_READ_BLOCK):
+        self.client = client
+        self.url = url
+        self.size = size
+        self.headers = headers or {}
+        self.block_size = block_size
+        self.requests = 0
+        self._pos = 0
+        self._buffer_start = 0
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def _fetch(self, start: int, end: int) -> None:
+        request_headers = dict(self.headers)
+        request_headers["Range"] = f"bytes={start}-{end}"
+        response = get_request_scheduler().request(self.client, "GET", self.url, headers=request_headers, timeout=30)
+        self.requests += 1
+        if response.status_code != 206 or len(response.content) != end - start + 1:
+            raise OSError(f"Range 请求失败: {self.url} bytes={start}-{end} (HTTP {response.status_code})")
+        self._buffer_start, self._buffer = start, response.content
+
+    def readinto(self, b) -> int:
+        if self._pos >= self.size or not len(b):
+            return 0
+        offset = self._pos - self._buffer_start
+        if not 0 <= offset < len(self._buffer):
+            start = max(0, min(self._pos, self.size - self.block_size))
+            end = min(self.size, max(start + self.block_size, self._pos + len(b))) - 1
+            self._fetch(start, end)
+            offset = self._pos - self._buffer_start
+        data = self._buffer[offset:offset + len(b)]
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+def _download_to_spool(client: httpx.Client, url: str, *, expected_size: int, connections: int = 1, headers: dict | None = None, show_progress: bool = False, debug: bool = False, on_progress=None) -> Tuple[IO[bytes], str, int]:
+    """将资源下载到 SpooledTemporaryFile：小于 SPOOL_MAX_MEMORY 时只在内存中，不落盘。
+
+    Returns:
+        元组 (定位到开头的文件对象, sha256 十六进制摘要, 实际使用的连接数)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        segments = _segment_count(expected_size, connections)
+        final_url = _probe_range_support(client, url, expected_size, headers) if segments > 1 else None
+        if final_url is not None:
+            # 按位置写入需要真实的文件描述符
+            spool.rollover()
+            spool.truncate(expected_size)
+            sha256 = _fetch_segments(client, final_url, spool.fileno(), expected_size=expected_size, segments=segments, headers=_headers_for_redirect(headers, url, final_url), debug=debug, on_progress=on_progress)
+            if sha256 is None:
+                spool.seek(0)
+                sha256 = _update_digest(hashlib.sha256(), spool).hexdigest()
+        else:
+            segments = 1
+            digest, _ = _stream_with_resume(client, url, spool, expected_size=expected_size, headers=headers, show_progress=show_progress, debug=debug, on_progress=on_progress)
+            sha256 = digest.hexdigest()
+        actual_size = spool.seek(0, os.SEEK_END)
+        if expected_size and actual_size != expected_size:
+            raise RuntimeError(f"下载大小不匹配: 期望 {expected_size:,} 字节，实际 {actual_size:,} 字节")
+        spool.seek(0)
+        return spool, sha256, segments
+    except BaseException:
+        spool.close()
+        raise
+
+CHECKSUM_ASSET_NAMES = ("sha256sums", "sha256sums.txt", "checksums.txt", "checksums.sha256")
+
+def _digest_source_label(digest_source: str) -> str:
+    if digest_source == "lock":
+        return f" {LOCK_REL_PATH} 记录的摘要"
+    if digest_source == "digest":
+        return "版本资源公布的摘要"
+    return f"校验和文件 {digest_source} 中的摘要"
+
+def _asset_digest(asset: dict) -> Tuple[Optional[str], Optional[str]]:
+    """返回版本资源自带的 "sha256:<十六进制>" digest 字段。
+
+    Returns:
+        元组 (sha256, "digest")；没有该字段时为 (None, None)
+    """
+    digest = (asset.get("digest") or "").strip().lower()
+    if digest.startswith("sha256:") and len(digest) == len("sha256:") + 64:
+        return digest[len("sha256:"):], "digest"
+    return None, None
+
+def _parse_checksums(text: str) -> dict:
+    """解析 sha256sum 格式(<摘要>  <文件名> 或 <摘要> *<文件名>)的校验和文件。"""
+    sums = {}
+    for line in text.splitlines():
+        parts = line.strip().split(None, 1)
+        if len(parts) == 2 and len(parts[0]) == 64:
+            sums[parts[1].strip().lstrip("*")] = parts[0].lower()
+    return sums
+
+def _checksums_asset_digest(client: httpx.Client | None, release_data: dict, filename: str, *, headers: dict | None = None, debug: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    """在同一版本中查找校验和资源(<资源名>.sha256、SHA256SUMS、checksums.txt 等)并读取 filename 的摘要。
+
+    校验和资源缺失、无法获取或没有列出该文件时返回 (None, None)，不阻止下载。
+
+    Returns:
+        元组 (sha256, 校验和资源名)
+    """
+    candidates = {a.get("name", "").lower(): a for a in release_data.get("assets", [])}
+    checksum_asset = candidates.get(f"{filename.lower()}.sha256") or next((candidates[n] for n in CHECKSUM_ASSET_NAMES if n in candidates), None)
+    if checksum_asset is None:
+        return None, None
+    name = checksum_asset["name"]
+    url = checksum_asset["browser_download_url"]
+    try:
+        if url.startswith("file:"):
+            text = _file_url_path(url).read_text(encoding="utf-8")
+        else:
+            response = get_request_scheduler().request(client, "GET", url, headers=headers, timeout=30)
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            text = response.text
+    except Exception as e:
+        if debug:
+            console.print(f"[yellow]无法获取校验和文件 {name}，跳过完整性校验:[/yellow] {e}")
+        return None, None
+    if name.lower() == f"{filename.lower()}.sha256":
+        token = (text.split() or [""])[0].lower()
+        return (token, name) if len(token) == 64 else (None, None)
+    sha256 = _parse_checksums(text).get(filename)
+    return (sha256, name) if sha256 else (None, None)
+
+def _read_local_asset(path: Path, part_path: Path | None, *, expected_size: int = 0, on_progress=None) -> Tuple[Path | IO[bytes], str]:
+    """读取本地镜像中的资源：提供 part_path 时复制到其所在目录的私有临时文件，否则直接打开只读文件。
+
+    复制不参与续传，因此不使用共享的 part_path 本身，并发的进程不会互相覆盖。
+
+    Returns:
+        元组 (复制得到的文件路径或已打开的文件对象, sha256 十六进制摘要)
+    """
+    actual_size = path.stat().st_size
+    if expected_size and actual_size != expected_size:
+        raise RuntimeError(f"镜像文件大小不匹配: {path}: 期望 {expected_size:,} 字节，实际 {actual_size:,} 字节")
+    digest = hashlib.sha256()
+    src = open(path, "rb")
+    try:
+        if part_path is None:
+            _update_digest(digest, src)
+            src.seek(0)
+            if on_progress is not None:
+                on_progress(None, actual_size, actual_size)
+            return src, digest.hexdigest()
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{part_path.name}.", dir=part_path.parent)
+        copy_path = Path(tmp_name)
+        done = 0
+        try:
+            with os.fdopen(fd, "wb") as dst:
+                for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                    dst.write(chunk)
+                    digest.update(chunk)
+                    done += len(chunk)
+                    if on_progress is not None:
+                        on_progress(None, done, actual_size)
+        except BaseException:
+            copy_path.unlink(missing_ok=True)
+            raise
+        src.close()
+        return copy_path, digest.hexdigest()
+    except BaseException:
+        src.close()
+        raise
+
+def _find_template_asset(assets: list, ai_assistant: str, script_type: str) -> Optional[dict]:
+    """返回版本资源中与 AI 助手和脚本类型匹配的模板 zip，没有时返回 None。"""
+    pattern = f"spec-kit-template-{ai_assistant}-{script_type}-zh"
+    for asset in assets:
+        if pattern in asset["name"] and asset["name"].endswith(".zip"):
+            return asset
+    return None
+
+def download_template_from_github(ai_assistant: str, download_dir: Path | None = None, *, script_type: str = "sh", verbose: bool = True, show_progress: bool = True, client: httpx.Client = None, debug: bool = False, github_token: str = None, cache: TemplateCache | None = None, release_ttl: float | None = None, connections: int = 1, release_tag: str | None = None, tracker: StepTracker | None = None, template_source: TemplateSource | None = None, lock: dict | None = None, central_directory_only: bool = False) -> Tuple[Path | IO[bytes], dict]:
+    """从模板来源(默认 GitHub，见 TemplateSource)获取最新版本(或 release_tag 指定的版本)中匹配的模板归档。
+
+    提供 tracker 时，下载进度报告到 "download" 步骤，分段下载时每个分段显示为它的子步骤。
+
+    提供 lock(.specify/lock.json 的内容)时使用锁定的版本：AI 助手、脚本类型与来源都一致时
+    直接使用锁文件中的资源 URL，不请求版本元数据；否则按锁定的 tag 解析。锁文件记录的
+    sha256 与下载或缓存的归档不一致时报错。
+
+    命中缓存时直接返回缓存中的路径；提供 cache 时下载到缓存；提供 download_dir 时
+    下载到该目录；两者都未提供时下载到内存中的临时文件并返回该文件对象(调用方负责关闭)。
+
+    central_directory_only 用于只读取归档中央目录的调用方(init --dry-run)：缓存未命中时不下载，
+    本地镜像直接打开原文件，服务器支持 Range 时返回按需请求的 _HttpRangeReader，
+    两者都不写磁盘；此时 metadata["sha256"] 只是公布的摘要(可能为 None)，没有经过校验。
+    服务器不支持 Range 时完整下载到内存中的临时文件，同样不存入缓存。
+    """
+    if template_source is None:
+        template_source = TemplateSource.parse()
+    if client is None and template_source.kind != "file":
+        client = get_http_client()
+
+    pattern = f"spec-kit-template-{ai_assistant}-{script_type}-zh"
+    if lock is not None and (lock.get("ai"), lock.get("script"), lock.get("source")) == (ai_assistant, script_type, str(template_source)) and lock.get("asset_url"):
+        # 锁文件与本次请求一致：直接使用锁定的资源，不请求版本元数据
+        release_name = lock["release"]
+        filename = lock["asset"]
+        download_url = lock["asset_url"]
+        file_size = lock.get("size", 0)
+        release_source = "lock"
+    else:
+        if lock is not None:
+            release_tag = lock["release"]
+        if verbose:
+            console.print("[cyan]正在获取最新版本信息...[/cyan]" if not release_tag else f"[cyan]正在获取版本 {release_tag} 的信息...[/cyan]")
+
+        try:
+            release_data, release_source = fetch_release(
+                client,
+                template_source,
+                tag=release_tag,
+                github_token=github_token,
+                ttl=release_ttl,
+                debug=debug,
+            )
+        except Exception as e:
+            metrics.fail("release_metadata")
+            console.print(f"[red]获取版本信息出错[/red]")
+            console.print(Panel(str(e), title="获取错误", border_style="red"))
+            raise CommandFailed(f"获取版本信息出错: {e}")
+
+        assets = release_data.get("assets", [])
+        asset = _find_template_asset(assets, ai_assistant, script_type)
+
+        if asset is None:
+            console.print(f"[red]未找到匹配的版本资源[/red],AI 助手为 [bold]{ai_assistant}[/bold] (期望模式: [bold]{pattern}[/bold])")
+            asset_names = [a.get('name', '?') for a in assets]
+            console.print(Panel("\n".join(asset_names) or "(无资源)", title="可用资源", border_style="yellow"))
+            raise CommandFailed(f"未找到匹配的版本资源: AI 助手 {ai_assistant}，期望模式 {pattern}；可用资源: {', '.join(asset_names) or '(无资源)'}")
+
+        release_name = release_data["tag_name"]
+        download_url = asset["browser_download_url"]
+        filename = asset["name"]
+        file_size = asset["size"]
+    metrics.inc("specify_release_metadata_requests_total", source=release_source)
+    # 预期摘要：锁文件记录的，或版本资源自带的 digest 字段(都不需要额外请求)
+    expected_sha256, digest_source = None, None
+    if lock is not None and lock.get("asset") == filename and lock.get("sha256"):
+        expected_sha256, digest_source = lock["sha256"], "lock"
+    elif release_source != "lock":
+        expected_sha256, digest_source = _asset_digest(asset)
+
+    if verbose:
+        if release_source == "stale":
+            console.print("[yellow]无法刷新版本信息，使用本地缓存的版本数据[/yellow]")
+        elif release_source == "lock":
+            console.print(f"[cyan]使用锁定的版本:[/cyan] {LOCK_REL_PATH}")
+        console.print(f"[cyan]已找到模板:[/cyan] {filename}")
+        console.print(f"[cyan]大小:[/cyan] {file_size:,} 字节")
+        console.print(f"[cyan]版本:[/cyan] {release_name}")
+
+    metadata = {
+        "filename": filename,
+        "size": file_size,
+        "release": release_name,
+        "asset_url": download_url,
+        "cached": False,  # 归档位于缓存中(命中或新存入)，调用方不应关闭/删除
+        "cache_hit": False,
+        "release_source": release_source,
+    }
+
+    part_path = None
+    if cache is not None:
+        entry = cache.lookup(release_name, filename)
+        metrics.inc("specify_template_cache_requests_total", result="hit" if entry else "miss")
+        if entry and expected_sha256 and entry["sha256"] != expected_sha256:
+            console.print(f"[red]缓存的模板与{_digest_source_label(digest_source)}不一致[/red]: {filename}")
+            console.print(f"[yellow]期望 {expected_sha256}，缓存为 {entry['sha256']}；上游可能替换了该版本的资源，可运行 specify cache verify 或使用 --no-cache[/yellow]")
+            raise CommandFailed(f"缓存的模板与{_digest_source_label(digest_source)}不一致: {filename}（期望 {expected_sha256}，缓存为 {entry['sha256']}）")
+        if entry:
+            if verbose:
+                console.print(f"[cyan]使用缓存的模板:[/cyan] {entry['path']}")
+            # 存入缓存时已计算过摘要，命中时不再读取归档
+            metadata.update(cached=True, cache_hit=True, sha256=entry["sha256"], verified=digest_source if expected_sha256 else entry.get("verified"))
+            return entry["path"], metadata
+    if central_directory_only:
+        metadata.update(sha256=expected_sha256, verified=None)
+        if download_url.startswith("file:"):
+            return open(_file_url_path(download_url), "rb"), metadata
+        headers = _github_auth_headers(github_token) if template_source.is_github else {}
+        final_url = _probe_range_support(client, download_url, file_size, headers)
+        if final_url is not None:
+            return _HttpRangeReader(client, final_url, file_size, headers=_headers_for_redirect(headers, download_url, final_url)), metadata
+    if cache is not None and not central_directory_only:
+        part_path = cache.partial_path(filename)
+    elif download_dir is not None:
+        part_path = download_dir / f"{filename}.part"
+    if verbose:
+        console.print(f"[cyan]正在下载模板...[/cyan]")
+
+    if tracker is not None:
+        tracker.start("download", filename)
+        segment_done = {}
+        segment_lock = threading.Lock()
+
+        def track_download(index: int | None, done: int, total: int) -> None:
+            if index is None:
+                tracker.progress("download", done, total)
+                return
+            child = f"download-{index + 1}"
+            tracker.add(child, f"分段 {index + 1}", parent="download")
+            tracker.progress(child, done, total)
+            if done >= total:
+                tracker.complete(child, _format_bytes(total))
+            with segment_lock:
+                segment_done[index] = done
+                overall = sum(segment_done.values())
+            tracker.progress("download", overall, file_size)
+
+        on_progress = track_download
+    else:
+        on_progress = None
+
+    headers = _github_auth_headers(github_token) if template_source.is_github else {}
+    if expected_sha256 is None and release_source != "lock":
+        expected_sha256, digest_source = _checksums_asset_digest(client, release_data, filename, headers=headers, debug=debug)
+    started = time.perf_counter()
+    try:
+        sha256, resumed_from, used_connections = None, 0, 1
+        if download_url.startswith("file:"):
+            # 本地镜像：按磁盘速度读取，不经过网络
+            source, sha256 = _read_local_asset(_file_url_path(download_url), part_path, expected_size=file_size, on_progress=on_progress)
+            if part_path is not None:
+                part_path = source
+        elif part_path is None:
+            source, sha256, used_connections = _download_to_spool(
+                client,
+                download_url,
+                expected_size=file_size,
+                connections=connections,
+                headers=headers,
+                show_progress=show_progress,
+                debug=debug,
+                on_progress=on_progress,
+            )
+        else:
+            if connections > 1:
+                segmented = _download_asset_segmented(
+                    client,
+                    download_url,
+                    part_path,
+                    expected_size=file_size,
+                    connections=connections,
+                    headers=headers,
+                    debug=debug,
+                    on_progress=on_progress,
+                )
+                if segmented is not None:
+                    sha256, part_path = segmented
+                    used_connections = _segment_count(file_size, connections)
+            if sha256 is None:
+                # 锁被其他进程持有时下载到私有临时文件：之后的存入缓存、校验失败清理都针对实际写入的文件
+                sha256, resumed_from, part_path = _download_asset(
+                    client,
+                    download_url,
+                    part_path,
+                    expected_size=file_size,
+                    headers=headers,
+                    show_progress=show_progress,
+                    debug=debug,
+                    on_progress=on_progress,
+                )
+    except Exception as e:
+        metrics.fail("download")
+        console.print(f"[red]下载模板出错[/red]")
+        console.print(Panel(str(e), title="下载错误", border_style="red"))
+        raise CommandFailed(f"下载模板出错: {e}")
+    if expected_sha256 and sha256 != expected_sha256:
+        metrics.fail("digest_mismatch")
+        if part_path is not None:
+            part_path.unlink(missing_ok=True)
+        else:
+            source.close()
+        console.print(f"[red]模板完整性校验失败[/red]: {filename} 与{_digest_source_label(digest_source)}不一致")
+        console.print(f"[yellow]期望 {expected_sha256}，实际 {sha256}；下载可能已损坏或被截断，或上游替换了该版本的资源[/yellow]")
+        raise CommandFailed(f"模板完整性校验失败: {filename} 与{_digest_source_label(digest_source)}不一致（期望 {expected_sha256}，实际 {sha256}）")
+    metadata["verified"] = digest_source if expected_sha256 else None
+    if verbose:
+        if connections > 1 and used_connections == 1:
+            console.print("[yellow]服务器不支持分段下载，已使用单连接下载[/yellow]")
+        if resumed_from:
+            console.print(f"[cyan]已从 {resumed_from:,} 字节处续传[/cyan]")
+        console.print(f"已下载: {filename}")
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    metadata["sha256"] = sha256
+    metadata["resumed_from"] = resumed_from
+    metadata["connections"] = used_connections
+    metadata["throughput"] = (file_size - resumed_from) / elapsed
+    metrics.inc("specify_download_bytes_total", file_size - resumed_from)
+    if verbose:
+        console.print(f"[cyan]下载速度:[/cyan] {_format_bytes(int(metadata['throughput']))}/s ({used_connections} 个连接)")
+    if cache is not None and part_path is not None:
+        entry = cache.store(metadata["release"], filename, part_path, metadata["sha256"], asset_url=download_url, verified=metadata["verified"])
+        source = entry["path"]
+        metadata["cached"] = True
+    elif part_path is not None:
+        source = download_dir / filename
+        os.replace(part_path, source)
+    return source, metadata
+
+class PrefetchCancelled(Exception):
+    """预取的目标已改变，中止当前的后台下载。"""
+
+class TemplatePrefetcher:
+    """在 init 的交互式选择期间，于后台线程预取版本元数据和最可能被选中的模板归档。
+
+    预取的归档直接存入模板缓存，正式下载时按缓存命中处理；版本元数据写入磁盘缓存，
+    TTL 内不再请求 API。预取与正式下载共用进程内的 httpx 客户端，连接池中已完成
+    TLS 握手的连接会被复用。选择与预取目标不同时，正在进行的下载在下一块数据处中止
+    (有 ETag 的部分文件保留，之后可续传)，并切换到新目标。
+
+    Args:
+        client: httpx 客户端
+        cache: 预取的归档存入的模板缓存
+        template_source: 模板来源
+        release_tag: 指定的版本标签(None 表示最新版本)
+        lock: .specify/lock.json 的内容，与目标一致时直接使用锁定的资源
+        github_token: GitHub token
+        release_ttl: 版本元数据缓存的有效期
+        connections: 下载归档的并发连接数(与 init 的 --download-connections 一致)
+    """
+
+    def __init__(self, client: httpx.Client, cache: TemplateCache, *, template_source: TemplateSource, release_tag: str | None = None, lock: dict | None = None, github_token: str | None = None, release_ttl: float | None = None, connections: int = 1):
+        self.client = client
+        self.cache = cache
+        self.template_source = template_source
+        self.release_tag = release_tag
+        self.lock = lock
+        self.github_token = github_token
+        self.release_ttl = release_ttl
+        self.connections = connections
+        self.on_progress = None
+        self._release_data = None
+        self._target = None  # (ai, script)
+        self._busy = None
+        self._tried = set()  # 已完成预取尝试的目标(不含被中止的)
+        self._done = set()  # 其中归档已放入缓存的目标
+        self._closed = False
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="specify-prefetch", daemon=True)
+
+    def start(self, ai_assistant: str, script_type: str) -> None:
+        """以 (ai_assistant, script_type) 为目标启动后台线程。"""
+        self._target = (ai_assistant, script_type)
+        self._thread.start()
+
+    def retarget(self, ai_assistant: str, script_type: str) -> None:
+        """切换预取目标；与正在下载的目标不同时中止该下载。"""
+        with self._cond:
+            target = (ai_assistant, script_type)
+            if target == self._target:
+                return
+            self._target = target
+            if self._busy is not None and self._busy != target:
+                self._cancel.set()
+            self._cond.notify_all()
+
+    def finish(self, ai_assistant: str, script_type: str, on_progress=None) -> bool:
+        """选择已确定：等待匹配的预取完成(不匹配的下载被中止)，之后不再预取。
+
+        Args:
+            on_progress: 等待期间转发下载进度的回调，签名同 _download_asset 的 on_progress
+
+        Returns:
+            匹配的归档是否已由预取放入缓存
+        """
+        self.on_progress = on_progress
+        self.retarget(ai_assistant, script_type)
+        target = (ai_assistant, script_type)
+        with self._cond:
+            self._cond.wait_for(lambda: target in self._tried or not self._thread.is_alive())
+            self._closed = True
+            self._cond.notify_all()
+            return target in self._done
+
+    def close(self) -> None:
+        """中止预取并等待后台线程退出(释放部分文件的下载锁)。"""
+        with self._cond:
+            self._closed = True
+            if self._busy is not None:
+                self._cancel.set()
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._target not in self._tried)
+                if self._closed:
+                    return
+                target = self._busy = self._target
+                self._cancel.clear()
+            prefetched = cancelled = False
+            try:
+                prefetched = self._prefetch(*target)
+            except PrefetchCancelled:
+                cancelled = True
+            except Exception:
+                # 预取失败不影响正式下载，由它报告错误
+                return
+            finally:
+                with self._cond:
+                    self._busy = None
+                    if not cancelled:
+                        self._tried.add(target)
+                    if prefetched:
+                        self._done.add(target)
+                    self._cond.notify_all()
+
+    def _progress(self, index: int | None, done: int, total: int) -> None:
+        if self._cancel.is_set():
+            raise PrefetchCancelled()
+        callback = self.on_progress
+        if callback is not None:
+            callback(index, done, total)
+
+    def _prefetch(self, ai_assistant: str, script_type: str) -> bool:
+        """把目标对应的归档放入缓存；找不到匹配的资源或摘要不一致时返回 False。"""
+        lock = self.lock
+        if lock is not None and (lock.get("ai"), lock.get("script"), lock.get("source")) == (ai_assistant, script_type, str(self.template_source)) and lock.get("asset_url"):
+            release = lock["release"]
+            asset = {"name": lock["asset"], "size": lock.get("size", 0), "browser_download_url": lock["asset_url"]}
+            expected_sha256, digest_source = lock.get("sha256"), "lock"
+        else:
+            if self._release_data is None:
+                tag = lock["release"] if lock is not None else self.release_tag
+                self._release_data, _ = fetch_release(self.client, self.template_source, tag=tag, github_token=self.github_token, ttl=self.release_ttl)
+            release = self._release_data["tag_name"]
+            asset = _find_template_asset(self._release_data.get("assets", []), ai_assistant, script_type)
+            if asset is None:
+                return False
+            expected_sha256, digest_source = _asset_digest(asset)
+        if self.cache.lookup(release, asset["name"]):
+            return True
+
+        headers = _github_auth_headers(self.github_token) if self.template_source.is_github else {}
+        if expected_sha256 is None and digest_source != "lock":
+            expected_sha256, digest_source = _checksums_asset_digest(self.client, self._release_data, asset["name"], headers=headers)
+        url = asset["browser_download_url"]
+        part_path = self.cache.partial_path(asset["name"])
+        segmented = None
+        if self.connections > 1:
+            segmented = _download_asset_segmented(self.client, url, part_path, expected_size=asset["size"], connections=self.connections, headers=headers, on_progress=self._progress)
+        if segmented is not None:
+            sha256, part_path = segmented
+        else:
+            # 与正式下载相同：锁被其他进程持有时写入的是私有临时文件，存入缓存的必须是它
+            sha256, _, part_path = _download_asset(self.client, url, part_path, expected_size=asset["size"], headers=headers, on_progress=self._progress)
+        if expected_sha256 and sha256 != expected_sha256:
+            part_path.unlink(missing_ok=True)
+            return False
+        self.cache.store(release, asset["name"], part_path, sha256, asset_url=url, verified=digest_source if expected_sha256 else None)
+        return True
+
+MATERIALIZE_CHOICES = {
+    "copy": "从归档解压(默认)",
+    "reflink": "从缓存目录树写时复制(不支持时回退为复制)",
+    "hardlink": "从缓存目录树创建硬链接(跨文件系统时回退为复制)",
+}
+
+def _break_hardlink(path: Path) -> None:
+    """如果 path 有多个硬链接，用内容相同的独立副本替换它。"""
+    try:
+        if path.is_symlink() or path.stat().st_nlink <= 1:
+            return
+    except FileNotFoundError:
+        return
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    os.close(fd)
+    try:
+        shutil.copy2(path, tmp_name)
+        # 共享的 inode 来自只读的缓存目录树，独立副本需要可写
+        os.chmod(tmp_name, _writable_mode(stat.S_IMODE(os.stat(tmp_name).st_mode)))
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def _clone_file(src: Path, dst: Path) -> bool:
+    """复制文件内容，优先使用 reflink(FICLONE)或 os.copy_file_range。
+
+    Returns:
+        是否使用了写时复制/内核内复制(False 表示退化为普通复制)
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if sys.platform.startswith("linux"):
+            try:
+                import fcntl
+                fcntl.ioctl(fdst.fileno(), 0x40049409, fsrc.fileno())  # FICLONE
+                return True
+            except (ImportError, OSError):
+                pass
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return True
+            except OSError:
+                pass
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        return False
+
+# 模板中预期由用户或斜杠命令就地编辑的文件，--materialize hardlink 时也使用独立副本
+EDITABLE_TEMPLATE_PREFIXES = (".specify/memory/", ".specify/templates/")
+
+def materialize_template_tree(tree: Path, dest: Path, *, method: str = "reflink", verbose: bool = False, tracker: StepTracker | None = None, atomic: bool = False) -> dict:
+    """用缓存中已解压的目录树填充 dest，而不是再次解压归档。
+
+    method 为 "hardlink" 时创建硬链接(失败时，例如跨文件系统，改为复制)，为 "reflink"
+    时使用写时复制。需要合并的文件(如 .vscode/settings.json)以及用户预期会编辑的文件
+    (EDITABLE_TEMPLATE_PREFIXES，如 .specify/memory/constitution.md)始终使用可写的独立副本；
+    硬链接的文件与缓存目录树共享只读的 inode，就地写入会失败而不是改动缓存。
+    atomic 为 True 时，覆盖现有文件前先在同目录临时名称上创建新文件，再用 os.replace 替换。
+
+    Returns:
+        各动作的文件数 {"create", "overwrite", "merge", "linked", "cloned", "copied"}
+    """
+    counts = {"create": 0, "overwrite": 0, "merge": 0, "linked": 0, "cloned": 0, "copied": 0}
+    use_links = method == "hardlink"
+    for root, _dirs, files in os.walk(tree):
+        root_path = Path(root)
+        rel_root = root_path.relative_to(tree)
+        (dest / rel_root).mkdir(parents=True, exist_ok=True)
+        for name in files:
+            src = root_path / name
+            rel = (rel_root / name).as_posix()
+            target = dest / rel
+            exists = target.exists() or target.is_symlink()
+
+            if rel in MERGE_JSON_PATHS:
+                if exists:
+                    # handle_vscode_settings 通过 os.replace 写入，不会改动共享的 inode
+                    handle_vscode_settings(src.read_bytes(), target, rel, verbose, tracker)
+                    counts["merge"] += 1
+                else:
+                    shutil.copy2(src, target)
+                    os.chmod(target, _writable_mode(stat.S_IMODE(src.stat().st_mode)))
+                    counts["create"] += 1
+                    counts["copied"] += 1
+                continue
+
+            if exists:
+                if verbose and not tracker:
+                    console.print(f"[yellow]正在覆盖文件:[/yellow] {rel}")
+                counts["overwrite"] += 1
+            else:
+                counts["create"] += 1
+
+            write_path = target
+            if atomic and exists:
+                write_path = target.with_name(f".{name}.{os.getpid()}.specify-tmp")
+                write_path.unlink(missing_ok=True)
+            elif exists:
+                target.unlink()
+
+            kind = None
+            if use_links and not rel.startswith(EDITABLE_TEMPLATE_PREFIXES):
+                try:
+                    os.link(src, write_path)
+                    kind = "linked"
+                except OSError:
+                    # 跨文件系统(EXDEV)或不支持硬链接：其余文件改为复制
+                    use_links = False
+            if kind is None:
+                kind = "cloned" if _clone_file(src, write_path) else "copied"
+                os.chmod(write_path, _writable_mode(stat.S_IMODE(src.stat().st_mode)))
+            if write_path != target:
+                os.replace(write_path, target)
+            counts[kind] += 1
+    return counts
+
+def download_and_extract_template(project_path: Path, ai_assistant: str, script_type: str, is_current_dir: bool = False, *, verbose: bool = True, tracker: StepTracker | None = None, client: httpx.Client = None, debug: bool = False, github_token: str = None, cache: TemplateCache | None = None, release_ttl: float | None = None, connections: int = 1, materialize: str = "copy", template_source: TemplateSource | None = None, release_tag: str | None = None, lock: dict | None = None, pin: bool = False) -> Path:
+    """下载最新版本(或 release_tag / lock 锁定的版本)并解压以创建新项目。
+    返回 project_path。如果提供了 tracker，则使用它（使用的键：fetch, download, extract, cleanup）
+    如果提供了 cache，则优先复用缓存的归档，并将新下载的归档保存到缓存中；
+    否则归档只保存在内存中的临时文件里，不会写入当前目录。
+    materialize 为 "reflink" 或 "hardlink" 且归档已缓存时，从缓存中已解压的目录树填充项目。
+    pin 为 True 时在安装清单旁写入 .specify/lock.json。
+    """
+    if template_source is None:
+        template_source = TemplateSource.parse()
+    if tracker:
+        if lock is not None:
+            tracker.start("fetch", f"使用锁定的版本 {lock['release']}")
+        else:
+            tracker.start("fetch", "正在连接 GitHub API" if template_source.is_github else f"正在读取镜像 {template_source}")
+    try:
+        zip_source, meta = download_template_from_github(
+            ai_assistant,
+            None,
+            script_type=script_type,
             verbose=verbose and tracker is None,
             show_progress=(tracker is None),
             client=client,
             debug=debug,
-            github_token=github_token
+            github_token=github_token,
+            cache=cache,
+            release_ttl=release_ttl,
+            connections=connections,
+            tracker=tracker,
+            template_source=template_source,
+            release_tag=release_tag,
+            lock=lock,
         )
         if tracker:
-            tracker.complete("fetch", f"版本 {meta['release']} ({meta['size']:,} 字节)")
+            source_note = {"ttl": ", 本地缓存", "not-modified": ", 未变更", "stale": ", 旧缓存", "local": ", 本地镜像", "lock": ", 锁文件"}.get(meta.get("release_source"), "")
+            if "throughput" in meta:
+                source_note += f", {_format_bytes(int(meta['throughput']))}/s × {meta['connections']}"
+            tracker.complete("fetch", f"版本 {meta['release']} ({meta['size']:,} 字节{source_note})")
             tracker.add("download", "下载模板")
-            tracker.complete("download", meta['filename'])
+            tracker.complete("download", meta['filename'] + (" (缓存)" if meta.get("cache_hit") else "") + (" ✓ SHA-256" if meta.get("verified") else ""))
     except Exception as e:
         if tracker:
             tracker.error("fetch", str(e))
@@ -787,87 +3256,76 @@ def download_and_extract_template(project_path: Path, ai_assistant: str, script_
 
     try:
         if not is_current_dir:
-            project_path.mkdir(parents=True)
-
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_contents = zip_ref.namelist()
+            project_path.mkdir(parents=True, exist_ok=True)
+
+        if materialize != "copy" and meta.get("cached") and cache is not None:
+            tree = cache.unpacked_tree(meta["sha256"])
+            counts = materialize_template_tree(tree, project_path, method=materialize, verbose=verbose, tracker=tracker, atomic=is_current_dir)
+            # 目录树创建时已记录各文件的哈希，填充项目只需读取元数据
+            counts["files"] = {rel: {"sha256": entry["sha256"], "size": entry["size"]} for rel, entry in cache.tree_files(meta["sha256"]).items()}
+            link_summary = ", ".join(f"{counts[kind]} {label}" for kind, label in (("linked", "硬链接"), ("cloned", "克隆"), ("copied", "复制")) if counts[kind])
             if tracker:
-                tracker.start("zip-list")
-                tracker.complete("zip-list", f"{len(zip_contents)} 项")
+                tracker.skip("zip-list", "使用缓存目录树")
+                tracker.skip("chmod", "沿用缓存中的权限")
+                tracker.start("extract", link_summary)
             elif verbose:
-                console.print(f"[cyan]ZIP 包含 {len(zip_contents)} 项[/cyan]")
-
-            if is_current_dir:
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    temp_path = Path(temp_dir)
-                    zip_ref.extractall(temp_path)
-
-                    extracted_items = list(temp_path.iterdir())
-                    if tracker:
-                        tracker.start("extracted-summary")
-                        tracker.complete("extracted-summary", f"临时 {len(extracted_items)} 项")
-                    elif verbose:
-                        console.print(f"[cyan]已解压 {len(extracted_items)} 项到临时位置[/cyan]")
-
-                    source_dir = temp_path
-                    if len(extracted_items) == 1 and extracted_items[0].is_dir():
-                        source_dir = extracted_items[0]
-                        if tracker:
-                            tracker.add("flatten", "展平嵌套目录")
-                            tracker.complete("flatten")
-                        elif verbose:
-                            console.print(f"[cyan]发现嵌套目录结构[/cyan]")
-
-                    for item in source_dir.iterdir():
-                        dest_path = project_path / item.name
-                        if item.is_dir():
-                            if dest_path.exists():
-                                if verbose and not tracker:
-                                    console.print(f"[yellow]正在合并目录:[/yellow] {item.name}")
-                                for sub_item in item.rglob('*'):
-                                    if sub_item.is_file():
-                                        rel_path = sub_item.relative_to(item)
-                                        dest_file = dest_path / rel_path
-                                        dest_file.parent.mkdir(parents=True, exist_ok=True)
-                                        # .vscode/settings.json 特殊处理 - 合并而不是覆盖
-                                        if dest_file.name == "settings.json" and dest_file.parent.name == ".vscode":
-                                            handle_vscode_settings(sub_item, dest_file, rel_path, verbose, tracker)
-                                        else:
-                                            shutil.copy2(sub_item, dest_file)
-                            else:
-                                shutil.copytree(item, dest_path)
-                        else:
-                            if dest_path.exists() and verbose and not tracker:
-                                console.print(f"[yellow]正在覆盖文件:[/yellow] {item.name}")
-                            shutil.copy2(item, dest_path)
-                    if verbose and not tracker:
-                        console.print(f"[cyan]模板文件已合并到当前目录[/cyan]")
-            else:
-                zip_ref.extractall(project_path)
-
-                extracted_items = list(project_path.iterdir())
+                console.print(f"[cyan]从缓存目录树填充项目:[/cyan] {link_summary}")
+            failures = []
+        else:
+            with zipfile.ZipFile(zip_source, 'r') as zip_ref:
+                zip_contents = zip_ref.namelist()
                 if tracker:
-                    tracker.start("extracted-summary")
-                    tracker.complete("extracted-summary", f"{len(extracted_items)} 项顶层项")
+                    tracker.start("zip-list")
+                    tracker.complete("zip-list", f"{len(zip_contents)} 项")
                 elif verbose:
-                    console.print(f"[cyan]已解压 {len(extracted_items)} 项到 {project_path}:[/cyan]")
-                    for item in extracted_items:
-                        console.print(f"  - {item.name} ({'目录' if item.is_dir() else '文件'})")
-
-                if len(extracted_items) == 1 and extracted_items[0].is_dir():
-                    nested_dir = extracted_items[0]
-                    temp_move_dir = project_path.parent / f"{project_path.name}_temp"
-
-                    shutil.move(str(nested_dir), str(temp_move_dir))
+                    console.print(f"[cyan]ZIP 包含 {len(zip_contents)} 项[/cyan]")
 
-                    project_path.rmdir()
-
-                    shutil.move(str(temp_move_dir), str(project_path))
+                prefix = _archive_prefix(zip_ref.infolist())
+                if prefix:
                     if tracker:
                         tracker.add("flatten", "展平嵌套目录")
-                        tracker.complete("flatten")
+                        tracker.complete("flatten", prefix)
                     elif verbose:
-                        console.print(f"[cyan]已展平嵌套目录结构[/cyan]")
+                        console.print(f"[cyan]发现嵌套目录结构:[/cyan] {prefix}")
+
+                counts = extract_template_archive(zip_ref, project_path, prefix=prefix, verbose=verbose, tracker=tracker, atomic=is_current_dir)
+            failures = counts["chmod_failures"]
+            if tracker:
+                if os.name == "nt":
+                    tracker.skip("chmod", "Windows")
+                else:
+                    detail = f"{counts['chmod']} 已更新" + (f", {len(failures)} 失败" if failures else "")
+                    (tracker.error if failures else tracker.complete)("chmod", detail)
+            elif verbose:
+                if counts["chmod"]:
+                    console.print(f"[cyan]更新了 {counts['chmod']} 个脚本的执行权限[/cyan]")
+                if failures:
+                    console.print("[yellow]某些脚本无法更新:[/yellow]")
+                    for f in failures:
+                        console.print(f"  - {f}")
+
+        summary = ", ".join(f"{counts[action]} {label}" for action, label in (("create", "新建"), ("overwrite", "覆盖"), ("merge", "合并")) if counts[action])
+        if tracker:
+            tracker.start("extracted-summary")
+            tracker.complete("extracted-summary", summary or "无文件")
+        elif verbose:
+            console.print(f"[cyan]已解压到 {project_path}:[/cyan] {summary or '无文件'}")
+
+        if tracker:
+            tracker.add("manifest", "写入安装清单")
+            tracker.start("manifest")
+        files = counts["files"]
+        for rel, entry in files.items():
+            # 合并过的 JSON 与模板内容不同，不记录 mtime
+            if rel not in MERGE_JSON_PATHS:
+                _stamp_manifest_entry(project_path / rel, entry)
+        write_install_manifest(project_path, files, release=meta["release"], asset=meta["filename"], ai_assistant=ai_assistant, script_type=script_type, sha256=meta.get("sha256"))
+        if pin:
+            write_template_lock(project_path, meta, ai_assistant=ai_assistant, script_type=script_type, source=template_source)
+        if tracker:
+            tracker.complete("manifest", f"{len(files)} 个文件" + (f", 已锁定 {meta['release']}" if pin else ""))
+        elif verbose:
+            console.print(f"[cyan]已写入安装清单:[/cyan] {MANIFEST_REL_PATH}")
 
     except Exception as e:
         if tracker:
@@ -880,7 +3338,7 @@ def download_and_extract_template(project_path: Path, ai_assistant: str, script_
 
         if not is_current_dir and project_path.exists():
             shutil.rmtree(project_path)
-        raise typer.Exit(1)
+        raise CommandFailed(f"解压模板出错: {e}")
     else:
         if tracker:
             tracker.complete("extract")
@@ -888,62 +3346,522 @@ def download_and_extract_template(project_path: Path, ai_assistant: str, script_
         if tracker:
             tracker.add("cleanup", "删除临时存档")
 
-        if zip_path.exists():
-            zip_path.unlink()
+        if meta.get("cached"):
+            if tracker:
+                tracker.skip("cleanup", "归档保留在缓存中")
+        else:
+            zip_source.close()
             if tracker:
-                tracker.complete("cleanup")
+                tracker.complete("cleanup", "已释放临时归档")
             elif verbose:
-                console.print(f"已清理: {zip_path.name}")
+                console.print(f"已清理: {meta['filename']}")
 
     return project_path
 
 
-def ensure_executable_scripts(project_path: Path, tracker: StepTracker | None = None) -> None:
-    """确保 .specify/scripts 下的 POSIX .sh 脚本（递归）具有执行位（Windows 上无操作）。"""
-    if os.name == "nt":
-        return  # Windows：静默跳过
-    scripts_root = project_path / ".specify" / "scripts"
-    if not scripts_root.is_dir():
-        return
-    failures: list[str] = []
-    updated = 0
-    for script in scripts_root.rglob("*.sh"):
+# 解压时与现有内容做 JSON 合并而不是覆盖的文件
+MERGE_JSON_PATHS = {".vscode/settings.json"}
+
+def _archive_prefix(infos: list[zipfile.ZipInfo]) -> str:
+    """如果归档中所有条目都位于同一个顶层目录下，返回该目录前缀(如 "pkg/")，否则返回空字符串。"""
+    tops = set()
+    for info in infos:
+        head, sep, _ = info.filename.partition("/")
+        if not sep:
+            return ""
+        tops.add(head)
+        if len(tops) > 1:
+            return ""
+    return f"{tops.pop()}/" if tops else ""
+
+def _safe_relative_path(name: str) -> Optional[str]:
+    """规范化归档内的相对路径；拒绝绝对路径和包含 .. 的路径。"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        return None
+    return "/".join(parts)
+
+def plan_template_extraction(infos: list[zipfile.ZipInfo], dest: Path, *, prefix: str = "") -> list[dict]:
+    """为每个文件条目决定解压动作，不读取条目内容。
+
+    Returns:
+        字典列表 {info, path, target, action, existing_size}，action 为 create、overwrite 或 merge，
+        existing_size 为目标文件现有大小(不存在时为 None)
+    """
+    plan = []
+    for info in infos:
+        if info.is_dir():
+            continue
+        rel = _safe_relative_path(info.filename[len(prefix):] if info.filename.startswith(prefix) else info.filename)
+        if rel is None:
+            raise RuntimeError(f"归档包含不安全的路径: {info.filename}")
+        target = dest / rel
         try:
-            if script.is_symlink() or not script.is_file():
-                continue
+            existing_size = target.stat().st_size
+        except (FileNotFoundError, NotADirectoryError):
+            existing_size = None
+        if existing_size is None:
+            action = "create"
+        elif rel in MERGE_JSON_PATHS:
+            action = "merge"
+        else:
+            action = "overwrite"
+        plan.append({"info": info, "path": rel, "target": target, "action": action, "existing_size": existing_size})
+    return plan
+
+def _json_merge_diff(existing: dict, new: dict, prefix: str = "") -> dict:
+    """按 merge_json_files 的深度合并语义比较两个 JSON 对象，返回新增、修改和未变的键路径。"""
+    diff = {"added": [], "changed": [], "unchanged": []}
+    for key, value in new.items():
+        path = f"{prefix}{key}"
+        if key in existing and isinstance(existing[key], dict) and isinstance(value, dict):
+            nested = _json_merge_diff(existing[key], value, f"{path}.")
+            for kind in diff:
+                diff[kind].extend(nested[kind])
+        elif key not in existing:
+            diff["added"].append(path)
+        elif existing[key] != value:
+            diff["changed"].append(path)
+        else:
+            diff["unchanged"].append(path)
+    return diff
+
+def build_init_plan(zip_ref: zipfile.ZipFile, dest: Path) -> dict:
+    """只读取归档中央目录和目标路径的 stat 结果，生成 init 将执行的文件操作计划。
+
+    需要合并的 JSON 文件会额外读取归档条目和现有文件，给出合并差异摘要。
+    """
+    infos = zip_ref.infolist()
+    prefix = _archive_prefix(infos)
+    summary = {action: {"files": 0, "bytes": 0} for action in ("create", "overwrite", "merge")}
+    files = []
+    merges = {}
+    for item in plan_template_extraction(infos, dest, prefix=prefix):
+        entry = {"path": item["path"], "action": item["action"], "bytes": item["info"].file_size}
+        if item["existing_size"] is not None:
+            entry["existing_bytes"] = item["existing_size"]
+        if item["action"] == "merge":
             try:
-                with script.open("rb") as f:
-                    if f.read(2) != b"#!":
-                        continue
-            except Exception:
-                continue
-            st = script.stat(); mode = st.st_mode
-            if mode & 0o111:
-                continue
-            new_mode = mode
-            if mode & 0o400: new_mode |= 0o100
-            if mode & 0o040: new_mode |= 0o010
-            if mode & 0o004: new_mode |= 0o001
-            if not (new_mode & 0o100):
-                new_mode |= 0o100
-            os.chmod(script, new_mode)
-            updated += 1
-        except Exception as e:
-            failures.append(f"{script.relative_to(scripts_root)}: {e}")
-    if tracker:
-        detail = f"{updated} 已更新" + (f", {len(failures)} 失败" if failures else "")
-        tracker.add("chmod", "递归设置脚本权限")
-        (tracker.error if failures else tracker.complete)("chmod", detail)
-    else:
-        if updated:
-            console.print(f"[cyan]递归更新了 {updated} 个脚本的执行权限[/cyan]")
-        if failures:
-            console.print("[yellow]某些脚本无法更新:[/yellow]")
-            for f in failures:
-                console.print(f"  - {f}")
+                new_content = json.loads(zip_ref.read(item["info"]).decode("utf-8"))
+                try:
+                    with open(item["target"], "r", encoding="utf-8") as f:
+                        existing_content = json.load(f)
+                except json.JSONDecodeError:
+                    # merge_json_files 对无效的现有文件直接使用新内容
+                    existing_content = None
+                if isinstance(existing_content, dict):
+                    merges[item["path"]] = _json_merge_diff(existing_content, new_content)
+                else:
+                    merges[item["path"]] = {"replaced": True}
+            except (OSError, ValueError) as e:
+                merges[item["path"]] = {"error": str(e)}
+        summary[item["action"]]["files"] += 1
+        summary[item["action"]]["bytes"] += item["info"].file_size
+        files.append(entry)
+    return {"project": str(dest), "prefix": prefix, "summary": summary, "files": files, "merges": merges}
+
+def _zip_entry_mode(info: zipfile.ZipInfo) -> int:
+    """返回条目记录的 Unix 权限位；非 Unix 创建或非普通文件时返回 0。"""
+    if info.create_system != 3:
+        return 0
+    mode = info.external_attr >> 16
+    file_type = stat.S_IFMT(mode)
+    if file_type and file_type != stat.S_IFREG:
+        return 0
+    return stat.S_IMODE(mode)
+
+def _needs_exec_bit(rel: str, info: zipfile.ZipInfo, head: bytes) -> bool:
+    """条目是否应设置执行位：归档中记录了执行位，或为 .specify/scripts 下带 shebang 的 .sh 脚本。"""
+    if _zip_entry_mode(info) & 0o111:
+        return True
+    return rel.startswith(".specify/scripts/") and rel.endswith(".sh") and head.startswith(b"#!")
+
+def _with_exec_bits(mode: int) -> int:
+    """为每个可读的权限类别加上对应的执行位(所有者始终可执行)。"""
+    new_mode = mode
+    if mode & 0o400: new_mode |= 0o100
+    if mode & 0o040: new_mode |= 0o010
+    if mode & 0o004: new_mode |= 0o001
+    return new_mode | 0o100
+
+def extract_template_archive(zip_ref: zipfile.ZipFile, dest: Path, *, prefix: str = "", verbose: bool = False, tracker: StepTracker | None = None, atomic: bool = False) -> dict:
+    """单次遍历 infolist() 将模板解压到 dest，去除 prefix，并按条目新建、覆盖或合并 JSON。
+
+    每个文件只写入一次，不会创建临时目录或重命名目录。在写入每个文件时根据 ZipInfo 中的
+    Unix 权限位(或 .specify/scripts 下 .sh 脚本的 shebang)直接设置执行位(Windows 上跳过)。
+    atomic 为 True 时(合并到现有目录)，每个文件先写入同目录临时文件再 os.replace，
+    中断时不会留下写了一半的文件。
+
+    写入时同时计算每个文件的 SHA-256，安装清单不需要再读一遍归档。
+
+    Returns:
+        各动作的文件数 {"create": n, "overwrite": n, "merge": n, "chmod": n}，
+        设置执行位失败的条目列表 "chmod_failures"，以及模板中每个文件的
+        {"sha256", "size"}(键为去除 prefix 后的相对路径) "files"
+    """
+    counts = {"create": 0, "overwrite": 0, "merge": 0, "chmod": 0, "chmod_failures": [], "files": {}}
+    set_exec = os.name != "nt"
+    if set_exec:
+        umask = os.umask(0)
+        os.umask(umask)
+        default_mode = 0o666 & ~umask
+    infos = zip_ref.infolist()
+    for info in infos:
+        if info.is_dir():
+            rel = _safe_relative_path(info.filename[len(prefix):])
+            if rel:
+                (dest / rel).mkdir(parents=True, exist_ok=True)
+
+    plan = plan_template_extraction(infos, dest, prefix=prefix)
+    for position, item in enumerate(plan, 1):
+        target = item["target"]
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if item["action"] == "overwrite" and not atomic:
+            # 目标可能是指向缓存目录树的硬链接，就地写入会改动缓存
+            _break_hardlink(target)
+        if item["action"] == "merge":
+            data = zip_ref.read(item["info"])
+            counts["files"][item["path"]] = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+            handle_vscode_settings(data, target, item["path"], verbose, tracker)
+        else:
+            if item["action"] == "overwrite" and verbose and not tracker:
+                console.print(f"[yellow]正在覆盖文件:[/yellow] {item['path']}")
+            write_path = target
+            if atomic:
+                fd, tmp_name = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=target.parent)
+                os.close(fd)
+                write_path = Path(tmp_name)
+            try:
+                with zip_ref.open(item["info"]) as src, open(write_path, "wb") as dst:
+                    head = src.read(1024 * 1024)
+                    digest = hashlib.sha256(head)
+                    dst.write(head)
+                    for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                        dst.write(chunk)
+                counts["files"][item["path"]] = {"sha256": digest.hexdigest(), "size": item["info"].file_size}
+                if atomic:
+                    if item["action"] == "overwrite":
+                        mode = stat.S_IMODE(target.stat().st_mode)
+                        # 硬链接到只读缓存目录树的文件被替换为可写的独立文件
+                        os.chmod(write_path, mode if mode & 0o200 else _writable_mode(mode))
+                    else:
+                        os.chmod(write_path, default_mode if set_exec else 0o666)
+            except BaseException:
+                if atomic:
+                    write_path.unlink(missing_ok=True)
+                raise
+            if set_exec and _needs_exec_bit(item["path"], item["info"], head):
+                try:
+                    base_mode = default_mode if item["action"] == "create" else stat.S_IMODE(write_path.stat().st_mode)
+                    os.chmod(write_path, _with_exec_bits(base_mode))
+                    counts["chmod"] += 1
+                except OSError as e:
+                    counts["chmod_failures"].append(f"{item['path']}: {e}")
+            if atomic:
+                os.replace(write_path, target)
+        counts[item["action"]] += 1
+        if tracker:
+            tracker.progress("extract", position, len(plan))
+    return counts
+
+# 记录安装的模板版本及每个文件内容哈希的清单，供 specify upgrade 增量更新
+MANIFEST_REL_PATH = ".specify/manifest.json"
+LOCK_REL_PATH = ".specify/lock.json"
+
+def _archive_file_hashes(zip_ref: zipfile.ZipFile, prefix: str = "") -> dict:
+    """计算归档中每个文件(去除 prefix 后)的 SHA-256 和大小。"""
+    files = {}
+    for info in zip_ref.infolist():
+        if info.is_dir():
+            continue
+        rel = _safe_relative_path(info.filename[len(prefix):] if info.filename.startswith(prefix) else info.filename)
+        if rel is None:
+            raise RuntimeError(f"归档包含不安全的路径: {info.filename}")
+        with zip_ref.open(info) as f:
+            files[rel] = {"sha256": _update_digest(hashlib.sha256(), f).hexdigest(), "size": info.file_size}
+    return files
+
+def _stamp_manifest_entry(path: Path, entry: dict) -> dict:
+    """记录文件当前的 mtime，之后只需一次 stat 即可确认文件未被修改。"""
+    try:
+        entry["mtime_ns"] = path.stat().st_mtime_ns
+    except OSError:
+        entry.pop("mtime_ns", None)
+    return entry
+
+def read_install_manifest(project_path: Path) -> Optional[dict]:
+    """读取项目的安装清单；不存在或无效时返回 None。"""
+    try:
+        with open(project_path / MANIFEST_REL_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict):
+        return None
+    return manifest
+
+def write_install_manifest(project_path: Path, files: dict, *, release: str, asset: str, ai_assistant: str, script_type: str, sha256: str | None = None) -> None:
+    """写入 .specify/manifest.json。
+
+    files 的每一项记录模板中该文件的 sha256 和 size；带有 mtime_ns 的项表示磁盘上的文件
+    与模板内容一致(本地未修改)。
+    """
+    _write_json_atomic(project_path / MANIFEST_REL_PATH, {
+        "version": 1,
+        "release": release,
+        "asset": asset,
+        "sha256": sha256,
+        "ai": ai_assistant,
+        "script": script_type,
+        "installed_at": datetime.now(timezone.utc).isoformat(),
+        "files": dict(sorted(files.items())),
+    })
+
+def read_template_lock(project_path: Path) -> Optional[dict]:
+    """读取项目的模板锁文件；不存在或无效时返回 None。"""
+    try:
+        with open(project_path / LOCK_REL_PATH, "r", encoding="utf-8") as f:
+            lock = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if not isinstance(lock, dict) or not lock.get("release"):
+        return None
+    return lock
+
+def write_template_lock(project_path: Path, meta: dict, *, ai_assistant: str, script_type: str, source: TemplateSource) -> None:
+    """写入 .specify/lock.json，记录解析出的版本、资源 URL 与摘要。
+
+    之后的 init(重新初始化)和 upgrade 在版本、AI 助手、脚本类型和来源都一致时直接使用
+    其中的资源 URL，不再请求版本元数据，并用 sha256 校验下载或缓存的归档。
+    """
+    _write_json_atomic(project_path / LOCK_REL_PATH, {
+        "version": 1,
+        "release": meta["release"],
+        "asset": meta["filename"],
+        "asset_url": meta["asset_url"],
+        "size": meta["size"],
+        "sha256": meta.get("sha256"),
+        "source": str(source),
+        "ai": ai_assistant,
+        "script": script_type,
+        "locked_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+def _installed_file_state(path: Path, entry: dict | None) -> str:
+    """判断已安装文件相对于清单记录的状态："missing"、"pristine"(未修改) 或 "modified"。
+
+    大小和 mtime 与清单一致时只需一次 stat；否则才计算哈希。
+    """
+    try:
+        st = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return "missing"
+    if entry is None or st.st_size != entry.get("size"):
+        return "modified"
+    if entry.get("mtime_ns") == st.st_mtime_ns:
+        return "pristine"
+    return "pristine" if _sha256_file(path) == entry.get("sha256") else "modified"
+
+def _three_way_merge(ours: Path, base: bytes, theirs: bytes, *, labels: Tuple[str, str, str]) -> Tuple[Optional[bytes], int]:
+    """使用 git merge-file 对本地文件(ours)、旧模板(base)和新模板(theirs)做三方合并。
+
+    Returns:
+        元组 (merged, conflicts)；git 不可用或合并出错时 merged 为 None
+    """
+    if not shutil.which("git"):
+        return None, -1
+    with tempfile.TemporaryDirectory(prefix="specify-merge-") as tmp:
+        base_path = Path(tmp) / "base"
+        theirs_path = Path(tmp) / "theirs"
+        base_path.write_bytes(base)
+        theirs_path.write_bytes(theirs)
+        cmd = ["git", "merge-file", "-p"]
+        for label in labels:
+            cmd += ["-L", label]
+        result = subprocess.run(cmd + [str(ours), str(base_path), str(theirs_path)], capture_output=True)
+    # 退出码为冲突块数量(最多 127)，负数(255)表示出错
+    if result.returncode < 0 or result.returncode > 127:
+        return None, -1
+    return result.stdout, result.returncode
+
+def upgrade_project_files(project_path: Path, manifest: dict, zip_ref: zipfile.ZipFile, *, release: str, load_base=None, dry_run: bool = False, verbose: bool = False) -> Tuple[list[dict], dict]:
+    """将新版本归档中的模板增量应用到已安装的项目。
+
+    模板哈希未变的文件直接跳过(不访问磁盘)；本地未修改的文件被替换；本地修改过的文件与
+    新模板三方合并，合并基准由 load_base(rel) 从旧版本归档中读取。无法合并时保留本地文件，
+    并将新模板写入 "<文件>.specify-new"。新版本中已删除的模板文件在本地未修改时一并删除。
+
+    Returns:
+        元组 (results, files)：results 为 {path, action[, conflicts]} 列表，files 为新清单的文件表
+    """
+    old_files = manifest["files"]
+    prefix = _archive_prefix(zip_ref.infolist())
+    new_files = _archive_file_hashes(zip_ref, prefix)
+    labels = ("本地修改", manifest.get("release") or "旧模板", release)
+    results = []
+
+    def write(target: Path, rel: str, data: bytes) -> None:
+        if dry_run:
+            return
+        is_new = not target.exists()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _write_bytes_atomic(target, data)
+        if is_new and os.name != "nt" and _needs_exec_bit(rel, zip_ref.getinfo(prefix + rel), data[:1024]):
+            os.chmod(target, _with_exec_bits(stat.S_IMODE(target.stat().st_mode)))
+
+    for rel, entry in new_files.items():
+        old = old_files.get(rel)
+        target = project_path / rel
+        if old and old.get("sha256") == entry["sha256"]:
+            # 模板未变化：沿用旧记录(包括本地是否修改的状态)，无需 stat
+            if "mtime_ns" in old:
+                entry["mtime_ns"] = old["mtime_ns"]
+            results.append({"path": rel, "action": "unchanged"})
+            continue
+        data = zip_ref.read(prefix + rel)
+        if rel in MERGE_JSON_PATHS:
+            if not dry_run:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                handle_vscode_settings(data, target, rel, verbose)
+            results.append({"path": rel, "action": "merge"})
+            continue
+        state = _installed_file_state(target, old)
+        if state == "missing" or state == "pristine":
+            write(target, rel, data)
+            if not dry_run:
+                _stamp_manifest_entry(target, entry)
+            results.append({"path": rel, "action": "create" if state == "missing" else "update"})
+            continue
+        base = load_base(rel) if (load_base and old) else None
+        merged, conflicts = (None, -1)
+        if base is not None:
+            merged, conflicts = _three_way_merge(target, base, data, labels=labels)
+        if merged is None:
+            write(project_path / f"{rel}.specify-new", rel, data)
+            results.append({"path": rel, "action": "kept-new"})
+        else:
+            if merged == data:
+                # 本地修改已包含在新模板中，合并结果与模板一致
+                write(target, rel, data)
+                if not dry_run:
+                    _stamp_manifest_entry(target, entry)
+            elif not dry_run:
+                _write_bytes_atomic(target, merged)
+            results.append({"path": rel, "action": "conflict" if conflicts else "merged", "conflicts": conflicts})
+
+    for rel, old in old_files.items():
+        if rel in new_files:
+            continue
+        target = project_path / rel
+        state = _installed_file_state(target, old)
+        if state == "pristine":
+            if not dry_run:
+                target.unlink()
+            results.append({"path": rel, "action": "remove"})
+        elif state == "modified":
+            results.append({"path": rel, "action": "kept"})
+    return results, new_files
+
+def _run_init_plan(project_path: Path, selected_ai: str, selected_script: str, *, plan_json: bool, skip_tls: bool, debug: bool, github_token: str | None, no_cache: bool, release_ttl: float | None, template_source: TemplateSource | None = None, release_tag: str | None = None, lock: dict | None = None) -> dict:
+    """读取模板归档的中央目录(优先使用缓存，未命中时用 Range 请求只获取所需部分)，输出 init 的文件操作计划。
+
+    不修改项目目录，也不把归档下载到缓存。返回该计划。
+    """
+    local_client = get_http_client(verify=not skip_tls)
+    zip_source, meta = download_template_from_github(
+        selected_ai,
+        None,
+        script_type=selected_script,
+        verbose=False,
+        show_progress=False,
+        client=local_client,
+        debug=debug,
+        github_token=github_token,
+        cache=None if no_cache else TemplateCache(),
+        release_ttl=0 if no_cache else release_ttl,
+        template_source=template_source,
+        release_tag=release_tag,
+        lock=lock,
+        central_directory_only=True,
+    )
+    try:
+        with zipfile.ZipFile(zip_source, 'r') as zip_ref:
+            plan = build_init_plan(zip_ref, project_path)
+    finally:
+        if not meta.get("cached"):
+            zip_source.close()
+    plan = {"release": meta["release"], "asset": meta["filename"], "sha256": meta.get("sha256"), **plan}
+
+    if plan_json:
+        sys.stdout.write(json.dumps(plan, ensure_ascii=False, indent=2) + "\n")
+        return plan
+
+    table = Table(title=f"计划: {project_path} [dim]({plan['release']})[/dim]", title_justify="left")
+    table.add_column("动作", style="cyan")
+    table.add_column("文件数", justify="right")
+    table.add_column("字节", justify="right")
+    for action, label in (("create", "新建"), ("overwrite", "覆盖"), ("merge", "JSON 合并")):
+        table.add_row(label, str(plan["summary"][action]["files"]), f"{plan['summary'][action]['bytes']:,}")
+    console.print(table)
+    for entry in plan["files"]:
+        if entry["action"] == "overwrite":
+            console.print(f"[yellow]覆盖[/yellow] {entry['path']} [bright_black]({entry['existing_bytes']:,} → {entry['bytes']:,} 字节)[/bright_black]")
+    for path, diff in plan["merges"].items():
+        if "error" in diff:
+            console.print(f"[red]合并[/red] {path} [bright_black](无法解析，将直接覆盖: {diff['error']})[/bright_black]")
+        elif diff.get("replaced"):
+            console.print(f"[yellow]合并[/yellow] {path} [bright_black](现有文件无效，将被替换)[/bright_black]")
+        else:
+            console.print(f"[green]合并[/green] {path} [bright_black](新增 {len(diff['added'])}，修改 {len(diff['changed'])}，未变 {len(diff['unchanged'])})[/bright_black]")
+            for key in diff["added"]:
+                console.print(f"  [green]+[/green] {key}")
+            for key in diff["changed"]:
+                console.print(f"  [yellow]~[/yellow] {key}")
+    console.print("\n[dim]--dry-run：未修改任何文件[/dim]")
+    return plan
+
+def _rename_noreplace(src: Path, dst: Path) -> None:
+    """重命名 src 为 dst；dst 已存在时以 FileExistsError 失败，即使它是空目录。
+
+    Linux 使用 renameat2(RENAME_NOREPLACE)，macOS 使用 renamex_np(RENAME_EXCL)，由内核原子地
+    检查目标。其他平台(或文件系统不支持该标志)退回 os.rename：Windows 上目标存在时同样失败，
+    POSIX 上只会替换空目录，非空目录仍以 ENOTEMPTY/EEXIST 失败。
+    """
+    if sys.platform.startswith("linux") or sys.platform == "darwin":
+        import ctypes
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            if sys.platform == "darwin":
+                result = libc.renamex_np(os.fsencode(src), os.fsencode(dst), 0x4)  # RENAME_EXCL
+            else:
+                result = libc.renameat2(-100, os.fsencode(src), -100, os.fsencode(dst), 1)  # AT_FDCWD, RENAME_NOREPLACE
+        except AttributeError:
+            result = None  # C 库没有该函数(如较旧的 glibc)
+        if result == 0:
+            return
+        if result is not None:
+            err = ctypes.get_errno()
+            if err not in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+                raise OSError(err, os.strerror(err), str(dst))
+    os.rename(src, dst)
+
+def publish_staging_dir(staging: Path, project_path: Path) -> None:
+    """将暂存目录原子地发布为项目目录(两者须位于同一文件系统)。
+
+    不预先检查目标：目标已存在时(例如并发运行的另一个 init 抢先发布，或期间创建了空目录)
+    由重命名本身失败并报错，不会覆盖。
+    """
+    try:
+        _rename_noreplace(staging, project_path)
+    except OSError as e:
+        if e.errno in (errno.EEXIST, errno.ENOTEMPTY):
+            raise RuntimeError(f"目录 '{project_path.name}' 已存在(可能由并发运行的 init 创建)") from e
+        raise
 
 @app.command()
 def init(
+    ctx: typer.Context,
     project_name: str = typer.Argument(None, help="新项目目录的名称（如果使用 --here 或 '.' 则可选）"),
     ai_assistant: str = typer.Option(None, "--ai", help="要使用的 AI 助手：claude, gemini, copilot, cursor-agent, qwen, opencode, codex, windsurf, kilocode, auggie, codebuddy, amp, shai, q, bob, 或 qoder "),
     script_type: str = typer.Option(None, "--script", help="要使用的脚本类型：sh 或 ps"),
@@ -954,6 +3872,17 @@ def init(
     skip_tls: bool = typer.Option(False, "--skip-tls", help="跳过 SSL/TLS 验证（不推荐）"),
     debug: bool = typer.Option(False, "--debug", help="显示网络和提取失败的详细诊断输出"),
     github_token: str = typer.Option(None, "--github-token", help="用于 API 请求的 GitHub token（或设置 GH_TOKEN 或 GITHUB_TOKEN 环境变量）"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="不读取也不写入本地模板缓存"),
+    materialize: str = typer.Option("copy", "--materialize", help="填充项目文件的方式：copy（从归档解压）、reflink（写时复制）或 hardlink（硬链接到缓存，最快；文件只读且与缓存及其他项目共享，仅用于不会编辑的项目）"),
+    download_connections: int = typer.Option(1, "--download-connections", min=1, max=16, help="下载模板时使用的并发连接数（服务器不支持 Range 时回退为单连接）"),
+    release_ttl: float = typer.Option(None, "--release-ttl", help="版本元数据缓存的有效期（秒），期间不请求 GitHub API（默认 300，或 SPECIFY_RELEASE_TTL）"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只列出将要新建、覆盖或合并的文件，不修改磁盘（缓存未命中时只通过 Range 请求读取归档的中央目录）"),
+    plan_json: bool = typer.Option(False, "--plan-json", help="以 JSON 格式将 --dry-run 的计划输出到标准输出（隐含 --dry-run）"),
+    json_output: bool = typer.Option(False, "--json", help="以 NDJSON 步骤事件输出进度和结果，不渲染横幅和进度树（需要 --ai；--here 时需要 --force）"),
+    trace: Path = typer.Option(None, "--trace", help="将各步骤和子进程的耗时写入 Chrome trace-event 格式的 JSON 文件（可用 Perfetto 打开）"),
+    template_source: str = typer.Option(None, "--template-source", help="模板来源：github（默认）、github:<owner>/<repo>、HTTP 镜像 URL，或本地镜像目录/file:// URL（或设置 SPECIFY_TEMPLATE_SOURCE）"),
+    template_version: str = typer.Option(None, "--template-version", help="使用指定版本（如 v0.0.90）的模板而不是最新版本，并写入 .specify/lock.json 锁定该版本"),
+    no_prefetch: bool = typer.Option(False, "--no-prefetch", help="交互式选择期间不在后台预取版本信息和模板"),
 ):
     """
     从最新模板初始化一个新的 Specify 项目。
@@ -978,21 +3907,39 @@ def init(
         specify init --here --ai codebuddy
         specify init --here
         specify init --here --force  # 当前目录非空时跳过确认
+        specify init my-project --no-cache  # 忽略本地模板缓存
+        specify init my-project --materialize reflink  # 从缓存目录树写时复制
+        specify init --here --force --ai claude --dry-run --plan-json  # 输出文件操作计划
+        specify init my-project --ai claude --json  # 供 CI 解析的 NDJSON 输出
+        specify init my-project --ai claude --trace init-trace.json  # 导出耗时跟踪
+        specify init my-project --ai claude --template-version v0.0.90  # 锁定模板版本
+        specify init my-project --no-prefetch  # 选择期间不在后台预取模板
     """
 
-    show_banner()
+    if plan_json:
+        dry_run = True
+    if plan_json or json_output:
+        _redirect_console_to_stderr()
+    else:
+        show_banner()
+
+    # --json 的每条退出路径都以一个 result 事件结束；没有显式输出结果就退出时(意外异常)补一个失败结果
+    events = JsonEventWriter("init") if json_output and not plan_json else None
+    if events is not None:
+        def report_unfinished() -> None:
+            if not events.finished:
+                events.emit("result", ok=False, error=f"失败原因: {metrics.failure_reason}" if metrics.failure_reason else "初始化未完成")
+        ctx.call_on_close(report_unfinished)
 
     if project_name == ".":
         here = True
         project_name = None  # 清除 project_name 以使用现有的验证逻辑
 
     if here and project_name:
-        console.print("[red]错误：[/red] 不能同时指定项目名称和 --here 标志")
-        raise typer.Exit(1)
+        _exit_with_error("不能同时指定项目名称和 --here 标志", events)
 
     if not here and not project_name:
-        console.print("[red]错误：[/red] 必须指定项目名称，使用 '.' 表示当前目录，或使用 --here 标志")
-        raise typer.Exit(1)
+        _exit_with_error("必须指定项目名称，使用 '.' 表示当前目录，或使用 --here 标志", events)
 
     if here:
         project_name = Path.cwd().name
@@ -1004,6 +3951,10 @@ def init(
             console.print("[yellow]模板文件将与现有内容合并，可能会覆盖现有文件[/yellow]")
             if force:
                 console.print("[cyan]已提供 --force：跳过确认并继续合并[/cyan]")
+            elif dry_run:
+                console.print("[cyan]已提供 --dry-run：不会修改任何文件[/cyan]")
+            elif json_output:
+                _exit_with_error("--json 模式下无法确认合并，请同时使用 --force", events, project=str(project_path))
             else:
                 response = typer.confirm("是否继续？")
                 if not response:
@@ -1021,6 +3972,9 @@ def init(
             )
             console.print()
             console.print(error_panel)
+            metrics.fail("project_exists")
+            if events is not None:
+                events.emit("result", ok=False, project=str(project_path), error=f"目录 '{project_name}' 已存在")
             raise typer.Exit(1)
 
     current_dir = Path.cwd()
@@ -1035,7 +3989,8 @@ def init(
     if not here:
         setup_lines.append(f"{'目标路径':<15} [dim]{project_path}[/dim]")
 
-    console.print(Panel("\n".join(setup_lines), border_style="cyan", padding=(1, 2)))
+    if not json_output:
+        console.print(Panel("\n".join(setup_lines), border_style="cyan", padding=(1, 2)))
 
     should_init_git = False
     if not no_git:
@@ -1043,19 +3998,50 @@ def init(
         if not should_init_git:
             console.print("[yellow]未找到 Git - 将跳过仓库初始化[/yellow]")
 
+    try:
+        origin = TemplateSource.parse(template_source)
+    except ValueError as e:
+        _exit_with_error(str(e), events, project=str(project_path))
+
+    # 重新初始化已锁定版本的项目时沿用锁文件，除非显式指定了其他版本
+    lock = read_template_lock(project_path)
+    if lock is not None and template_version and lock["release"] != template_version:
+        lock = None
+    pin = bool(template_version) or lock is not None
+
+    # 默认选项：锁文件记录的，其次是上次使用的
+    user_config = read_user_config()
+    default_ai = (lock or {}).get("ai") or user_config.get("last_ai")
+    if default_ai not in AGENT_CONFIG:
+        default_ai = "copilot"
+    default_script = (lock or {}).get("script") or user_config.get("last_script")
+    if default_script not in SCRIPT_TYPE_CHOICES:
+        default_script = "ps" if os.name == "nt" else "sh"
+
+    # 用户在选择器中停留期间，后台预取版本信息和最可能被选中的模板
+    prefetcher = None
+    interactive = not json_output and (not ai_assistant or (not script_type and sys.stdin.isatty()))
+    if interactive and not (no_prefetch or no_cache or dry_run) and origin.kind != "file":
+        prefetcher = TemplatePrefetcher(get_http_client(verify=not skip_tls), TemplateCache(), template_source=origin, release_tag=template_version, lock=lock, github_token=github_token, release_ttl=release_ttl, connections=download_connections)
+        ctx.call_on_close(prefetcher.close)
+        prefetcher.start(ai_assistant or default_ai, script_type or default_script)
+
     if ai_assistant:
         if ai_assistant not in AGENT_CONFIG:
-            console.print(f"[red]错误：[/red] 无效的 AI 助手 '{ai_assistant}'。请从以下选项中选择：{', '.join(AGENT_CONFIG.keys())}")
-            raise typer.Exit(1)
+            _exit_with_error(f"无效的 AI 助手 '{ai_assistant}'。请从以下选项中选择：{', '.join(AGENT_CONFIG.keys())}", events, project=str(project_path))
         selected_ai = ai_assistant
+    elif json_output:
+        _exit_with_error(f"--json 模式下必须使用 --ai 指定 AI 助手：{', '.join(AGENT_CONFIG.keys())}", events, project=str(project_path))
     else:
         # 创建用于选择的选项字典（智能体键：显示名称）
         ai_choices = {key: config["name"] for key, config in AGENT_CONFIG.items()}
         selected_ai = select_with_arrows(
             ai_choices,
             "选择你的 AI 助手：",
-            "copilot"
+            default_ai
         )
+        if prefetcher is not None:
+            prefetcher.retarget(selected_ai, script_type or default_script)
 
     if not ignore_agent_tools:
         agent_config = AGENT_CONFIG.get(selected_ai)
@@ -1073,25 +4059,54 @@ def init(
                 )
                 console.print()
                 console.print(error_panel)
+                metrics.fail("agent_tool_missing")
+                if events is not None:
+                    events.emit("result", ok=False, project=str(project_path), error=f"未找到 {selected_ai}（{agent_config['name']}），可使用 --ignore-agent-tools 跳过此检查")
                 raise typer.Exit(1)
 
+    if materialize not in MATERIALIZE_CHOICES:
+        _exit_with_error(f"无效的填充方式 '{materialize}'。请从以下选项中选择：{', '.join(MATERIALIZE_CHOICES.keys())}", events, project=str(project_path))
+    if materialize == "hardlink" and not dry_run:
+        console.print(
+            "[yellow]警告：[/yellow] --materialize hardlink 使项目文件与缓存目录树共享只读的 inode"
+            f"（{'、'.join(EDITABLE_TEMPLATE_PREFIXES)} 除外）。不要对它们执行 chmod u+w 后就地编辑，"
+            "否则会同时改动缓存和其他链接到它的项目；需要编辑的项目请使用默认的 copy 或 --materialize reflink"
+        )
+
     if script_type:
         if script_type not in SCRIPT_TYPE_CHOICES:
-            console.print(f"[red]错误：[/red] 无效的脚本类型 '{script_type}'。请从以下选项中选择：{', '.join(SCRIPT_TYPE_CHOICES.keys())}")
-            raise typer.Exit(1)
+            _exit_with_error(f"无效的脚本类型 '{script_type}'。请从以下选项中选择：{', '.join(SCRIPT_TYPE_CHOICES.keys())}", events, project=str(project_path))
         selected_script = script_type
     else:
-        default_script = "ps" if os.name == "nt" else "sh"
-
-        if sys.stdin.isatty():
+        if sys.stdin.isatty() and not json_output:
             selected_script = select_with_arrows(SCRIPT_TYPE_CHOICES, "选择脚本类型（或按回车）", default_script)
         else:
-            selected_script = default_script
+            selected_script = "ps" if os.name == "nt" else "sh"
+
+    if not json_output:
+        console.print(f"[cyan]选中的 AI 助手：[/cyan] {selected_ai}")
+        console.print(f"[cyan]选中的脚本类型：[/cyan] {selected_script}")
+    if not dry_run:
+        update_user_config(last_ai=selected_ai, last_script=selected_script)
 
-    console.print(f"[cyan]选中的 AI 助手：[/cyan] {selected_ai}")
-    console.print(f"[cyan]选中的脚本类型：[/cyan] {selected_script}")
+    if lock is not None and not json_output:
+        console.print(f"[cyan]使用锁定的模板版本：[/cyan] {lock['release']} [dim]({LOCK_REL_PATH})[/dim]")
+
+    if dry_run:
+        try:
+            plan = _run_init_plan(project_path, selected_ai, selected_script, plan_json=plan_json, skip_tls=skip_tls, debug=debug, github_token=github_token, no_cache=no_cache, release_ttl=release_ttl, template_source=origin, release_tag=template_version, lock=lock)
+        except Exception as e:
+            if events is not None:
+                events.emit("result", ok=False, project=str(project_path), error=_failure_message(e))
+            raise
+        if events is not None:
+            events.emit("result", ok=True, project=str(project_path), dry_run=True, release=plan["release"], summary=plan["summary"])
+        return
 
     tracker = StepTracker("初始化 Specify 项目")
+    tracker.subscribe(metrics.step)
+    if events is not None:
+        tracker.subscribe(events.step)
 
     sys._specify_tracker_active = True
 
@@ -1110,6 +4125,7 @@ def init(
         ("chmod", "确保脚本可执行"),
         ("cleanup", "清理"),
         ("git", "初始化 git 仓库"),
+        ("publish", "发布项目目录"),
         ("final", "完成")
     ]:
         tracker.add(key, label)
@@ -1117,23 +4133,46 @@ def init(
     # 在 Live 上下文外跟踪 git 错误消息，使其持久化
     git_error_message = None
 
-    with Live(tracker.render(), console=console, refresh_per_second=8, transient=True) as live:
-        tracker.attach_refresh(lambda: live.update(tracker.render()))
+    # 新项目先在同一父目录下唯一命名的暂存目录中构建，完成后用一次 os.rename 发布
+    if here:
+        build_path = project_path
+    else:
+        project_path.parent.mkdir(parents=True, exist_ok=True)
+        build_path = Path(tempfile.mkdtemp(prefix=f".{project_path.name}.", suffix=".specify-staging", dir=project_path.parent))
+        # mkdtemp 创建的目录权限为 0700，恢复为普通 mkdir 的默认权限
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(build_path, 0o777 & ~umask)
+
+    # 只有在终端中才需要实时刷新的进度树；重定向输出或 --json 时跳过 Live 渲染
+    if console.is_terminal and not json_output:
+        from rich.live import Live
+        # Live 的刷新线程按帧率调用 tracker.__rich__，步骤更新只标记脏位
+        live_display = Live(tracker, console=console, refresh_per_second=8, transient=True)
+    else:
+        live_display = contextlib.nullcontext()
+    with live_display:
         try:
-            verify = not skip_tls
-            local_ssl_context = ssl_context if verify else False
-            local_client = httpx.Client(verify=local_ssl_context)
+            local_client = get_http_client(verify=not skip_tls)
 
-            download_and_extract_template(project_path, selected_ai, selected_script, here, verbose=False, tracker=tracker, client=local_client, debug=debug, github_token=github_token)
+            if prefetcher is not None:
+                tracker.start("fetch", "等待后台预取")
+                prefetched = prefetcher.finish(selected_ai, selected_script, on_progress=lambda index, done, total: tracker.progress("fetch", done, total))
+                metrics.inc("specify_template_prefetch_total", result="hit" if prefetched else "miss")
 
-            ensure_executable_scripts(project_path, tracker=tracker)
+            template_cache = None if no_cache else TemplateCache()
+            if no_cache:
+                release_ttl = 0
+            download_and_extract_template(build_path, selected_ai, selected_script, here, verbose=False, tracker=tracker, client=local_client, debug=debug, github_token=github_token, cache=template_cache, release_ttl=release_ttl, connections=download_connections, materialize=materialize, template_source=origin, release_tag=template_version, lock=lock, pin=pin)
 
             if not no_git:
                 tracker.start("git")
-                if is_git_repo(project_path):
+                with tracker.span("git rev-parse"):
+                    existing_repo = is_git_repo(build_path)
+                if existing_repo:
                     tracker.complete("git", "检测到现有仓库")
                 elif should_init_git:
-                    success, error_msg = init_git_repo(project_path, quiet=True)
+                    success, error_msg = init_git_repo(build_path, quiet=True, tracker=tracker)
                     if success:
                         tracker.complete("git", "已初始化")
                     else:
@@ -1144,10 +4183,21 @@ def init(
             else:
                 tracker.skip("git", "--no-git 标志")
 
+            if here:
+                tracker.skip("publish", "--here 已逐文件原子写入")
+            else:
+                tracker.start("publish")
+                publish_staging_dir(build_path, project_path)
+                tracker.complete("publish", project_path.name)
+
             tracker.complete("final", "项目就绪")
         except Exception as e:
-            tracker.error("final", str(e))
-            console.print(Panel(f"初始化失败：{e}", title="失败", border_style="red"))
+            error = _failure_message(e)
+            tracker.error("final", error)
+            if events:
+                events.emit("result", ok=False, project=str(project_path), error=error)
+                raise typer.Exit(1)
+            console.print(Panel(f"初始化失败：{error}", title="失败", border_style="red"))
             if debug:
                 _env_pairs = [
                     ("Python", sys.version.split()[0]),
@@ -1157,14 +4207,35 @@ def init(
                 _label_width = max(len(k) for k, _ in _env_pairs)
                 env_lines = [f"{k.ljust(_label_width)} → [bright_black]{v}[/bright_black]" for k, v in _env_pairs]
                 console.print(Panel("\n".join(env_lines), title="调试环境", border_style="magenta"))
-            if not here and project_path.exists():
-                shutil.rmtree(project_path)
             raise typer.Exit(1)
         finally:
-            pass
+            # 回滚只需删除暂存目录；发布成功后它已不存在
+            if not here and build_path.exists():
+                shutil.rmtree(build_path, ignore_errors=True)
+            if trace:
+                try:
+                    trace.write_text(json.dumps(tracker.to_chrome_trace(), ensure_ascii=False) + "\n", encoding="utf-8")
+                except OSError as e:
+                    console.print(f"[yellow]无法写入跟踪文件 {trace}:[/yellow] {e}")
+
+    if events:
+        manifest = read_install_manifest(project_path) or {}
+        events.emit(
+            "result",
+            ok=True,
+            project=str(project_path),
+            ai=selected_ai,
+            script=selected_script,
+            release=manifest.get("release"),
+            git_error=git_error_message,
+            steps=[{k: step[k] for k in ("key", "status", "detail")} for step in tracker.steps],
+        )
+        return
 
-    console.print(tracker.render())
+    console.print(tracker.render(show_timings=True))
     console.print("\n[bold green]项目就绪。[/bold green]")
+    if trace:
+        console.print(f"[dim]耗时跟踪已写入 {trace}（可在 https://ui.perfetto.dev 中打开）[/dim]")
 
     # 如果初始化失败，显示 git 错误详情
     if git_error_message:
@@ -1240,16 +4311,229 @@ def init(
     console.print()
     console.print(enhancements_panel)
 
+UPGRADE_ACTION_LABELS = {
+    "unchanged": ("未变化", "bright_black"),
+    "create": ("新建", "green"),
+    "update": ("更新", "green"),
+    "merge": ("JSON 合并", "cyan"),
+    "merged": ("三方合并", "cyan"),
+    "conflict": ("合并冲突", "red"),
+    "kept-new": ("保留本地(新版本另存)", "yellow"),
+    "remove": ("删除", "yellow"),
+    "kept": ("保留本地(模板已删除)", "yellow"),
+}
+
 @app.command()
-def check():
+def upgrade(
+    project_dir: str = typer.Argument(".", help="要升级的项目目录（默认当前目录）"),
+    force: bool = typer.Option(False, "--force", help="即使已是最新版本也重新比对所有文件"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只显示将要执行的操作，不修改任何文件"),
+    skip_tls: bool = typer.Option(False, "--skip-tls", help="跳过 SSL/TLS 验证（不推荐）"),
+    debug: bool = typer.Option(False, "--debug", help="显示网络和合并失败的详细诊断输出"),
+    github_token: str = typer.Option(None, "--github-token", help="用于 API 请求的 GitHub 令牌（或设置 GH_TOKEN 或 GITHUB_TOKEN 环境变量）"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="不读取也不写入本地模板缓存"),
+    release_ttl: float = typer.Option(None, "--release-ttl", help="版本元数据缓存的有效期（秒）"),
+    template_source: str = typer.Option(None, "--template-source", help="模板来源：github（默认）、github:<owner>/<repo>、HTTP 镜像 URL，或本地镜像目录/file:// URL（或设置 SPECIFY_TEMPLATE_SOURCE）"),
+    template_version: str = typer.Option(None, "--template-version", help="升级到指定版本并更新 .specify/lock.json（latest 表示最新版本）"),
+):
+    """
+    将已初始化的项目升级到最新的模板版本。
+
+    根据 init 写入的 .specify/manifest.json，只处理模板内容发生变化的文件：
+    本地未修改的文件直接替换，本地修改过的文件与新模板三方合并（需要 git），
+    无法合并时保留本地文件并将新版本写入 <文件>.specify-new。
+
+    存在 .specify/lock.json 时项目保持在锁定的版本，使用 --template-version 切换版本。
+
+    示例：
+        specify upgrade
+        specify upgrade path/to/project --dry-run
+        specify upgrade --template-version v0.0.90
+    """
+    show_banner()
+
+    project_path = Path(project_dir).resolve()
+    manifest = read_install_manifest(project_path)
+    if manifest is None:
+        console.print(f"[red]错误：[/red]未找到安装清单 [cyan]{project_path / MANIFEST_REL_PATH}[/cyan]")
+        console.print("[yellow]该项目可能由旧版本的 specify 初始化。运行 [cyan]specify init --here --force[/cyan] 重新初始化以生成清单。[/yellow]")
+        raise typer.Exit(1)
+
+    ai_assistant = manifest.get("ai")
+    script_type = manifest.get("script")
+    if ai_assistant not in AGENT_CONFIG or script_type not in SCRIPT_TYPE_CHOICES:
+        console.print(f"[red]错误：[/red]安装清单中的 AI 助手或脚本类型无效：{ai_assistant!r} / {script_type!r}")
+        raise typer.Exit(1)
+
+    try:
+        origin = TemplateSource.parse(template_source)
+    except ValueError as e:
+        console.print(f"[red]错误：[/red] {e}")
+        raise typer.Exit(1)
+
+    client = get_http_client(verify=not skip_tls)
+    cache = None if no_cache else TemplateCache()
+    if no_cache:
+        release_ttl = 0
+
+    lock = read_template_lock(project_path)
+    pin = template_version is not None or lock is not None
+    target = template_version or (lock["release"] if lock is not None else None)
+    if target == "latest":
+        target = None
+
+    if target:
+        # 锁定或指定的版本不需要查询最新版本
+        latest = target
+    else:
+        try:
+            release_data, _ = fetch_release(client, origin, github_token=github_token, ttl=release_ttl, debug=debug)
+        except Exception as e:
+            console.print("[red]获取版本信息出错[/red]")
+            console.print(Panel(str(e), title="获取错误", border_style="red"))
+            raise CommandFailed(f"获取版本信息出错: {e}")
+        latest = release_data.get("tag_name")
+    locked_to_latest = lock is not None and lock["release"] == latest
+    if latest == manifest.get("release") and not force and (not pin or locked_to_latest):
+        if lock is not None and not template_version:
+            console.print(f"[green]已是锁定的版本[/green] {latest} [dim]({LOCK_REL_PATH}；使用 --template-version 切换版本)[/dim]")
+        else:
+            console.print(f"[green]已是最新版本[/green] {latest}")
+        return
+
+    console.print(f"[cyan]升级模板:[/cyan] {manifest.get('release')} → {latest}")
+    zip_source, meta = download_template_from_github(
+        ai_assistant,
+        None,
+        script_type=script_type,
+        verbose=False,
+        client=client,
+        debug=debug,
+        github_token=github_token,
+        cache=cache,
+        release_ttl=release_ttl,
+        template_source=origin,
+        release_tag=target,
+        lock=lock if locked_to_latest else None,
+    )
+
+    # 只有在需要三方合并时才获取旧版本归档
+    base_archive = {}
+    def load_base(rel: str) -> Optional[bytes]:
+        if "zip" not in base_archive:
+            base_archive["zip"] = None
+            try:
+                source, base_meta = download_template_from_github(
+                    ai_assistant,
+                    None,
+                    script_type=script_type,
+                    verbose=False,
+                    show_progress=False,
+                    client=client,
+                    debug=debug,
+                    github_token=github_token,
+                    cache=cache,
+                    release_tag=manifest.get("release"),
+                    template_source=origin,
+                    lock=lock if lock is not None and lock["release"] == manifest.get("release") else None,
+                )
+                base_archive["source"] = None if base_meta.get("cached") else source
+                base_archive["zip"] = zipfile.ZipFile(source, 'r')
+                base_archive["prefix"] = _archive_prefix(base_archive["zip"].infolist())
+            except (Exception, typer.Exit) as e:
+                if debug:
+                    console.print(f"[yellow]无法获取旧版本 {manifest.get('release')} 的模板，改为另存新版本:[/yellow] {e}")
+        if base_archive["zip"] is None:
+            return None
+        try:
+            return base_archive["zip"].read(base_archive["prefix"] + rel)
+        except KeyError:
+            return None
+
+    try:
+        with zipfile.ZipFile(zip_source, 'r') as zip_ref:
+            results, files = upgrade_project_files(project_path, manifest, zip_ref, release=meta["release"], load_base=load_base, dry_run=dry_run, verbose=debug)
+        if not dry_run:
+            write_install_manifest(project_path, files, release=meta["release"], asset=meta["filename"], ai_assistant=ai_assistant, script_type=script_type, sha256=meta.get("sha256"))
+            if pin:
+                write_template_lock(project_path, meta, ai_assistant=ai_assistant, script_type=script_type, source=origin)
+    except Exception as e:
+        console.print(Panel(f"升级失败：{e}", title="失败", border_style="red"))
+        raise typer.Exit(1)
+    finally:
+        if base_archive.get("zip") is not None:
+            base_archive["zip"].close()
+        if base_archive.get("source") is not None:
+            base_archive["source"].close()
+        if not meta.get("cached"):
+            zip_source.close()
+
+    totals = {}
+    for result in results:
+        totals[result["action"]] = totals.get(result["action"], 0) + 1
+    table = Table(title=f"升级 {project_path.name}: {manifest.get('release')} → {meta['release']}" + (" [dim](--dry-run)[/dim]" if dry_run else ""), title_justify="left")
+    table.add_column("动作", style="cyan")
+    table.add_column("文件数", justify="right")
+    for action, (label, _) in UPGRADE_ACTION_LABELS.items():
+        if totals.get(action):
+            table.add_row(label, str(totals[action]))
+    console.print(table)
+    for result in results:
+        if result["action"] == "unchanged":
+            continue
+        label, color = UPGRADE_ACTION_LABELS[result["action"]]
+        note = f" [bright_black]({result['conflicts']} 处冲突)[/bright_black]" if result["action"] == "conflict" else ""
+        if result["action"] == "kept-new":
+            note = f" [bright_black](新版本: {result['path']}.specify-new)[/bright_black]"
+        console.print(f"[{color}]{label}[/{color}] {result['path']}{note}")
+    if totals.get("conflict"):
+        console.print("\n[yellow]部分文件存在合并冲突，请搜索冲突标记 <<<<<<< 并手动解决。[/yellow]")
+
+@app.command()
+def check(
+    versions: bool = typer.Option(False, "--versions", help="并行运行各工具的 --version 并显示版本号"),
+    timeout: float = typer.Option(TOOL_VERSION_TIMEOUT, "--timeout", help="每个工具探测版本的超时时间（秒）"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="忽略缓存的版本探测结果"),
+    json_output: bool = typer.Option(False, "--json", help="以单个 JSON 文档输出检查结果，不渲染横幅和进度树"),
+):
     """检查所有必需工具是否已安装。"""
+    tool_names = ["git"] + [key for key, config in AGENT_CONFIG.items() if config["requires_cli"]] + ["code", "code-insiders"]
+    installed = {tool: path for tool in tool_names if (path := find_tool(tool))}
+    tool_versions = {}
+    if versions:
+        tool_versions = probe_tool_versions(installed, timeout=timeout, ttl=0 if no_cache else TOOL_CACHE_TTL)
+
+    if json_output:
+        labels = {"git": "Git 版本控制", "code": "Visual Studio Code", "code-insiders": "Visual Studio Code Insiders"}
+        tools = []
+        for key in ["git", *AGENT_CONFIG.keys(), "code", "code-insiders"]:
+            config = AGENT_CONFIG.get(key)
+            if config and not config["requires_cli"]:
+                tools.append({"key": key, "name": config["name"], "kind": "ide", "found": None, "path": None, "version": None})
+                continue
+            tools.append({
+                "key": key,
+                "name": config["name"] if config else labels[key],
+                "kind": "agent" if config else "tool",
+                "found": key in installed,
+                "path": installed.get(key),
+                "version": tool_versions.get(key),
+            })
+        _write_json_document({
+            "command": "check",
+            "git": "git" in installed,
+            "agents_found": [key for key, config in AGENT_CONFIG.items() if config["requires_cli"] and key in installed],
+            "tools": tools,
+        })
+        return
+
     show_banner()
     console.print("[bold]正在检查已安装的工具...[/bold]\n")
 
     tracker = StepTracker("检查可用工具")
 
     tracker.add("git", "Git 版本控制")
-    git_ok = check_tool("git", tracker=tracker)
+    git_ok = check_tool("git", tracker=tracker, version=tool_versions.get("git"))
 
     agent_results = {}
     for agent_key, agent_config in AGENT_CONFIG.items():
@@ -1259,7 +4543,7 @@ def check():
         tracker.add(agent_key, agent_name)
 
         if requires_cli:
-            agent_results[agent_key] = check_tool(agent_key, tracker=tracker)
+            agent_results[agent_key] = check_tool(agent_key, tracker=tracker, version=tool_versions.get(agent_key))
         else:
             # 基于 IDE 的智能体 - 跳过 CLI 检查并标记为可选
             tracker.skip(agent_key, "基于 IDE，无需 CLI 检查")
@@ -1267,10 +4551,10 @@ def check():
 
     # 检查 VS Code 变体（不在智能体配置中）
     tracker.add("code", "Visual Studio Code")
-    code_ok = check_tool("code", tracker=tracker)
+    code_ok = check_tool("code", tracker=tracker, version=tool_versions.get("code"))
 
     tracker.add("code-insiders", "Visual Studio Code Insiders")
-    code_insiders_ok = check_tool("code-insiders", tracker=tracker)
+    code_insiders_ok = check_tool("code-insiders", tracker=tracker, version=tool_versions.get("code-insiders"))
 
     console.print(tracker.render())
 
@@ -1283,12 +4567,15 @@ def check():
         console.print("[dim]提示：安装 AI 助手以获得最佳体验[/dim]")
 
 @app.command()
-def version():
+def version(
+    json_output: bool = typer.Option(False, "--json", help="以单个 JSON 文档输出版本信息"),
+):
     """显示版本和系统信息。"""
     import platform
     import importlib.metadata
 
-    show_banner()
+    if not json_output:
+        show_banner()
 
     # 从包元数据获取 CLI 版本
     cli_version = "unknown"
@@ -1309,35 +4596,42 @@ def version():
     # 获取最新模板发布版本
     repo_owner = "github"
     repo_name = "spec-kit"
-    api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/releases/latest"
 
     template_version = "unknown"
     release_date = "unknown"
 
+    # 只尝试一次且限时：网络不可用时直接显示 unknown，而不是按 init 的策略退避重试
+    configure_request_scheduler(min(get_request_scheduler().deadline, VERSION_RETRY_DEADLINE), max_attempts=1)
     try:
-        response = client.get(
-            api_url,
-            timeout=10,
-            follow_redirects=True,
-            headers=_github_auth_headers(),
-        )
-        if response.status_code == 200:
-            release_data = response.json()
-            template_version = release_data.get("tag_name", "unknown")
-            # 如果存在，去除 'v' 前缀
-            if template_version.startswith("v"):
-                template_version = template_version[1:]
-            release_date = release_data.get("published_at", "unknown")
-            if release_date != "unknown":
-                # 格式化日期
-                try:
-                    dt = datetime.fromisoformat(release_date.replace('Z', '+00:00'))
-                    release_date = dt.strftime("%Y-%m-%d")
-                except Exception:
-                    pass
+        release_data, _ = fetch_latest_release(get_http_client(), repo_owner, repo_name, timeout=VERSION_RETRY_DEADLINE)
+        template_version = release_data.get("tag_name", "unknown")
+        # 如果存在，去除 'v' 前缀
+        if template_version.startswith("v"):
+            template_version = template_version[1:]
+        release_date = release_data.get("published_at", "unknown")
+        if release_date != "unknown":
+            # 格式化日期
+            try:
+                dt = datetime.fromisoformat(release_date.replace('Z', '+00:00'))
+                release_date = dt.strftime("%Y-%m-%d")
+            except Exception:
+                pass
     except Exception:
         pass
 
+    if json_output:
+        _write_json_document({
+            "command": "version",
+            "cli_version": cli_version,
+            "template_version": template_version,
+            "release_date": release_date,
+            "python": platform.python_version(),
+            "platform": platform.system(),
+            "machine": platform.machine(),
+            "os_version": platform.version(),
+        })
+        return
+
     info_table = Table(show_header=False, box=None, padding=(0, 2))
     info_table.add_column("键", style="cyan", justify="right")
     info_table.add_column("值", style="white")
@@ -1361,6 +4655,206 @@ def version():
     console.print(panel)
     console.print()
 
+cache_app = typer.Typer(
+    name="cache",
+    help="管理本地模板缓存",
+    add_completion=False,
+)
+app.add_typer(cache_app, name="cache")
+
+@cache_app.command("list")
+def cache_list():
+    """列出缓存的模板归档（最近使用的在前）。"""
+    template_cache = TemplateCache()
+    entries = template_cache.entries()
+    if not entries:
+        console.print(f"[yellow]缓存为空[/yellow] [dim]({template_cache.root})[/dim]")
+        return
+
+    table = Table(title=f"模板缓存 [dim]{template_cache.root}[/dim]", title_justify="left")
+    table.add_column("版本", style="cyan")
+    table.add_column("资源")
+    table.add_column("大小", justify="right")
+    table.add_column("SHA-256", style="bright_black")
+    table.add_column("最近使用", style="bright_black")
+    for entry in entries:
+        last_used = datetime.fromtimestamp(entry.get("last_used", 0)).strftime("%Y-%m-%d %H:%M")
+        table.add_row(entry["release"], entry["filename"], _format_bytes(entry.get("size", 0)), entry["sha256"][:12], last_used)
+    console.print(table)
+    console.print(f"[dim]总计 {_format_bytes(template_cache.total_bytes())} / 上限 {_format_bytes(template_cache.max_bytes)}[/dim]")
+
+@cache_app.command("prune")
+def cache_prune(
+    max_size: int = typer.Option(None, "--max-size", help="保留的最大缓存大小（MB），默认使用缓存上限"),
+    clear: bool = typer.Option(False, "--all", help="删除所有缓存条目"),
+):
+    """按 LRU 顺序淘汰缓存条目，直到缓存不超过指定大小。"""
+    template_cache = TemplateCache()
+    limit = 0 if clear else (max_size * 1024 * 1024 if max_size is not None else None)
+    removed = template_cache.prune(limit)
+    for entry in removed:
+        console.print(f"[yellow]已删除:[/yellow] {entry['release']}/{entry['filename']}")
+    console.print(f"[green]已删除 {len(removed)} 个条目[/green]，剩余 {_format_bytes(template_cache.total_bytes())}")
+
+@cache_app.command("verify")
+def cache_verify(
+    remove_invalid: bool = typer.Option(False, "--remove", help="删除校验失败的条目"),
+):
+    """重新计算缓存归档的 SHA-256 并与索引比对，并校验(必要时重建)已解压的目录树。"""
+    template_cache = TemplateCache()
+    results = template_cache.verify(remove_invalid=remove_invalid)
+    failures = 0
+    for entry, ok, reason in results:
+        if ok:
+            console.print(f"[green]✓[/green] {entry['release']}/{entry['filename']}")
+        else:
+            failures += 1
+            console.print(f"[red]✗[/red] {entry['release']}/{entry['filename']} [bright_black]({reason})[/bright_black]")
+    tree_results = template_cache.verify_trees()
+    for sha256, bad in tree_results:
+        if bad:
+            failures += 1
+            shown = ", ".join(bad[:5]) + (f" 等 {len(bad)} 个文件" if len(bad) > 5 else "")
+            console.print(f"[red]✗[/red] 目录树 {sha256[:12]}… [bright_black](被修改: {shown}；已重建)[/bright_black]")
+        else:
+            console.print(f"[green]✓[/green] 目录树 {sha256[:12]}…")
+    results = results + tree_results
+    if failures:
+        console.print(f"[red]{failures} 个条目校验失败[/red]" + ("，已删除" if remove_invalid else "（使用 --remove 删除）"))
+        raise typer.Exit(1)
+    console.print(f"[green]已校验 {len(results)} 个条目[/green]")
+
+mirror_app = typer.Typer(
+    name="mirror",
+    help="管理模板镜像（供无法访问 GitHub 的环境使用）",
+    add_completion=False,
+)
+app.add_typer(mirror_app, name="mirror")
+
+def sync_template_mirror(client: httpx.Client | None, upstream: TemplateSource, directory: Path, *, tag: str | None = None, github_token: str | None = None, debug: bool = False, jobs: int = 4, on_asset=None) -> Tuple[dict, list[dict]]:
+    """把上游某个版本的全部资源同步到镜像目录(布局见 TemplateSource)。
+
+    大小一致且已记录摘要的资源不会重新下载；同步最新版本时同时更新 latest.json。
+    提供 on_asset 时，每处理完一个资源调用 on_asset(结果字典)。
+
+    Returns:
+        元组 (上游 release_data, 每个资源的结果列表)，结果包含 name、size、sha256、status(downloaded/present)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    release_data, _ = fetch_release(client, upstream, tag=tag, github_token=github_token, ttl=0, debug=debug)
+    tag_name = release_data.get("tag_name", "")
+    if not tag_name or _safe_relative_path(tag_name) != tag_name or "/" in tag_name:
+        raise RuntimeError(f"无效的版本标签: {tag_name!r}")
+    release_dir = directory / tag_name
+    release_dir.mkdir(parents=True, exist_ok=True)
+
+    known = {}
+    try:
+        with open(release_dir / "release.json", "r", encoding="utf-8") as f:
+            known = {a["name"]: a for a in json.load(f).get("assets", []) if "name" in a}
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError, TypeError):
+        pass
+    headers = _github_auth_headers(github_token) if upstream.is_github else {}
+
+    def sync_asset(asset: dict) -> dict:
+        name = asset["name"]
+        if _safe_relative_path(name) != name or "/" in name:
+            raise RuntimeError(f"无效的资源名: {name!r}")
+        target = release_dir / name
+        size = asset.get("size", 0)
+        digest = known.get(name, {}).get("digest", "")
+        if target.exists() and target.stat().st_size == size and digest.startswith("sha256:"):
+            result = {"name": name, "size": size, "sha256": digest[len("sha256:"):], "status": "present"}
+        else:
+            part_path = release_dir / f"{name}.part"
+            url = asset["browser_download_url"]
+            # 并发同步同一镜像时下载可能写入私有临时文件，之后只处理实际写入的路径
+            if url.startswith("file:"):
+                downloaded, sha256 = _read_local_asset(_file_url_path(url), part_path, expected_size=size)
+            else:
+                sha256, _, downloaded = _download_asset(client, url, part_path, expected_size=size, headers=headers, debug=debug)
+            try:
+                expected, _ = _asset_digest(asset)
+                if expected and sha256 != expected:
+                    raise RuntimeError(f"{name} 完整性校验失败：期望 {expected}，实际 {sha256}")
+                # 发布前按磁盘上的内容重新核对，镜像里的 sha256 记录必须描述实际发布的文件
+                actual = _sha256_file(downloaded)
+                if actual != sha256 or (size and downloaded.stat().st_size != size):
+                    raise RuntimeError(f"{name} 写入镜像前校验失败：下载时摘要为 {sha256}，文件摘要为 {actual}")
+                os.replace(downloaded, target)
+            except BaseException:
+                downloaded.unlink(missing_ok=True)
+                raise
+            result = {"name": name, "size": size, "sha256": sha256, "status": "downloaded"}
+        if on_asset is not None:
+            on_asset(result)
+        return result
+
+    assets = release_data.get("assets", [])
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = list(pool.map(sync_asset, assets))
+
+    digests = {r["name"]: r["sha256"] for r in results}
+    mirrored = dict(release_data)
+    mirrored["assets"] = [dict(a, browser_download_url=a["name"], digest=f"sha256:{digests[a['name']]}") for a in assets]
+    _write_json_atomic(release_dir / "release.json", mirrored)
+    if tag is None:
+        latest = dict(mirrored)
+        latest["assets"] = [dict(a, browser_download_url=f"{tag_name}/{a['name']}") for a in mirrored["assets"]]
+        _write_json_atomic(directory / "latest.json", latest)
+    return release_data, results
+
+@mirror_app.command("sync")
+def mirror_sync(
+    directory: Path = typer.Argument(..., help="镜像目录（可以是局域网共享）"),
+    tag: str = typer.Option(None, "--tag", help="要同步的版本标签（默认最新版本，同时更新 latest.json）"),
+    upstream: str = typer.Option(None, "--source", help="上游模板来源（写法同 init --template-source，默认 GitHub）"),
+    jobs: int = typer.Option(4, "--jobs", min=1, max=16, help="并发下载的资源数"),
+    skip_tls: bool = typer.Option(False, "--skip-tls", help="跳过 SSL/TLS 验证（不推荐）"),
+    debug: bool = typer.Option(False, "--debug", help="显示网络失败的详细诊断输出"),
+    github_token: str = typer.Option(None, "--github-token", help="用于 API 请求的 GitHub token（或设置 GH_TOKEN 或 GITHUB_TOKEN 环境变量）"),
+):
+    """
+    下载某个版本的全部模板资源到镜像目录，供其他主机通过 --template-source 使用。
+
+    示例：
+        specify mirror sync /srv/specify-mirror
+        specify mirror sync /srv/specify-mirror --tag v0.0.90
+        specify init my-project --ai claude --template-source /srv/specify-mirror
+    """
+    directory = directory.expanduser().resolve()
+    try:
+        source = TemplateSource.parse(upstream)
+    except ValueError as e:
+        console.print(f"[red]错误：[/red] {e}")
+        raise typer.Exit(1)
+    if source.kind == "file" and Path(source.location) == directory:
+        console.print("[red]错误：[/red] 上游来源不能是镜像目录本身")
+        raise typer.Exit(1)
+
+    def report(result: dict) -> None:
+        if result["status"] == "downloaded":
+            console.print(f"[green]已下载[/green] {result['name']} [bright_black]({_format_bytes(result['size'])})[/bright_black]")
+        elif debug:
+            console.print(f"[bright_black]已存在 {result['name']}[/bright_black]")
+
+    client = None if source.kind == "file" else get_http_client(verify=not skip_tls)
+    console.print(f"[cyan]同步模板镜像:[/cyan] {source} → {directory}")
+    try:
+        release_data, results = sync_template_mirror(client, source, directory, tag=tag, github_token=github_token, debug=debug, jobs=jobs, on_asset=report)
+    except Exception as e:
+        console.print("[red]同步镜像出错[/red]")
+        console.print(Panel(str(e), title="同步错误", border_style="red"))
+        raise typer.Exit(1)
+
+    downloaded = [r for r in results if r["status"] == "downloaded"]
+    console.print(
+        f"[green]版本 {release_data['tag_name']} 已同步[/green]：{len(results)} 个资源，"
+        f"新下载 {len(downloaded)} 个（{_format_bytes(sum(r['size'] for r in downloaded))}）"
+    )
+    console.print(f"[dim]其他主机可使用: specify init <项目> --template-source {directory}[/dim]")
+
 def main():
     app()
 